@@ -0,0 +1,218 @@
+"""
+Alert retention: the alerts table keeps the last RETENTION_DAYS days (counted
+back from the newest alert date), older days are exported to date-partitioned
+Parquet, <ALERT_ARCHIVE_DIR>/date=YYYY-MM-DD/alerts.parquet, and removed from
+the table. load_alert_history reads both, so history stays queryable while
+the latest-day queries and the alerts indexes stay the size of the hot window.
+
+- PostgreSQL: alerts is converted once into a table partitioned by date, one
+  partition per day (created PARTITION_DAYS_AHEAD days in advance, other
+  dates land in alerts_default). Archived days are dropped as partitions.
+  The conversion rewrites the whole table, so it is an explicit migration
+  step (python migrate_schema.py, or python alert_archive.py partition);
+  until it has run, archived days are deleted row by row.
+- SQLite: archived days are deleted and the file is VACUUMed once more than
+  COMPACT_FREE_RATIO of its pages are free.
+
+Usage: python alert_archive.py                             # archive and compact
+       python alert_archive.py history <start> [<end>]     # alert counts per day
+       python alert_archive.py partition                   # PostgreSQL: partition alerts by date
+"""
+import os
+import sys
+from datetime import date as date_type, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import text, func, select, delete, Integer, Float, Date
+from database import Session, Alert, engine, init_db
+
+RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "30"))
+ARCHIVE_DIR = os.getenv("ALERT_ARCHIVE_DIR", "alert_archive")
+PARTITION_DAYS_AHEAD = 7
+COMPACT_FREE_RATIO = 0.25
+
+COLUMNS = [c.name for c in Alert.__table__.columns]
+
+def archive_schema():
+    """Arrow schema of an archived day (the date is the partition key, not a column)."""
+    def arrow_type(column):
+        if isinstance(column.type, Integer): return pa.int64()
+        if isinstance(column.type, Float): return pa.float64()
+        if isinstance(column.type, Date): return pa.date32()
+        return pa.string()
+    return pa.schema([(c.name, arrow_type(c)) for c in Alert.__table__.columns if c.name != 'date'])
+
+def _day_path(root, day):
+    return os.path.join(root, f"date={day.isoformat()}", "alerts.parquet")
+
+def export_day(conn, day, root=ARCHIVE_DIR):
+    """Write one day of alerts to the archive. Re-archived tickers replace their archived rows."""
+    rows = pd.read_sql(select(Alert.__table__).where(Alert.date == day), conn)
+    rows = rows[[c for c in COLUMNS if c != 'date']]
+    path = _day_path(root, day)
+    if os.path.exists(path):
+        old = pq.read_table(path).to_pandas()
+        rows = pd.concat([old[~old['ticker'].isin(rows['ticker'])], rows], ignore_index=True)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(rows, schema=archive_schema(), preserve_index=False), tmp)
+    os.replace(tmp, path)
+    return len(rows)
+
+# --- PostgreSQL partitions ---
+
+def _partition_name(day):
+    return f"alerts_p{day:%Y%m%d}"
+
+def is_partitioned(conn):
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'alerts'")).scalar() == 'p'
+
+def day_partitions(conn):
+    """Names of the per-day partitions of alerts."""
+    return {name for (name,) in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'alerts' AND c.relname <> 'alerts_default'"
+    ))}
+
+def partition_alerts(conn):
+    """Convert alerts into a table partitioned by date (one-off, keeps every row)."""
+    for index in Alert.__table__.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text("ALTER TABLE alerts RENAME TO alerts_unpartitioned"))
+    conn.execute(text("ALTER INDEX IF EXISTS alerts_pkey RENAME TO alerts_unpartitioned_pkey"))
+    conn.execute(text("CREATE TABLE alerts (LIKE alerts_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (date)"))
+    # The partition key has to be part of the primary key
+    conn.execute(text("ALTER TABLE alerts ADD PRIMARY KEY (id, date)"))
+    conn.execute(text("ALTER SEQUENCE IF EXISTS alerts_id_seq OWNED BY alerts.id"))
+    conn.execute(text("CREATE TABLE alerts_default PARTITION OF alerts DEFAULT"))
+    conn.execute(text("INSERT INTO alerts SELECT * FROM alerts_unpartitioned"))
+    conn.execute(text("DROP TABLE alerts_unpartitioned"))
+    for index in Alert.__table__.indexes:
+        index.create(conn)
+    print("Partitioned alerts by date")
+
+def ensure_partitions(conn, start, days):
+    """Create the day partitions for [start, start + days), moving matching rows out of alerts_default."""
+    existing = day_partitions(conn)
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        name = _partition_name(day)
+        if name in existing: continue
+        conn.execute(text(f"CREATE TABLE {name} (LIKE alerts INCLUDING DEFAULTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM alerts_default WHERE date = :day RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), {"day": day})
+        conn.execute(text(
+            f"ALTER TABLE alerts ATTACH PARTITION {name} FOR VALUES FROM (:day) TO (:next)"
+        ), {"day": day, "next": day + timedelta(days=1)})
+
+# --- Retention ---
+
+def archive_alerts(days=RETENTION_DAYS, root=ARCHIVE_DIR, today=None):
+    """Export alert days older than the retention window and remove them from the table."""
+    days = max(days, 1) # Incremental scans carry the previous day forward
+    session = Session()
+    try:
+        newest = session.query(func.max(Alert.date)).scalar()
+    finally:
+        session.close()
+    if newest is None: return 0
+    cutoff = newest - timedelta(days=days - 1)
+
+    archived = 0
+    with engine.begin() as conn:
+        # Partitioning is a migration step, never run from this routine job
+        partitioned = engine.dialect.name == 'postgresql' and is_partitioned(conn)
+        if engine.dialect.name == 'postgresql' and not partitioned:
+            print("alerts is not partitioned yet, run: python migrate_schema.py")
+        old_days = [d for (d,) in conn.execute(
+            select(Alert.date).distinct().where(Alert.date < cutoff).order_by(Alert.date)
+        )]
+        partitions = day_partitions(conn) if partitioned else set()
+        for day in old_days:
+            # Written before the rows are removed: a failed run leaves them in both places
+            archived += export_day(conn, day, root)
+            name = _partition_name(day)
+            if name in partitions:
+                conn.execute(text(f"ALTER TABLE alerts DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+        conn.execute(delete(Alert.__table__).where(Alert.date < cutoff))
+        if partitioned:
+            ensure_partitions(conn, today or date_type.today(), PARTITION_DAYS_AHEAD)
+    print(f"Archived {len(old_days)} alert days ({archived} rows) before {cutoff} to {root}")
+    return archived
+
+def compact_alerts():
+    """Reclaim space left by archived days and refresh the planner statistics of alerts."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == 'sqlite':
+            pages = conn.execute(text("PRAGMA page_count")).scalar()
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+            # Free pages are reused by later inserts; only rewrite the file when they pile up
+            if pages and free / pages > COMPACT_FREE_RATIO:
+                conn.execute(text("VACUUM"))
+                print(f"Compacted the database ({free} of {pages} pages free)")
+        conn.execute(text("ANALYZE alerts"))
+
+def maintain_alerts(days=RETENTION_DAYS, root=ARCHIVE_DIR):
+    archived = archive_alerts(days, root)
+    compact_alerts()
+    return archived
+
+# --- History ---
+
+def load_alert_history(start, end=None, tickers=None, root=ARCHIVE_DIR):
+    """Alerts dated in [start, end] from the alerts table and the Parquet archive."""
+    end = end or date_type.today()
+    session = Session()
+    try:
+        query = session.query(Alert).filter(Alert.date >= start, Alert.date <= end)
+        if tickers is not None:
+            query = query.filter(Alert.ticker.in_(list(tickers)))
+        hot = pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+    frames = [hot]
+    if os.path.isdir(root):
+        partitioning = ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+        dataset = ds.dataset(root, format='parquet', schema=archive_schema().append(pa.field('date', pa.date32())), partitioning=partitioning)
+        condition = (ds.field('date') >= start) & (ds.field('date') <= end)
+        if tickers is not None:
+            condition &= ds.field('ticker').isin(list(tickers))
+        archived = dataset.to_table(filter=condition).to_pandas()
+        if not archived.empty:
+            # Days still in the table win over archived copies
+            hot_days = set(pd.to_datetime(hot['date']).dt.date)
+            frames.append(archived[~archived['date'].isin(hot_days)][COLUMNS])
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    history = pd.concat(frames, ignore_index=True)
+    history['date'] = pd.to_datetime(history['date']).dt.date
+    return history.sort_values(['date', 'ticker'], kind='stable', ignore_index=True)
+
+def ensure_partitioned():
+    """One-off PostgreSQL migration: partition alerts by date (no-op if done or on SQLite)."""
+    if engine.dialect.name != 'postgresql': return False
+    with engine.begin() as conn:
+        if is_partitioned(conn): return False
+        partition_alerts(conn)
+        ensure_partitions(conn, date_type.today(), PARTITION_DAYS_AHEAD)
+    return True
+
+if __name__ == "__main__":
+    init_db()
+    if len(sys.argv) > 1 and sys.argv[1] == "partition":
+        ensure_partitioned()
+    elif len(sys.argv) > 2 and sys.argv[1] == "history":
+        start = date_type.fromisoformat(sys.argv[2])
+        end = date_type.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else None
+        print(load_alert_history(start, end).groupby('date').size().to_string())
+    else:
+        maintain_alerts()
@@ -0,0 +1,95 @@
+"""
+Columnar alert batches.
+
+Scans return an AlertBatch instead of a list of per-alert dicts: one typed
+array per Alert field (float64 metrics, int8 flags, categoricals for the
+low-cardinality strings). Batches concatenate cheaply, pickle compactly
+between scan workers and convert straight into a DataFrame or chunked
+bulk-insert rows.
+"""
+import numpy as np
+import pandas as pd
+
+# Alert field -> storage dtype
+ALERT_FIELDS = {
+    "ticker": "category",
+    "type": "category",
+    "timeframe": "category",
+    "price": np.float64,
+    "desc": "category",
+    "pattern": "category",
+    "change_pct": np.float64,
+    "volume": np.float64,
+    "status": "category",
+    "ftfc": "category",
+    "tto": np.int8,
+    "candle_state": "category",
+    "industry": "category",
+    "adr": np.float64,
+    "gap": np.float64,
+    "change_from_open": np.float64,
+    "wtd": np.float64,
+    "mtd": np.float64,
+    "qtd": np.float64,
+    "ytd": np.float64,
+    "perf_3m": np.float64,
+    "avg_dollar_volume": np.float64,
+    "rs_1d": np.float64,
+    "rs_1w": np.float64,
+    "rs_1m": np.float64,
+    "rs_3m": np.float64,
+    "prev_cond_1": "category",
+    "prev_cond_2": "category",
+    "curr_cond": "category",
+}
+
+class AlertBatch:
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df):
+        columns = {}
+        for name, dtype in ALERT_FIELDS.items():
+            if dtype == "category":
+                columns[name] = pd.Categorical(df[name].to_numpy(dtype=object))
+            else:
+                columns[name] = df[name].to_numpy(dtype=dtype)
+        return cls(columns)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_frame(pd.DataFrame({name: [] for name in ALERT_FIELDS}))
+
+    @classmethod
+    def concat(cls, batches):
+        batches = [b for b in batches if len(b)]
+        if not batches: return cls.empty()
+        if len(batches) == 1: return batches[0]
+        return cls.from_frame(pd.concat([b.to_frame() for b in batches], ignore_index=True))
+
+    def __len__(self):
+        return len(self.columns["ticker"])
+
+    def __iter__(self):
+        # Per-alert dicts for callers that still expect them (slow path)
+        return iter(self.to_frame().to_dict('records'))
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns, copy=False)
+
+    def iter_rows(self, chunk_size=5000, **extra):
+        """Yield lists of insert-ready dicts, chunk_size at a time, with extra constant fields."""
+        # Values may be constants or arrays aligned with the batch (e.g. per-row dates)
+        columns = dict(self.columns)
+        for name, value in extra.items():
+            columns[name] = value if np.ndim(value) else np.full(len(self), value, dtype=object)
+        names = list(columns)
+        for start in range(0, len(self), chunk_size):
+            values = []
+            for name in names:
+                chunk = pd.Series(columns[name][start:start + chunk_size]).astype(object)
+                values.append(chunk.where(chunk.notna(), None).tolist())
+            yield [dict(zip(names, row)) for row in zip(*values)]
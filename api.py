@@ -1,12 +1,14 @@
 from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
-from database import Session, Alert, init_db
+from database import ReadSession, READ_POOL_SIZE, read_engine, Alert, LatestBar, init_db
 from sqlalchemy import or_
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import os
+import functools
+import anyio
 
 app = FastAPI()
 
@@ -72,7 +74,16 @@ def check_htf_in_force(session, ticker, current_tf):
         if htf is None:
             continue
         
-        # Check if this ticker has a green candle on this higher timeframe
+        # Latest bar of the higher timeframe from the latest_bars snapshot
+        bar = session.query(LatestBar.open, LatestBar.close).filter(
+            LatestBar.symbol == ticker, LatestBar.timeframe == htf
+        ).order_by(LatestBar.date.desc()).first()
+        if bar is not None:
+            if bar.open is not None and bar.close is not None and bar.close > bar.open:
+                return True
+            continue
+        
+        # Not in the snapshot: check if this ticker has a green candle on this higher timeframe
         # MUST filter by date to get the current status
         query = session.query(Alert).filter_by(
             ticker=ticker,
@@ -133,6 +144,24 @@ class TTLCache:
 # Global cache instance
 alert_cache = TTLCache(ttl_seconds=60)
 
+# Sessions and pandas post-processing block. On PostgreSQL handlers run them
+# in worker threads, at most one per pooled read connection, so the event
+# loop keeps serving while queries wait on the network. A local SQLite file
+# leaves nothing to wait on: the work is CPU-bound and threads only contend
+# for the GIL (see benchmark_api.py), so it runs inline unless
+# API_DB_THREADS is set.
+API_DB_THREADS = int(os.getenv("API_DB_THREADS", str(READ_POOL_SIZE if read_engine.dialect.name == 'postgresql' else 0)))
+_db_limiter = None
+
+async def run_db(func, *args):
+    """Run blocking data access in the bounded API threadpool (inline if API_DB_THREADS is 0)."""
+    global _db_limiter
+    if API_DB_THREADS <= 0:
+        return func(*args)
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(API_DB_THREADS)
+    return await anyio.to_thread.run_sync(functools.partial(func, *args), limiter=_db_limiter)
+
 @app.get("/api/alerts")
 @limiter.limit("60/minute")  # 60 requests per minute per IP
 async def get_alerts(
@@ -154,7 +183,11 @@ async def get_alerts(
     if cached_result:
         return cached_result
 
-    session = Session()
+    return await run_db(load_alerts, cache_key, universe, filters, setups, in_force, ftfc, timeframe)
+
+def load_alerts(cache_key, universe, filters, setups, in_force, ftfc, timeframe):
+    """Query and post-process /api/alerts (blocking, see run_db)."""
+    session = ReadSession()
     try:
         # Join Alert with ThemeTicker and Theme to get theme name
         # Note: A ticker might have multiple themes, we'll take the first one or aggregate
@@ -255,8 +288,12 @@ async def get_alerts(
             if '3-1-2 Bull' in setups: conditions.append(Alert.type.contains("3-1-2 Bullish"))
             if '3-1-2 Bear' in setups: conditions.append(Alert.type.contains("3-1-2 Bearish"))
             
+            if '2-2 Bull' in setups: conditions.append(Alert.type.contains("2-2 Bullish Continuation"))
+            if '2-2 Bear' in setups: conditions.append(Alert.type.contains("2-2 Bearish Continuation"))
+            
             # Catch-all
             if '2dG' in setups: conditions.append(Alert.type.contains("2d Green"))
+            if '2uR' in setups: conditions.append(Alert.type.contains("2u Red"))
             
             if conditions:
                 results_db = results_db.filter(or_(*conditions))
@@ -389,7 +426,10 @@ async def get_alerts(
             if '2-1-2 Bear' in setups: conditions.append(Alert.type.contains("2-1-2 Bearish"))
             if '3-1-2 Bull' in setups: conditions.append(Alert.type.contains("3-1-2 Bullish"))
             if '3-1-2 Bear' in setups: conditions.append(Alert.type.contains("3-1-2 Bearish"))
+            if '2-2 Bull' in setups: conditions.append(Alert.type.contains("2-2 Bullish Continuation"))
+            if '2-2 Bear' in setups: conditions.append(Alert.type.contains("2-2 Bearish Continuation"))
             if '2dG' in setups: conditions.append(Alert.type.contains("2d Green"))
+            if '2uR' in setups: conditions.append(Alert.type.contains("2u Red"))
             if conditions: query = query.filter(or_(*conditions))
 
         if in_force and 'None' not in in_force:
@@ -507,6 +547,7 @@ async def get_alerts(
             aggregated[key]["setups"].add(a.type)
             
         # 3. Pre-defined Filters (Liquid Leaders, etc.)
+        leader_metrics = None
         if filters:
             # Handle comma-separated
             filter_list = [f.strip() for f in filters.split(',')]
@@ -519,12 +560,22 @@ async def get_alerts(
                 # 3. AS 1M (MTD) > 93rd Percentile
                 # 4. AS 3M (3M Perf) > 87th Percentile
                 
+                # Dollar volume and 3M performance from ticker_metrics (one query),
+                # falling back to the values stored on the alert
+                from metrics import load_ticker_metrics
+                leader_metrics = load_ticker_metrics({a.ticker for a in raw_alerts}, session)
+                leader_metrics = leader_metrics[['avg_dollar_volume', 'perf_3m']].to_dict('index')
+                
+                def metric(alert, name):
+                    value = leader_metrics.get(alert.ticker, {}).get(name)
+                    return getattr(alert, name) if value is None or value != value else value
+                
                 # Step 1 & 2: Basic Filters
                 # These filters are applied to the raw_alerts before aggregation
                 # We need to re-filter raw_alerts based on these criteria
                 raw_alerts = [
                     alert for alert in raw_alerts 
-                    if alert.price > 20 and alert.avg_dollar_volume > 100000000
+                    if alert.price > 20 and (metric(alert, 'avg_dollar_volume') or 0) > 100000000
                 ]
                 
                 # Re-aggregate after initial filtering
@@ -581,7 +632,7 @@ async def get_alerts(
                 "rs_1d_val": a.rs_1d,
                 "rs_1w_val": a.rs_1w,
                 "mtd_val": a.mtd,
-                "perf_3m_val": a.perf_3m
+                "perf_3m_val": metric(a, 'perf_3m') if leader_metrics is not None else a.perf_3m
             })
             
         # Post-Processing Filters (Pandas-style)
@@ -644,6 +695,53 @@ async def get_alerts(
     finally:
         session.close()
 
+@app.get("/api/backtest")
+@limiter.limit("60/minute")
+async def get_backtest(
+    request: Request,
+    pattern: Optional[List[str]] = Query(None),
+    timeframe: Optional[List[str]] = Query(None),
+    horizon: Optional[List[int]] = Query(None),
+):
+    """Historical forward-return statistics per pattern (written by backtest.py)."""
+    cache_key = "backtest:" + str(sorted(request.query_params.items()))
+    cached_result = alert_cache.get(cache_key)
+    if cached_result:
+        return cached_result
+
+    return await run_db(load_backtest, cache_key, pattern, timeframe, horizon)
+
+def load_backtest(cache_key, pattern, timeframe, horizon):
+    session = ReadSession()
+    try:
+        from database import PatternStat
+        query = session.query(PatternStat)
+        if pattern:
+            query = query.filter(PatternStat.pattern.in_(pattern))
+        if timeframe:
+            query = query.filter(PatternStat.timeframe.in_(timeframe))
+        if horizon:
+            query = query.filter(PatternStat.horizon.in_(horizon))
+
+        results = [{
+            "pattern": s.pattern,
+            "timeframe": s.timeframe,
+            "horizon": s.horizon,
+            "occurrences": s.occurrences,
+            "avgReturn": round(s.avg_return, 2) if s.avg_return is not None else None,
+            "stdReturn": round(s.std_return, 2) if s.std_return is not None else None,
+            "hitRate": round(s.hit_rate, 1) if s.hit_rate is not None else None,
+            "computedAt": str(s.computed_at),
+        } for s in query.order_by(PatternStat.pattern, PatternStat.timeframe, PatternStat.horizon).all()]
+
+        alert_cache.set(cache_key, results)
+        return results
+
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        session.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from datetime import datetime
-from database import Session, Theme, ThemeTicker, Alert, init_db, OHLCV
+from database import Session, Theme, ThemeTicker, Alert, init_db
 from ingest import run_ingestion
-from engine import run_scan
+from populate_alerts import scan_tickers, save_alerts
 from universe import update_universe
 
 # Must be first
@@ -43,33 +42,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Helper Functions ---
-def save_alerts(alerts):
-    session = Session()
-    today = datetime.now().date()
-    try:
-        for a in alerts:
-            # Overwrite or add
-            exists = session.query(Alert).filter_by(
-                date=today, ticker=a['ticker'], type=a['type'], timeframe=a['timeframe']
-            ).first()
-            if not exists:
-                alert = Alert(
-                    date=today, ticker=a['ticker'], type=a['type'], timeframe=a['timeframe'],
-                    price=a['price'], desc=a['desc'], color=0, is_theme=0,
-                    pattern=a['pattern'], change_pct=a['change_pct'], volume=a['volume'],
-                    status=a['status'], candle_state=a['candle_state'], ftfc=a['ftfc'],
-                    industry=a.get('industry', ''), adr=a.get('adr', 0), gap=a.get('gap', 0),
-                    change_from_open=a.get('change_from_open', 0),
-                    wtd=a.get('wtd', 0), mtd=a.get('mtd', 0), qtd=a.get('qtd', 0), ytd=a.get('ytd', 0),
-                    prev_cond_1=a.get('prev_cond_1', ''), prev_cond_2=a.get('prev_cond_2', ''), curr_cond=a.get('curr_cond', '')
-                )
-                session.add(alert)
-        session.commit()
-    except Exception as e:
-        print(f"Error saving alerts: {e}")
-    finally:
-        session.close()
-
 def get_alerts(filters):
     session = Session()
     query = session.query(Alert).filter(Alert.is_theme == 0)
@@ -93,6 +65,8 @@ def get_alerts(filters):
         if '2-1-2 Bear' in filters['setups']: conditions.append(Alert.type.contains("2-1-2 Bearish"))
         if '3-1-2 Bull' in filters['setups']: conditions.append(Alert.type.contains("3-1-2 Bullish"))
         if '3-1-2 Bear' in filters['setups']: conditions.append(Alert.type.contains("3-1-2 Bearish"))
+        if '2-2 Bull' in filters['setups']: conditions.append(Alert.type.contains("2-2 Bullish Continuation"))
+        if '2-2 Bear' in filters['setups']: conditions.append(Alert.type.contains("2-2 Bearish Continuation"))
         
         if conditions:
             from sqlalchemy import or_
@@ -160,6 +134,7 @@ with st.container():
             'Rev Strat Bull', 'Rev Strat Bear', 
             '2-1-2 Bull', '2-1-2 Bear', 
             '3-1-2 Bull', '3-1-2 Bear',
+            '2-2 Bull', '2-2 Bear',
             'ALL'
         ]
         f_setups = st.multiselect("Setups", setup_options, default=['ALL'], label_visibility="collapsed")
@@ -186,12 +161,11 @@ with st.container():
             tickers = [r.ticker for r in session.query(ThemeTicker).distinct(ThemeTicker.ticker).all()]
             session.close()
             
-            all_alerts = []
             progress_bar = st.progress(0)
-            for i, ticker in enumerate(tickers):
-                alerts = run_scan(ticker)
-                all_alerts.extend(alerts)
-                progress_bar.progress((i + 1) / len(tickers))
+            # Same SCAN_WORKERS setting and single-process fallback as populate_alerts.py
+            all_alerts = scan_tickers(
+                tickers, progress=lambda done, total: progress_bar.progress(done / total)
+            )
             
             save_alerts(all_alerts)
             st.rerun()
@@ -0,0 +1,120 @@
+"""
+Vectorized pattern backtest.
+
+Finds every historical occurrence of each registered pattern (patterns.PATTERNS)
+in the OHLCV table and computes forward returns over HORIZONS bars, entering
+at the close of the signal bar. Statistics are accumulated per
+(pattern, timeframe, horizon) across ticker chunks and written to pattern_stats.
+
+Hit rate is the share of occurrences that moved in the pattern's bias
+direction (up for neutral patterns).
+"""
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from database import Session, Ticker, PatternStat, init_db
+from engine import load_ohlcv, history_bars
+from patterns import pattern_masks, pattern_name
+
+HORIZONS = [1, 3, 5, 10]
+
+def forward_returns(history, horizon):
+    """Close-to-close return % over `horizon` bars; NaN past the end of a series."""
+    close = history['close'].to_numpy(dtype=np.float64)
+    idx = np.arange(len(close))
+    valid = history['pos'].to_numpy() + horizon < history['series_len'].to_numpy()
+    future = close[np.minimum(idx + horizon, len(close) - 1)]
+    return np.where(valid, (future / close - 1) * 100, np.nan)
+
+def pattern_sums(history, horizons=HORIZONS):
+    """
+    Per (pattern, timeframe, horizon) sums for one chunk of history:
+    count, sum and sum of squares of returns, and hits.
+    """
+    returns = {h: forward_returns(history, h) for h in horizons}
+    timeframe = history['timeframe'].to_numpy()
+
+    frames = []
+    for _, spec, mask in pattern_masks(history):
+        if not mask.any(): continue
+        bias = spec.get("bias", 0)
+        for h in horizons:
+            r = returns[h][mask]
+            ok = ~np.isnan(r)
+            if not ok.any(): continue
+            r = r[ok]
+            hit = (r < 0) if bias < 0 else (r > 0)
+            frames.append(pd.DataFrame({
+                'pattern': pattern_name(spec),
+                'timeframe': timeframe[mask][ok],
+                'horizon': h,
+                'count': 1,
+                'sum': r,
+                'sumsq': r * r,
+                'hits': hit.astype(np.int64),
+            }))
+    if not frames:
+        return pd.DataFrame(columns=['pattern', 'timeframe', 'horizon', 'count', 'sum', 'sumsq', 'hits'])
+    occurrences = pd.concat(frames, ignore_index=True)
+    return occurrences.groupby(['pattern', 'timeframe', 'horizon'], as_index=False).sum()
+
+def run_backtest(tickers=None, chunk_size=500, horizons=HORIZONS):
+    """Backtest every pattern over the given tickers (all symbols in OHLCV if None)."""
+    if tickers is None:
+        session = Session()
+        tickers = [s for (s,) in session.query(Ticker.symbol)]
+        session.close()
+    tickers = sorted(tickers)
+
+    totals = []
+    for i in range(0, len(tickers), chunk_size):
+        chunk = tickers[i:i + chunk_size]
+        df = load_ohlcv(chunk)
+        if df.empty: continue
+        totals.append(pattern_sums(history_bars(df), horizons))
+        print(f"[{min(i + chunk_size, len(tickers))}/{len(tickers)}] Backtested {len(df)} bars")
+
+    if not totals:
+        return pd.DataFrame()
+    stats = pd.concat(totals, ignore_index=True).groupby(['pattern', 'timeframe', 'horizon'], as_index=False).sum()
+
+    n = stats['count']
+    stats['occurrences'] = n
+    stats['avg_return'] = stats['sum'] / n
+    variance = (stats['sumsq'] / n - stats['avg_return'] ** 2).clip(lower=0)
+    stats['std_return'] = np.sqrt(variance * n / (n - 1).where(n > 1))
+    stats['hit_rate'] = stats['hits'] / n * 100
+    return stats[['pattern', 'timeframe', 'horizon', 'occurrences', 'avg_return', 'std_return', 'hit_rate']]
+
+def save_stats(stats):
+    """Replace the pattern_stats table with a new backtest summary."""
+    session = Session()
+    today = datetime.now().date()
+    try:
+        session.query(PatternStat).delete()
+        if not stats.empty:
+            rows = stats.astype(object).where(stats.notna(), None).to_dict('records')
+            for row in rows:
+                row['computed_at'] = today
+            session.execute(insert(PatternStat), rows)
+        session.commit()
+        return len(stats)
+    except Exception as e:
+        print(f"Error saving pattern stats: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
+def main():
+    init_db()
+    start = time.time()
+    stats = run_backtest()
+    saved = save_stats(stats)
+    print(f"Backtest complete in {time.time() - start:.1f}s. Saved {saved} pattern stats.")
+
+if __name__ == "__main__":
+    main()
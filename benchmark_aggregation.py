@@ -0,0 +1,89 @@
+"""
+Benchmark N-day (2D/3D/5D) aggregation: the previous groupby().apply
+implementation against ingest.aggregate_trading_days (per ticker) and
+ingest.aggregate_trading_days_long (all tickers in one frame), checking
+that all three produce identical bars.
+
+Usage: python benchmark_aggregation.py [<symbols> [<local bars dir>]]
+    Synthetic 5-year daily bars unless a LocalProvider directory is given.
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from ingest import aggregate_trading_days, aggregate_trading_days_long
+
+N_DAYS = [2, 3, 5]
+
+def legacy_aggregate_trading_days(df, days):
+    # Previous implementation: per-year apply plus string group keys
+    df = df.sort_index()
+    df_reset = df.reset_index()
+    df_reset['year'] = df_reset['Date'].dt.year
+
+    def assign_groups(year_df):
+        year_df = year_df.sort_values('Date').copy()
+        year_df = year_df.reset_index(drop=True)
+        year_df['group_id'] = year_df.index // days
+        return year_df
+
+    df_grouped = df_reset.groupby('year', group_keys=False).apply(assign_groups)
+    df_grouped['unique_group'] = df_grouped['year'].astype(str) + '_' + df_grouped['group_id'].astype(str)
+    agg_dict = {'Date': 'last', 'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+    df_agg = df_grouped.groupby('unique_group').agg(agg_dict)
+    df_agg.set_index('Date', inplace=True)
+    return df_agg
+
+def synthetic_bars(symbols, years=5, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=252 * years, name='Date')
+    bars = {}
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(dates)))
+        bars[f"S{i:04d}"] = pd.DataFrame({
+            'Open': open_,
+            'High': np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, len(dates))),
+            'Low': np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, len(dates))),
+            'Close': close,
+            'Volume': rng.integers(1e5, 1e7, len(dates)).astype(float),
+        }, index=dates)
+    return bars
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<40} {time.perf_counter() - start:8.3f}s")
+    return result
+
+def main(symbols=200, local_dir=None):
+    if local_dir:
+        import os
+        from providers import LocalProvider
+        names = sorted(f.rsplit('.', 1)[0] for f in os.listdir(local_dir))[:symbols]
+        bars = LocalProvider(local_dir).fetch(names)
+    else:
+        bars = synthetic_bars(symbols)
+    rows = sum(len(df) for df in bars.values())
+    print(f"{len(bars)} symbols, {rows} daily bars, N = {N_DAYS}")
+
+    legacy = timed("legacy groupby().apply, per ticker", lambda: {
+        (s, n): legacy_aggregate_trading_days(df, n) for s, df in bars.items() for n in N_DAYS
+    })
+    vectorized = timed("aggregate_trading_days, per ticker", lambda: {
+        (s, n): aggregate_trading_days(df, n) for s, df in bars.items() for n in N_DAYS
+    })
+    long = pd.concat([df.assign(symbol=s) for s, df in bars.items()]).reset_index()
+    batched = timed("aggregate_trading_days_long, all tickers", lambda: {
+        n: aggregate_trading_days_long(long, n) for n in N_DAYS
+    })
+
+    for (symbol, n), expected in legacy.items():
+        expected = expected.sort_index()
+        pd.testing.assert_frame_equal(vectorized[(symbol, n)], expected)
+        from_long = batched[n][batched[n]['symbol'] == symbol].set_index('Date').drop(columns='symbol')
+        pd.testing.assert_frame_equal(from_long, expected, check_freq=False)
+    print("Outputs identical.")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, sys.argv[2] if len(sys.argv) > 2 else None)
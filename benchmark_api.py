@@ -0,0 +1,95 @@
+"""
+Benchmark /api/alerts under concurrent load: p50/p99 latency and throughput
+with CLIENTS concurrent clients against a uvicorn server, with handlers
+running their data access inline on the event loop (API_DB_THREADS=0,
+the SQLite default) and in the bounded threadpool (api.run_db, the
+PostgreSQL default). Rate limiting and the response cache are disabled in
+the server so every request hits the database.
+
+Usage: python benchmark_api.py [<clients> [<requests per client> [<db latency ms>]]]
+    A database latency adds that many milliseconds to every query, as a
+    remote database would.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import httpx
+
+CLIENTS = 50
+REQUESTS = 10
+PORT = 8765
+QUERIES = [
+    "/api/alerts",
+    "/api/alerts?timeframe=1D",
+    "/api/alerts?timeframe=1W&timeframe=1M",
+    "/api/alerts?ftfc=Bullish",
+    "/api/alerts?filters=LIQUID%20LEADERS",
+    "/api/backtest",
+]
+
+SERVER = """
+import sys, time, uvicorn, api, database
+from sqlalchemy import event
+latency = float(sys.argv[3]) / 1000
+if latency:
+    # Network round trip of a remote database: blocks without holding the GIL
+    event.listen(database.read_engine, "before_cursor_execute", lambda *args: time.sleep(latency))
+api.limiter.enabled = False
+api.alert_cache.ttl = 0 # Every lookup misses
+api.API_DB_THREADS = 0 if sys.argv[1] == "inline" else database.READ_POOL_SIZE
+uvicorn.run(api.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+"""
+
+async def _client(http, n, latencies, offset):
+    for i in range(n):
+        url = QUERIES[(offset + i) % len(QUERIES)]
+        start = time.perf_counter()
+        response = await http.get(url)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+async def _wait_ready(http, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await http.get("/api/backtest")
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline: raise
+            await asyncio.sleep(0.2)
+
+async def run(clients, requests):
+    latencies = []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=600) as http:
+        await _wait_ready(http)
+        await asyncio.gather(*[_client(http, 1, [], c) for c in range(len(QUERIES))]) # Warm up
+        start = time.perf_counter()
+        await asyncio.gather(*[_client(http, requests, latencies, c) for c in range(clients)])
+        elapsed = time.perf_counter() - start
+    return np.array(latencies), elapsed
+
+def main(clients=CLIENTS, requests=REQUESTS, latency_ms=0):
+    print(f"{clients} clients x {requests} requests, {latency_ms}ms database latency")
+    for mode in ("inline", "threadpool"):
+        server = subprocess.Popen(
+            [sys.executable, "-c", SERVER, mode, str(PORT), str(latency_ms)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            latencies, elapsed = asyncio.run(run(clients, requests))
+        finally:
+            server.terminate()
+            server.wait()
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{mode:<10} p50 {p50:8.1f}ms  p99 {p99:8.1f}ms  {len(latencies) / elapsed:7.1f} req/s")
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else CLIENTS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 0,
+    )
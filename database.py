@@ -1,22 +1,78 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, UniqueConstraint
+from sqlalchemy import create_engine, event, inspect, text, case, Column, Integer, SmallInteger, String, Text, Float, Date, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 import os
 
 Base = declarative_base()
 
+# Small-int timeframe codes stored in ohlcv.timeframe_id. Codes follow the
+# labels' sort order, so ORDER BY timeframe_id sorts like the labels did.
+TIMEFRAMES = sorted(['1D', '2D', '3D', '5D', '1W', '2W', '3W', '1M', '1Q', '1Y'])
+TIMEFRAME_IDS = {tf: i for i, tf in enumerate(TIMEFRAMES)}
+
+class Ticker(Base):
+    __tablename__ = 'tickers'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, unique=True, nullable=False)
+
 class OHLCV(Base):
     __tablename__ = 'ohlcv'
+    # (ticker_id, timeframe_id, date) is the clustered key: a ticker's series
+    # is one contiguous range, read in date order without a separate index
+    ticker_id = Column(Integer, ForeignKey('tickers.id'), primary_key=True)
+    timeframe_id = Column(SmallInteger, primary_key=True) # TIMEFRAME_IDS
+    date = Column(Date, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    candle = Column(SmallInteger) # Strat candle state code (see engine.CANDLE_STATES)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+# Timeframe label of an ohlcv row, for queries returning 'timeframe'
+OHLCV_TIMEFRAME = case({i: tf for tf, i in TIMEFRAME_IDS.items()}, value=OHLCV.timeframe_id)
+
+def ohlcv_query(session, *columns):
+    """session.query(*columns) over ohlcv joined to tickers, so Ticker.symbol can be selected and filtered."""
+    return session.query(*columns).select_from(OHLCV).join(Ticker, OHLCV.ticker_id == Ticker.id)
+
+_ticker_ids = {}
+
+def ticker_ids(symbols):
+    """
+    {symbol: tickers.id}, registering symbols seen for the first time in
+    their own transaction (call before opening a writing session).
+    """
+    symbols = set(symbols)
+    missing = symbols.difference(_ticker_ids)
+    if missing:
+        session = Session()
+        try:
+            new = missing.difference(s for (s,) in session.query(Ticker.symbol).filter(Ticker.symbol.in_(list(missing))))
+            if new:
+                bulk_upsert(session, Ticker, [{"symbol": s} for s in sorted(new)], keys=['symbol'], columns=['symbol'])
+                session.commit()
+            _ticker_ids.update(session.query(Ticker.symbol, Ticker.id).filter(Ticker.symbol.in_(list(missing))).all())
+        finally:
+            session.close()
+    return {s: _ticker_ids[s] for s in symbols}
+
+class IntradayOHLCV(Base):
+    __tablename__ = 'intraday_ohlcv'
     id = Column(Integer, primary_key=True)
-    symbol = Column(String, index=True)
-    date = Column(Date, index=True)
+    symbol = Column(String)
+    timeframe = Column(String) # 15m, 30m, 60m, 4H
+    timestamp = Column(DateTime, index=True) # Bar start, exchange local time
     open = Column(Float)
     high = Column(Float)
     low = Column(Float)
     close = Column(Float)
     volume = Column(Float)
-    timeframe = Column(String, index=True) # 1D, 2D, 1W, 1M, etc.
 
-    __table_args__ = (UniqueConstraint('symbol', 'date', 'timeframe', name='uix_symbol_date_tf'),)
+    __table_args__ = (UniqueConstraint('symbol', 'timeframe', 'timestamp', name='uix_intraday_symbol_tf_ts'),)
 
 class Theme(Base):
     __tablename__ = 'themes'
@@ -81,31 +137,255 @@ class Alert(Base):
     prev_cond_2 = Column(String) # 2 Candles Ago
     curr_cond = Column(String)   # Current Candle
 
+    # The API's latest-alerts filter: date == max_date AND is_theme == 0 AND timeframe IN (...)
+    __table_args__ = (Index('ix_alerts_date_theme_tf', 'date', 'is_theme', 'timeframe'),)
+
+class LatestBar(Base):
+    __tablename__ = 'latest_bars'
+    # Last few bars of each (symbol, timeframe), see snapshot.py
+    symbol = Column(String, primary_key=True)
+    timeframe = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    candle = Column(SmallInteger)
+
+class ScanWatermark(Base):
+    __tablename__ = 'scan_watermarks'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, index=True)
+    timeframe = Column(String)
+    last_date = Column(Date) # Latest bar date seen by the scanner
+    input_hash = Column(String) # Hash of the latest bar + bar count
+    scanned_at = Column(Date) # Alert date the scan was written under
+
+    __table_args__ = (UniqueConstraint('symbol', 'timeframe', name='uix_watermark_symbol_tf'),)
+
+class SymbolWatermark(Base):
+    __tablename__ = 'symbol_watermarks'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, unique=True, index=True)
+    last_date = Column(Date) # Latest stored 1D bar
+    fetched_at = Column(DateTime) # Last ingest of the symbol, exchange local time
+
+class PatternStat(Base):
+    __tablename__ = 'pattern_stats'
+    id = Column(Integer, primary_key=True)
+    pattern = Column(String, index=True) # Registry name, e.g. "2-1-2 Bullish"
+    timeframe = Column(String)
+    horizon = Column(Integer) # Forward bars
+    occurrences = Column(Integer)
+    avg_return = Column(Float) # Mean forward return %
+    std_return = Column(Float)
+    hit_rate = Column(Float) # % of occurrences that moved in the pattern's direction
+    computed_at = Column(Date)
+
+    __table_args__ = (UniqueConstraint('pattern', 'timeframe', 'horizon', name='uix_pattern_tf_horizon'),)
+
+class TickerMetric(Base):
+    __tablename__ = 'ticker_metrics'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, unique=True, index=True)
+    date = Column(Date) # Latest daily bar folded into the metrics
+    close = Column(Float)
+    adr = Column(Float) # 14-Day ADR %
+    avg_dollar_volume = Column(Float) # 20-Day Average Dollar Volume
+    perf_3m = Column(Float) # 63-Day (3-Month) Rolling Return %
+    state = Column(Text) # JSON rolling-window state (see metrics.RollingMetrics)
+
 # Create DB - Support both local SQLite and Turso
 # Database Connection Logic
 DATABASE_URL = os.getenv("DATABASE_URL")
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+# SQLite storage profile (single-node deployments), applied on every connection
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL") # Safe with WAL: only the last commits can be lost on power failure
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "1024"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64")) # Page cache per connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_READ_POOL = int(os.getenv("SQLITE_READ_POOL", "8")) # Read-only connections for the API
+
+# PostgreSQL profile
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "5"))
+PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "10"))
+
+def sqlite_profile(dbapi_connection, connection_record, readonly=False):
+    """connect event: storage pragmas for one SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    if not readonly:
+        # Persistent in the database file; readers never block the writer and vice versa
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}") # Negative: KiB
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    if readonly:
+        cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
+def sqlite_read_engine(url):
+    """Pooled read-only engine on the same SQLite file, for the API (mode=ro URI)."""
+    import sqlite3
+    path = os.path.abspath(url.database)
+    read_engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False),
+        poolclass=QueuePool,
+        pool_size=SQLITE_READ_POOL,
+        max_overflow=0,
+        echo=SQL_ECHO,
+    )
+    event.listen(read_engine, "connect", lambda conn, record: sqlite_profile(conn, record, readonly=True))
+    return read_engine
 
-if DATABASE_URL:
+if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
     # Production: Use PostgreSQL (Neon/Supabase/etc)
     # Fix for SQLAlchemy < 1.4 handling of postgres:// vs postgresql://
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
         
-    engine = create_engine(DATABASE_URL, echo=False)
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=PG_POOL_SIZE,
+        max_overflow=PG_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        echo=SQL_ECHO,
+    )
+    # PostgreSQL readers never block the writer: the API shares the pool
+    read_engine = engine
+    READ_POOL_SIZE = PG_POOL_SIZE + PG_MAX_OVERFLOW
     print("Using Production Database")
 else:
-    # Local development: Use SQLite
+    # Local development: Use SQLite (DATABASE_URL=sqlite:///path selects the file)
     engine = create_engine(
-        'sqlite:///stratiq.db',
+        DATABASE_URL or 'sqlite:///stratiq.db',
         connect_args={"check_same_thread": False},
-        echo=True
+        echo=SQL_ECHO
     )
+    event.listen(engine, "connect", sqlite_profile)
+    url = make_url(DATABASE_URL or 'sqlite:///stratiq.db')
+    # In-memory databases are private to their connection
+    read_engine = sqlite_read_engine(url) if url.database and url.database != ':memory:' else engine
+    READ_POOL_SIZE = SQLITE_READ_POOL
     print("Using local SQLite database")
 
 Session = sessionmaker(bind=engine)
+# Read-only sessions for request handlers (a separate pool on SQLite)
+ReadSession = sessionmaker(bind=read_engine)
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables, so columns added to a model
+    after its table exists are added here with ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+                    print(f"Added column {table.name}.{column.name}")
+
+def add_missing_indexes():
+    """Create indexes declared on models whose tables already existed (create_all skips them)."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                print(f"Added index {index.name}")
+
+def legacy_ohlcv():
+    """Whether ohlcv still has the symbol/timeframe string layout (see migrate_schema.py)."""
+    inspector = inspect(engine)
+    return inspector.has_table('ohlcv') and 'symbol' in {c['name'] for c in inspector.get_columns('ohlcv')}
 
 def init_db():
+    if legacy_ohlcv():
+        raise RuntimeError(
+            f"ohlcv in {engine.url.render_as_string(hide_password=True)} uses the old symbol/timeframe layout. "
+            "Stop the scheduled jobs and run once, with the same DATABASE_URL: python migrate_schema.py"
+        )
     Base.metadata.create_all(engine)
+    add_missing_columns()
+    add_missing_indexes()
+
+# Below this many rows a PostgreSQL upsert uses batched INSERTs instead of COPY
+COPY_MIN_ROWS = 1000
+
+def bulk_upsert(session, model, rows, keys, columns):
+    """
+    Insert rows (dicts) into model's table, overwriting `columns` where a row
+    with the same unique `keys` exists. SQLite: one executemany of
+    INSERT ... ON CONFLICT. PostgreSQL: COPY into a temporary staging table,
+    then one INSERT ... SELECT ... ON CONFLICT merge. Runs in the session's
+    transaction; the caller commits.
+    """
+    if not rows: return 0
+    table = model.__table__
+    dialect = session.bind.dialect.name
+    # One statement can't update a row twice (PostgreSQL): the last row per key wins
+    rows = list({tuple(row[k] for k in keys): row for row in rows}.values())
+
+    if dialect == 'postgresql' and len(rows) >= COPY_MIN_ROWS:
+        return _copy_upsert(session, table, rows, keys, columns)
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"bulk_upsert does not support {dialect}")
+
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: stmt.excluded[c] for c in columns},
+    )
+    session.execute(stmt, rows)
+    return len(rows)
+
+def _copy_upsert(session, table, rows, keys, columns):
+    import csv
+    import io
+    names = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Empty unquoted fields are NULL in COPY's CSV format
+        writer.writerow(['' if row[n] is None else row[n] for n in names])
+    buffer.seek(0)
+
+    staging = f"{table.name}_staging"
+    column_list = ", ".join(f'"{n}"' for n in names)
+    conn = session.connection()
+    conn.execute(text(f'DROP TABLE IF EXISTS pg_temp.{staging}'))
+    conn.execute(text(
+        f'CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table.name} WITH NO DATA'
+    ))
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns)
+    conn.execute(text(
+        f'INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM {staging} '
+        f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}'
+    ))
+    return len(rows)
 
 if __name__ == "__main__":
     init_db()
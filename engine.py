@@ -1,6 +1,19 @@
 import pandas as pd
 import numpy as np
-from database import Session, OHLCV
+from sqlalchemy import update
+from database import Session, OHLCV, Ticker, OHLCV_TIMEFRAME, ohlcv_query, ticker_ids
+from alert_batch import AlertBatch
+
+# Integer codes for Strat candle states, as stored in OHLCV.candle.
+# 0 means unknown (first bar of a series, or missing prices).
+CANDLE_STATES = ['?', '1', '2u', '2uR', '2d', '2dG', '3u', '3d']
+CANDLE_CODES = {state: code for code, state in enumerate(CANDLE_STATES)}
+
+# FTFC / TTO timeframe spectra (smallest to largest for TTO)
+FTFC_TFS = ['1M', '1W', '1D']
+TFS_ORDER = ['1D', '2D', '3D', '5D', '1W', '2W', '3W', '1M', '1Q', '1Y']
+TTO_BLOCK = 4 # Continuous timeframes per TTO block
+TTO_MIN_SAME = 3 # Bars of the block's color needed for TTO
 
 def get_strat_candle(curr, prev):
     h, l = curr['high'], curr['low']
@@ -26,6 +39,116 @@ def get_strat_candle(curr, prev):
         
     return '?'
 
+def classify_candles(high, low, open_, close):
+    """
+    Vectorized get_strat_candle over a full bar history (sorted by date).
+    Returns an int8 array of CANDLE_CODES, one per bar.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    open_ = np.asarray(open_, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    codes = np.zeros(len(high), dtype=np.int8)
+    if len(high) < 2:
+        return codes
+    codes[1:] = classify_pairs(high[1:], low[1:], open_[1:], close[1:], high[:-1], low[:-1])
+    return codes
+
+def classify_pairs(high, low, open_, close, prev_high, prev_low):
+    """get_strat_candle for arrays of bars against arrays of their prior bars' high/low."""
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    open_ = np.asarray(open_, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    ph = np.asarray(prev_high, dtype=np.float64)
+    pl = np.asarray(prev_low, dtype=np.float64)
+    green = close >= open_
+    valid = np.isfinite(h) & np.isfinite(l) & np.isfinite(ph) & np.isfinite(pl) & np.isfinite(close) & np.isfinite(open_)
+
+    broke_high = h > ph
+    broke_low = l < pl
+
+    return np.select(
+        [
+            ~valid,
+            ~broke_high & ~broke_low,  # Inside
+            broke_high & broke_low,    # Outside
+            broke_high,                # Up
+            broke_low,                 # Down
+        ],
+        [
+            CANDLE_CODES['?'],
+            CANDLE_CODES['1'],
+            np.where(green, CANDLE_CODES['3u'], CANDLE_CODES['3d']),
+            np.where(green, CANDLE_CODES['2u'], CANDLE_CODES['2uR']),
+            np.where(green, CANDLE_CODES['2dG'], CANDLE_CODES['2d']),
+        ],
+        default=CANDLE_CODES['?'],
+    ).astype(np.int8)
+
+def decode_candles(codes):
+    """Map candle codes back to their string states ('1', '2u', ...)."""
+    return np.asarray(CANDLE_STATES, dtype=object)[np.asarray(codes, dtype=np.int8)]
+
+def candle_states(df_tf):
+    """
+    Candle codes for one (symbol, timeframe) frame sorted by date.
+    Uses the stored 'candle' column when it is populated, otherwise classifies.
+    """
+    if 'candle' in df_tf.columns and len(df_tf) > 1:
+        stored = df_tf['candle'].iloc[1:]
+        if stored.notna().all():
+            codes = np.zeros(len(df_tf), dtype=np.int8)
+            codes[1:] = stored.to_numpy(dtype=np.int8)
+            return codes
+    return classify_candles(df_tf['high'], df_tf['low'], df_tf['open'], df_tf['close'])
+
+def update_candle_states(symbol=None):
+    """
+    Recompute OHLCV.candle for a symbol (or every symbol) and write back
+    only the rows whose state changed. Run after each save_ohlcv.
+    """
+    session = Session()
+    try:
+        query = session.query(
+            OHLCV.ticker_id, OHLCV.timeframe_id, OHLCV.date,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.candle
+        )
+        if symbol:
+            query = query.filter(OHLCV.ticker_id == ticker_ids([symbol])[symbol])
+        df = pd.read_sql(query.statement, session.bind)
+        if df.empty: return 0
+
+        df = df.sort_values(['ticker_id', 'timeframe_id', 'date'])
+        codes = np.empty(len(df), dtype=np.int8)
+        for _, idx in df.groupby(['ticker_id', 'timeframe_id'], sort=False).indices.items():
+            codes[idx] = classify_candles(
+                df['high'].values[idx], df['low'].values[idx], df['open'].values[idx], df['close'].values[idx]
+            )
+
+        # First bar of each series stays NULL (no prior bar to compare against)
+        new = pd.Series(codes, index=df.index).astype('Int64').where(codes != CANDLE_CODES['?'])
+        old = df['candle'].astype('Int64')
+        changed = ~((new == old).fillna(False) | (new.isna() & old.isna()))
+        if not changed.any(): return 0
+
+        # Bulk UPDATE by primary key (ticker_id, timeframe_id, date)
+        keys = df.loc[changed, ['ticker_id', 'timeframe_id', 'date']]
+        rows = [
+            {"ticker_id": int(t), "timeframe_id": int(tf), "date": d, "candle": None if pd.isna(c) else int(c)}
+            for t, tf, d, c in zip(keys['ticker_id'], keys['timeframe_id'], keys['date'], new[changed])
+        ]
+        session.execute(update(OHLCV), rows)
+        session.commit()
+        return len(rows)
+    except Exception as e:
+        print(f"Error updating candle states for {symbol or 'all symbols'}: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
 def is_green(row):
     return row['close'] > row['open']
 
@@ -58,328 +181,342 @@ def is_shooter(row):
     # Logic: Body in lower 1/3, Upper wick >= 2 * Body
     return (upper_wick >= 2 * body) and (lower_wick <= body)
 
-def calculate_ftfc(df_all):
-    # Full Timeframe Continuity
-    # Check direction of M, W, D
-    # Simple logic: Green = Bullish, Red = Bearish
-    
-    tfs = ['1M', '1W', '1D']
-    directions = []
-    
-    for tf in tfs:
-        df_tf = df_all[df_all['timeframe'] == tf]
-        if not df_tf.empty:
-            curr = df_tf.iloc[-1]
-            directions.append('Bull' if is_green(curr) else 'Bear')
-        else:
-            directions.append('?')
-            
-    if all(d == 'Bull' for d in directions): return "Bullish"
-    if all(d == 'Bear' for d in directions): return "Bearish"
-    return "Mixed"
-
-def calculate_tto(df_all):
-    """
-    Triangle Target Output (TTO) Logic:
-    Spectrum: 1D, 2D, 3D, 5D, 1W, 2W, 3W, 1M, 1Q, 1Y
-    Condition: In any 4 continuous timeframe blocks:
-    1. 3 out of 4 are same color.
-    2. First and Last of the block are same color.
-    """
-    tfs_order = ['1D', '2D', '3D', '5D', '1W', '2W', '3W', '1M', '1Q', '1Y']
-    
-    # Get latest color for each TF
-    # 1 = Green, -1 = Red, 0 = Unknown/Doji
-    colors = {}
-    for tf in tfs_order:
-        df_tf = df_all[df_all['timeframe'] == tf]
-        if not df_tf.empty:
-            curr = df_tf.iloc[-1]
-            if curr['close'] > curr['open']:
-                colors[tf] = 1 # Green
-            elif curr['close'] < curr['open']:
-                colors[tf] = -1 # Red
-            else:
-                colors[tf] = 0 # Doji
-        else:
-            colors[tf] = 0 # Missing data
-            
-    # Check blocks of 4
-    for i in range(len(tfs_order) - 3):
-        block_tfs = tfs_order[i:i+4]
-        block_vals = [colors[tf] for tf in block_tfs]
-        
-        # Skip if any missing data (0) in block? Or treat as neutral?
-        # User said "color", implying Green/Red. Let's ignore 0s for "same color" count.
-        if 0 in block_vals: continue
-        
-        first = block_vals[0]
-        last = block_vals[-1]
-        
-        # Condition 2: First and Last same color
-        if first != last: continue
-        
-        # Condition 1: 3 of same color
-        # Count occurrences of the 'first' color (since first==last, this covers the majority color)
-        count_same = block_vals.count(first)
-        
-        if count_same >= 3:
-            return 1 # TTO Met
-            
-    return 0
+def latest_per_timeframe(df_all):
+    """Latest bar of each timeframe from one ticker's date-sorted frame."""
+    latest = df_all.groupby('timeframe', sort=False).tail(1)
+    if 'symbol' not in latest.columns:
+        latest = latest.assign(symbol='')
+    return latest
 
-def run_scan(ticker, spy_data=None):
-    session = Session()
-    alerts = []
-    
-    try:
-        query = session.query(OHLCV).filter_by(symbol=ticker).order_by(OHLCV.date)
-        df_all = pd.read_sql(query.statement, session.bind)
-        
-        if df_all.empty: return []
+def calculate_ftfc(df_all):
+    # Full Timeframe Continuity of one ticker (see ftfc_from_colors)
+    return calculate_ftfc_universe(latest_per_timeframe(df_all)).iloc[0]
 
-        ftfc = calculate_ftfc(df_all)
-        tto = calculate_tto(df_all)
-        
-        # Calculate ADR (14-Day) - ALWAYS based on Daily Data
-        adr = 0
-        df_d = df_all[df_all['timeframe'] == '1D']
-        if len(df_d) >= 14:
-            daily_ranges = df_d['high'] - df_d['low']
-            # SMA of ranges over 14 days
-            adr_val = daily_ranges.rolling(14).mean().iloc[-1]
-            # ADR% = (ADR / Current Daily Close) * 100
-            curr_d_close = df_d.iloc[-1]['close']
-            if curr_d_close > 0:
-                adr = (adr_val / curr_d_close) * 100
-        
-        # Helper to get latest change % for a specific TF (Ticker)
-        def get_perf(target_tf, df_source):
-            rows = df_source[df_source['timeframe'] == target_tf]
-            if not rows.empty:
-                latest = rows.iloc[-1]
-                return ((latest['close'] - latest['open']) / latest['open']) * 100
-            return 0
-
-        # Helper to get latest change % for SPY
-        def get_spy_perf(target_tf):
-            if not spy_data or target_tf not in spy_data: return 0
-            df_spy = spy_data[target_tf]
-            if not df_spy.empty:
-                latest = df_spy.iloc[-1]
-                return ((latest['close'] - latest['open']) / latest['open']) * 100
-            return 0
-
-        # Process per timeframe
-        for tf in df_all['timeframe'].unique():
-            df_tf = df_all[df_all['timeframe'] == tf].copy()
-            # Ensure enough data for patterns (need 3 candles)
-            # For Yearly, we might only have 1 or 2 if history is short.
-            # If < 3, we can still check single candle patterns (Hammer/Shooter/Inside) 
-            # but combo patterns need history.
-            if len(df_tf) < 1: continue
-            
-            curr = df_tf.iloc[-1]
-            prev = df_tf.iloc[-2] if len(df_tf) >= 2 else None
-            prev2 = df_tf.iloc[-3] if len(df_tf) >= 3 else None
-            
-            strat = get_strat_candle(curr, prev) if prev is not None else '?'
-            strat_prev = get_strat_candle(prev, prev2) if prev is not None and prev2 is not None else '?'
-            strat_prev2 = get_strat_candle(prev2, df_tf.iloc[-4]) if prev2 is not None and len(df_tf) >= 4 else '?'
-            
-            # Common Data
-            change_pct = ((curr['close'] - curr['open']) / curr['open']) * 100
-            vol = curr['volume']
-            
-            gap = 0
-            if prev is not None:
-                gap = ((curr['open'] - prev['close']) / prev['close']) * 100
-                
-            change_from_open = ((curr['close'] - curr['open']) / curr['open']) * 100
-            
-            # Performance Metrics (WTD, MTD, QTD, YTD)
-            wtd = 0
-            mtd = 0
-            qtd = 0
-            ytd = 0
-            perf_3m = 0
-            
-            # RS Metrics
-            rs_1d = 0
-            rs_1w = 0
-            rs_1m = 0
-            rs_3m = 0
-            
-            try:
-                wtd = get_perf('1W', df_all)
-                mtd = get_perf('1M', df_all)
-                qtd = get_perf('1Q', df_all)
-                ytd = get_perf('1Y', df_all)
-                perf_3m = get_perf('3M', df_all)
-                
-                # Calculate RS (Excess Return vs SPY)
-                # RS = Ticker_Perf - SPY_Perf
-                # 1D
-                perf_1d = get_perf('1D', df_all)
-                spy_1d = get_spy_perf('1D')
-                rs_1d = perf_1d - spy_1d
-                
-                # 1W
-                spy_1w = get_spy_perf('1W')
-                rs_1w = wtd - spy_1w
-                
-                # 1M
-                spy_1m = get_spy_perf('1M')
-                rs_1m = mtd - spy_1m
-                
-                # 3M
-                spy_3m = get_spy_perf('3M')
-                rs_3m = perf_3m - spy_3m
-                
-            except Exception:
-                pass 
-            
-            # Calculate Avg Dollar Volume (20D)
-            avg_dollar_volume = 0
-            if tf == '1D':
-                # Use the daily dataframe subset we already have? 
-                # We need to access the main df_d (Daily Data)
-                # Let's just use the current df_tf if it is 1D, or fallback to df_d
-                target_df = df_tf if tf == '1D' else df_d
-                
-                if len(target_df) >= 20:
-                    last_20 = target_df.iloc[-20:]
-                    dollar_vols = last_20['close'] * last_20['volume']
-                    avg_dollar_volume = dollar_vols.mean()
-            else:
-                # For non-daily TFs, we still want the daily ADVol
-                if len(df_d) >= 20:
-                    last_20 = df_d.iloc[-20:]
-                    dollar_vols = last_20['close'] * last_20['volume']
-                    avg_dollar_volume = dollar_vols.mean() 
-            
-            # Detailed Strat History
-            curr_cond = strat
-            prev_cond_1 = strat_prev
-            prev_cond_2 = strat_prev2
-            
-            # Combo Order: Prev[2] -> Prev[1] -> Current
-            pattern_str = f"{strat_prev}-{strat}"
-            full_pattern = f"{strat_prev2}-{strat_prev}-{strat}"
-            
-            # --- STATUS: IN FORCE (Signal) ---
-            status = "In Force"
-            
-            # Helper to check structural type (ignoring color)
-            def is_2u(s): return s.startswith('2u')
-            def is_2d(s): return s.startswith('2d')
-            def is_3(s): return s.startswith('3')
-            def is_1(s): return s == '1'
-            
-            # 1. 2d Green (Generic)
-            if strat == '2dG':
-                 alerts.append(create_alert(ticker, f"2d Green {tf}", tf, curr, pattern_str, status, ftfc, strat, tto,
-                                   adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                   rs_1d, rs_1w, rs_1m, rs_3m,
-                                   prev_cond_1, prev_cond_2, curr_cond))
-
-            # 2-2 Reversals (In Force)
-            if is_2u(strat) and is_2d(strat_prev):
-                alerts.append(create_alert(ticker, "Rev Strat (2d-2u)", tf, curr, pattern_str, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-            if is_2d(strat) and is_2u(strat_prev):
-                alerts.append(create_alert(ticker, "Rev Strat (2u-2d)", tf, curr, pattern_str, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-                
-            # 2-1-2 Reversals (In Force)
-            if is_2u(strat) and is_1(strat_prev) and is_2d(strat_prev2):
-                alerts.append(create_alert(ticker, "2-1-2 Bullish", tf, curr, full_pattern, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-            if is_2d(strat) and is_1(strat_prev) and is_2u(strat_prev2):
-                alerts.append(create_alert(ticker, "2-1-2 Bearish", tf, curr, full_pattern, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-                
-            # 3-1-2 Reversals (In Force)
-            if is_2u(strat) and is_1(strat_prev) and is_3(strat_prev2):
-                alerts.append(create_alert(ticker, "3-1-2 Bullish", tf, curr, full_pattern, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-            if is_2d(strat) and is_1(strat_prev) and is_3(strat_prev2):
-                alerts.append(create_alert(ticker, "3-1-2 Bearish", tf, curr, full_pattern, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-
-            # --- STATUS: SETUP (Actionable Next) ---
-            status = "Setup"
-            
-            # Inside Bar (1)
-            if is_1(strat):
-                alerts.append(create_alert(ticker, "Inside Bar", tf, curr, strat, status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-                
-            # Hammer / Shooter (Shape)
-            if is_hammer(curr):
-                alerts.append(create_alert(ticker, "Hammer", tf, curr, "Hammer", status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
-            if is_shooter(curr):
-                alerts.append(create_alert(ticker, "Shooter", tf, curr, "Shooter", status, ftfc, strat, tto,
-                                           adr, gap, change_from_open, wtd, mtd, qtd, ytd, perf_3m, avg_dollar_volume, 
-                                           rs_1d, rs_1w, rs_1m, rs_3m,
-                                           prev_cond_1, prev_cond_2, curr_cond))
+def calculate_tto(df_all, timeframes=None, block=None, min_same=None):
+    # Triangle Target Output of one ticker (see tto_from_colors)
+    return int(calculate_tto_universe(latest_per_timeframe(df_all), timeframes, block, min_same).iloc[0])
 
+def run_scan(ticker, spy_data=None, intraday=False):
+    """Scan a single ticker. Same alerts as run_scan_universe for that ticker."""
+    try:
+        return run_scan_universe([ticker], spy_data, intraday=intraday)
     except Exception as e:
         print(f"Error scanning {ticker}: {e}")
+        return AlertBatch.empty()
+
+# --- Universe-wide batch scan ---
+# The functions below work on one long frame holding every ticker's bars,
+# sorted by (symbol, timeframe, date), instead of one frame per ticker.
+
+def load_ohlcv(tickers=None):
+    """Bulk read OHLCV for many tickers (all if None), sorted by symbol, timeframe, date."""
+    from timeframes import DERIVE_TIMEFRAMES, load_ohlcv_derived
+    from parquet_store import get_store
+    if DERIVE_TIMEFRAMES:
+        return load_ohlcv_derived(tickers)
+    store = get_store()
+    if store:
+        return store.load(tickers)
+    session = Session()
+    try:
+        query = ohlcv_query(
+            session, Ticker.symbol, OHLCV_TIMEFRAME.label('timeframe'), OHLCV.date,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume, OHLCV.candle
+        )
+        if tickers is not None:
+            query = query.filter(Ticker.symbol.in_(list(tickers)))
+        query = query.order_by(Ticker.symbol, OHLCV.timeframe_id, OHLCV.date)
+        return pd.read_sql(query.statement, session.bind)
     finally:
         session.close()
-        
+
+def group_bounds(df):
+    """
+    First row, last row and size of each (symbol, timeframe) run in a frame
+    sorted by symbol, timeframe, date.
+    """
+    n = len(df)
+    if n == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    sym = df['symbol'].to_numpy()
+    tf = df['timeframe'].to_numpy()
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = (sym[1:] != sym[:-1]) | (tf[1:] != tf[:-1])
+    start = np.flatnonzero(new_group)
+    last = np.r_[start[1:] - 1, n - 1]
+    return start, last, last - start + 1
+
+def universe_candle_codes(df, start=None):
+    """Candle codes for every row of a long multi-ticker frame."""
+    if start is None:
+        start, _, _ = group_bounds(df)
+    codes = classify_candles(df['high'], df['low'], df['open'], df['close'])
+    if 'candle' in df.columns:
+        stored = pd.to_numeric(df['candle'], errors='coerce').to_numpy(dtype=np.float64)
+        has = ~np.isnan(stored)
+        codes[has] = stored[has].astype(np.int8)
+    # The first bar of each series has no prior bar
+    codes[start] = CANDLE_CODES['?']
+    return codes
+
+def latest_bars(df):
+    """
+    One row per (symbol, timeframe) holding the latest bar plus the candle
+    codes of the last three bars and the previous close.
+    """
+    start, last, size = group_bounds(df)
+    codes = universe_candle_codes(df, start)
+    close = df['close'].to_numpy(dtype=np.float64)
+
+    prev1 = np.maximum(last - 1, 0)
+    prev2 = np.maximum(last - 2, 0)
+
+    latest = df.iloc[last].reset_index(drop=True)
+    latest['state'] = codes[last]
+    latest['state_prev'] = np.where(size >= 2, codes[prev1], CANDLE_CODES['?']).astype(np.int8)
+    latest['state_prev2'] = np.where(size >= 3, codes[prev2], CANDLE_CODES['?']).astype(np.int8)
+    latest['prev_close'] = np.where(size >= 2, close[prev1], np.nan)
+    latest['change_pct'] = ((latest['close'] - latest['open']) / latest['open']) * 100
+    return latest
+
+def history_bars(df):
+    """
+    Every bar of a long multi-ticker frame with the candle codes of itself
+    and its two prior bars, its position in its series ('pos') and the
+    series length ('series_len'). Used for backtests and as-of scans.
+    """
+    start, last, size = group_bounds(df)
+    codes = universe_candle_codes(df, start)
+    pos = np.arange(len(df)) - np.repeat(start, size)
+
+    history = df.reset_index(drop=True)
+    history['state'] = codes
+    history['state_prev'] = np.where(pos >= 1, np.roll(codes, 1), CANDLE_CODES['?']).astype(np.int8)
+    history['state_prev2'] = np.where(pos >= 2, np.roll(codes, 2), CANDLE_CODES['?']).astype(np.int8)
+    history['pos'] = pos
+    history['series_len'] = np.repeat(size, size)
+    return history
+
+def daily_metrics(df):
+    """14-day ADR %, 20-day average dollar volume and 63-day return % per symbol, from 1D bars."""
+    df_d = df[df['timeframe'] == '1D']
+    by_symbol = df_d.groupby('symbol', sort=False)
+    last_close = by_symbol['close'].last()
+
+    last_14 = by_symbol.tail(14)
+    ranges = (last_14['high'] - last_14['low']).groupby(last_14['symbol']).agg(['mean', 'count'])
+    ranges = ranges.reindex(last_close.index)
+    adr = (ranges['mean'] / last_close) * 100
+    adr = adr.where((ranges['count'] >= 14) & (last_close > 0), 0)
+
+    last_20 = by_symbol.tail(20)
+    dollar_vols = (last_20['close'] * last_20['volume']).groupby(last_20['symbol']).agg(['mean', 'count'])
+    dollar_vols = dollar_vols.reindex(last_close.index)
+    avg_dollar_volume = dollar_vols['mean'].where(dollar_vols['count'] >= 20, 0)
+
+    last_63 = by_symbol.tail(63)
+    base = last_63.groupby('symbol', sort=False)['close'].agg(['first', 'count']).reindex(last_close.index)
+    perf_3m = ((last_close / base['first']) - 1) * 100
+    perf_3m = perf_3m.where(base['count'] >= 63)
+
+    return pd.DataFrame({'adr': adr, 'avg_dollar_volume': avg_dollar_volume, 'perf_3m': perf_3m})
+
+def current_daily_metrics(df):
+    """
+    daily_metrics, read from the ticker_metrics table for symbols whose stored
+    values are as of their latest 1D bar in df and recomputed for the rest.
+    """
+    from metrics import load_ticker_metrics
+    df_d = df[df['timeframe'] == '1D']
+    last_date = pd.to_datetime(df_d.groupby('symbol', sort=False)['date'].last()).dt.date
+
+    stored = load_ticker_metrics(last_date.index)
+    stored = stored[stored['date'] == last_date.reindex(stored.index)]
+    stored = stored[['adr', 'avg_dollar_volume', 'perf_3m']]
+    stale = last_date.index.difference(stored.index)
+    if stale.empty: return stored
+    computed = daily_metrics(df_d[df_d['symbol'].isin(stale)])
+    return computed if stored.empty else pd.concat([stored, computed])
+
+def color_matrix(latest, timeframes, key='symbol'):
+    """
+    int8 tickers x timeframes matrix of latest-bar colors (1 green, -1 red,
+    0 doji or missing) from a latest_bars frame, and a bool matrix marking
+    the cells that have a bar. Rows are the distinct values of the `key`
+    column. Returns (symbols, colors, present).
+    """
+    symbols = pd.Index(latest[key].unique())
+    rows = symbols.get_indexer(latest[key])
+    cols = pd.Index(timeframes).get_indexer(latest['timeframe'])
+    keep = cols >= 0
+
+    color = np.nan_to_num(np.sign(latest['close'].to_numpy(dtype=np.float64) - latest['open'].to_numpy(dtype=np.float64)))
+    colors = np.zeros((len(symbols), len(timeframes)), dtype=np.int8)
+    present = np.zeros((len(symbols), len(timeframes)), dtype=bool)
+    colors[rows[keep], cols[keep]] = color[keep]
+    present[rows[keep], cols[keep]] = True
+    return symbols, colors, present
+
+def ftfc_from_colors(colors, present):
+    """
+    Full Timeframe Continuity per row of a color matrix:
+    "Bullish" if every timeframe is green, "Bearish" if every timeframe has
+    a bar and none is green (doji counts as bearish), else "Mixed".
+    """
+    ftfc = np.full(len(colors), "Mixed", dtype=object)
+    ftfc[(colors == 1).all(axis=1)] = "Bullish"
+    ftfc[(present & (colors != 1)).all(axis=1)] = "Bearish"
+    return ftfc
+
+def tto_from_colors(colors, block=None, min_same=None):
+    """
+    Triangle Target Output per row of a color matrix. TTO is met when any
+    `block` continuous timeframes:
+    1. have no doji/missing bar,
+    2. start and end with the same color,
+    3. have at least `min_same` bars of that color.
+    Window counts come from cumulative sums, so block size is free to vary.
+    """
+    block = block or TTO_BLOCK
+    min_same = min_same or TTO_MIN_SAME
+    n_tfs = colors.shape[1]
+    if n_tfs < block:
+        return np.zeros(len(colors), dtype=np.int8)
+
+    def window_sum(flags):
+        totals = np.zeros((len(flags), n_tfs + 1), dtype=np.int16)
+        np.cumsum(flags, axis=1, out=totals[:, 1:])
+        return totals[:, block:] - totals[:, :-block]
+
+    green = window_sum(colors == 1)
+    red = window_sum(colors == -1)
+    neutral = window_sum(colors == 0)
+    first = colors[:, :n_tfs - block + 1]
+    last = colors[:, block - 1:]
+
+    same = np.where(first == 1, green, red)
+    met = (neutral == 0) & (first == last) & (same >= min_same)
+    return met.any(axis=1).astype(np.int8)
+
+def calculate_ftfc_universe(latest, timeframes=None, key='symbol'):
+    """FTFC for every symbol in a latest_bars frame."""
+    symbols, colors, present = color_matrix(latest, timeframes or FTFC_TFS, key)
+    return pd.Series(ftfc_from_colors(colors, present), index=symbols)
+
+def calculate_tto_universe(latest, timeframes=None, block=None, min_same=None, key='symbol'):
+    """TTO for every symbol in a latest_bars frame."""
+    symbols, colors, _ = color_matrix(latest, timeframes or TFS_ORDER, key)
+    return pd.Series(tto_from_colors(colors, block, min_same), index=symbols)
+
+def tto_variants(latest, variants, timeframes=None):
+    """
+    Several TTO definitions from one color matrix, e.g.
+    tto_variants(latest, {'tto_4of3': (4, 3), 'tto_5of4': (5, 4)}).
+    Returns a DataFrame indexed by symbol with one 0/1 column per variant.
+    """
+    symbols, colors, _ = color_matrix(latest, timeframes or TFS_ORDER)
+    return pd.DataFrame(
+        {name: tto_from_colors(colors, block, min_same) for name, (block, min_same) in variants.items()},
+        index=symbols,
+    )
+
+def spy_performance(spy_data):
+    """SPY's '1D', '1W', '1M' and '3M' performance (0 when missing) for RS fields."""
+    def get_spy_perf(target_tf):
+        if not spy_data or target_tf not in spy_data: return 0
+        df_spy = spy_data[target_tf]
+        if not df_spy.empty:
+            latest_spy = df_spy.iloc[-1]
+            return ((latest_spy['close'] - latest_spy['open']) / latest_spy['open']) * 100
+        return 0
+
+    def get_spy_perf_3m():
+        # Same 63-day definition as the tickers' perf_3m
+        if not spy_data or '1D' not in spy_data: return 0
+        perf_3m = daily_metrics(spy_data['1D'])['perf_3m']
+        return 0 if perf_3m.empty or pd.isna(perf_3m.iloc[0]) else perf_3m.iloc[0]
+
+    return {'1D': get_spy_perf('1D'), '1W': get_spy_perf('1W'), '1M': get_spy_perf('1M'), '3M': get_spy_perf_3m()}
+
+def scan_alerts(latest, metrics, spy_perf, key='symbol'):
+    """
+    Alert rows for a latest_bars-shaped frame holding one bar per timeframe
+    of each snapshot, snapshots being identified by the `key` column (a
+    ticker for the live scan). `metrics` is indexed by key with adr,
+    avg_dollar_volume and perf_3m; `spy_perf` maps '1D', '1W', '1M' and '3M'
+    to SPY's performance, a scalar or one value per row of latest.
+    Returns a DataFrame with every Alert field (empty if nothing matched).
+    """
+    latest = latest.copy()
+    keys = latest[key]
+
+    # Per-snapshot metrics (same value on every timeframe row of a snapshot)
+    ftfc = calculate_ftfc_universe(latest, key=key)
+    tto = calculate_tto_universe(latest, key=key)
+
+    perf = latest.pivot(index=key, columns='timeframe', values='change_pct')
+
+    def get_perf(target_tf):
+        if target_tf not in perf.columns:
+            return np.zeros(len(latest))
+        return perf[target_tf].reindex(keys).fillna(0).to_numpy()
+
+    latest['ftfc'] = ftfc.reindex(keys).to_numpy()
+    latest['tto'] = tto.reindex(keys).to_numpy()
+    latest['adr'] = metrics['adr'].reindex(keys).fillna(0).to_numpy()
+    latest['avg_dollar_volume'] = metrics['avg_dollar_volume'].reindex(keys).fillna(0).to_numpy()
+    latest['gap'] = (((latest['open'] - latest['prev_close']) / latest['prev_close']) * 100).fillna(0)
+    latest['change_from_open'] = latest['change_pct']
+    latest['wtd'] = get_perf('1W')
+    latest['mtd'] = get_perf('1M')
+    latest['qtd'] = get_perf('1Q')
+    latest['ytd'] = get_perf('1Y')
+    latest['perf_3m'] = metrics['perf_3m'].reindex(keys).fillna(0).to_numpy()
+    latest['rs_1d'] = get_perf('1D') - spy_perf['1D']
+    latest['rs_1w'] = latest['wtd'] - spy_perf['1W']
+    latest['rs_1m'] = latest['mtd'] - spy_perf['1M']
+    latest['rs_3m'] = latest['perf_3m'] - spy_perf['3M']
+
+    # Candle state labels
+    labels = np.asarray(CANDLE_STATES, dtype=object)
+    latest['curr_cond'] = labels[latest['state'].to_numpy()]
+    latest['prev_cond_1'] = labels[latest['state_prev'].to_numpy()]
+    latest['prev_cond_2'] = labels[latest['state_prev2'].to_numpy()]
+    latest['candle_state'] = latest['curr_cond']
+
+    # Every registered pattern evaluated over all snapshots and timeframes at once
+    from patterns import match_patterns
+    alerts = match_patterns(latest)
+    if alerts.empty: return alerts
+
+    alerts['ticker'] = alerts['symbol']
+    alerts['price'] = alerts['close']
+    alerts['desc'] = alerts['type'] + " (" + alerts['status'] + ")"
+    alerts['industry'] = "Tech" # Mock for now, would need sector data
     return alerts
 
-def create_alert(ticker, type_, tf, row, pattern, status, ftfc, candle_state, tto=0,
-                 adr=0, gap=0, change_from_open=0, wtd=0, mtd=0, qtd=0, ytd=0, perf_3m=0, avg_dollar_volume=0,
-                 rs_1d=0, rs_1w=0, rs_1m=0, rs_3m=0,
-                 prev_cond_1="", prev_cond_2="", curr_cond=""):
-    return {
-        "ticker": ticker,
-        "type": type_,
-        "timeframe": tf,
-        "price": row['close'],
-        "desc": f"{type_} ({status})",
-        "pattern": pattern,
-        "change_pct": ((row['close'] - row['open']) / row['open']) * 100,
-        "volume": row['volume'],
-        "status": status,
-        "ftfc": ftfc,
-        "tto": tto,
-        "candle_state": candle_state,
-        "industry": "Tech", # Mock for now, would need sector data
-        "adr": adr,
-        "gap": gap,
-        "change_from_open": change_from_open,
-        "wtd": wtd,
-        "mtd": mtd,
-        "qtd": qtd,
-        "ytd": ytd,
-        "perf_3m": perf_3m,
-        "avg_dollar_volume": avg_dollar_volume,
-        "rs_1d": rs_1d,
-        "rs_1w": rs_1w,
-        "rs_1m": rs_1m,
-        "rs_3m": rs_3m,
-        "prev_cond_1": prev_cond_1,
-        "prev_cond_2": prev_cond_2,
-        "curr_cond": curr_cond
-    }
+def run_scan_universe(tickers=None, spy_data=None, df=None, intraday=False):
+    """
+    Batch version of run_scan: scans every ticker from one bulk OHLCV read
+    (the latest_bars snapshot, see snapshot.py), computed as column
+    operations, and returns an AlertBatch. With intraday, the
+    15m/30m/60m/4H bars of intraday_ohlcv are scanned as well.
+    """
+    if df is None:
+        from snapshot import SCAN_SNAPSHOT, load_snapshot
+        df = load_snapshot(tickers) if SCAN_SNAPSHOT else load_ohlcv(tickers)
+    if intraday:
+        from intraday import load_intraday
+        bars = load_intraday(tickers)
+        if not bars.empty:
+            # Both parts are date-sorted within each (symbol, timeframe)
+            df = pd.concat([df, bars], ignore_index=True)
+            df = df.sort_values(['symbol', 'timeframe'], kind='stable', ignore_index=True)
+    if df.empty: return AlertBatch.empty()
+
+    alerts = scan_alerts(latest_bars(df), current_daily_metrics(df), spy_performance(spy_data))
+    if alerts.empty: return AlertBatch.empty()
+
+    alerts = alerts.sort_values(['symbol', 'timeframe', 'check_order'], kind='stable')
+    return AlertBatch.from_frame(alerts)
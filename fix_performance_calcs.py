@@ -2,7 +2,7 @@
 """
 Fix WTD/MTD/QTD/YTD calculations to use calendar-based logic
 """
-from database import Session, Alert, OHLCV
+from database import Session, Alert, OHLCV, Ticker, TIMEFRAME_IDS, ohlcv_query
 from datetime import datetime, timedelta
 import pandas as pd
 
@@ -87,9 +87,9 @@ def main():
         
         for alert in alerts:
             # Get daily data for this ticker
-            query = session.query(OHLCV).filter_by(
-                symbol=alert.ticker,
-                timeframe='1D'
+            query = ohlcv_query(session, OHLCV).filter(
+                Ticker.symbol == alert.ticker,
+                OHLCV.timeframe_id == TIMEFRAME_IDS['1D']
             ).order_by(OHLCV.date)
             
             df_daily = pd.read_sql(query.statement, session.bind)
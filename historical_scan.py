@@ -0,0 +1,215 @@
+"""
+As-of-date historical scan.
+
+Rebuilds the alerts the daily scan would have produced on every trading day
+of a date range, in one vectorized pass per ticker chunk instead of one full
+scan per day. Higher-timeframe candles are reconstructed as they stood at
+each day's close (period open, running high/low/volume, that day's close) and
+classified against the previous completed bar, so a snapshot never sees bars
+from after its date. Results are bulk-loaded into alerts, replacing what was
+stored for the range. The range ends yesterday by default, so today's alerts
+from the live and intraday scans are left alone.
+
+Usage: python historical_scan.py <start YYYY-MM-DD> [<end YYYY-MM-DD>]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from database import Session, Ticker, Alert, init_db
+from engine import CANDLE_CODES, TFS_ORDER, load_ohlcv, history_bars, classify_pairs, scan_alerts
+from alert_batch import AlertBatch
+from metrics import ADR_WINDOW, ADV_WINDOW, PERF_WINDOW
+
+BENCHMARK = 'SPY'
+# Longest period (1Y) in days: bars older than this before the range cannot affect it
+MAX_PERIOD_DAYS = 366
+
+def _days(dates):
+    return pd.to_datetime(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+def _rolling_mean(values, pos, window):
+    # Trailing mean over `window` bars of each series (NaN until a series has that many)
+    totals = np.concatenate([[0.0], np.cumsum(values)])
+    idx = np.arange(len(values))
+    means = (totals[idx + 1] - totals[np.maximum(idx + 1 - window, 0)]) / window
+    return np.where(pos >= window - 1, means, np.nan)
+
+def as_of_metrics(daily):
+    """
+    engine.daily_metrics as of every bar of a 1D history_bars frame
+    (adr, avg_dollar_volume, perf_3m), aligned with its rows.
+    """
+    pos = daily['pos'].to_numpy()
+    high = daily['high'].to_numpy(dtype=np.float64)
+    low = daily['low'].to_numpy(dtype=np.float64)
+    close = daily['close'].to_numpy(dtype=np.float64)
+    volume = daily['volume'].to_numpy(dtype=np.float64)
+
+    adr = _rolling_mean(high - low, pos, ADR_WINDOW) / close * 100
+    adr = np.where(np.isfinite(adr) & (close > 0), adr, 0)
+    avg_dollar_volume = np.nan_to_num(_rolling_mean(close * volume, pos, ADV_WINDOW))
+
+    base = close[np.maximum(np.arange(len(close)) - (PERF_WINDOW - 1), 0)]
+    perf_3m = np.where(pos >= PERF_WINDOW - 1, (close / base - 1) * 100, np.nan)
+    return pd.DataFrame({'adr': adr, 'avg_dollar_volume': avg_dollar_volume, 'perf_3m': perf_3m}, index=daily.index)
+
+def as_of_bars(history, start, end, timeframes=TFS_ORDER):
+    """
+    latest_bars-shaped rows for every (symbol, trading day in [start, end],
+    timeframe) from a history_bars frame: each timeframe's candle as it stood
+    at that day's close. 'as_of' holds the day and 'snapshot' is the
+    position of the day's 1D bar in history (one per symbol and day).
+    """
+    symbol_codes = pd.factorize(history['symbol'])[0].astype(np.int64)
+    days = _days(history['date'])
+    # Sortable (symbol, day) keys; history is sorted by symbol, timeframe, date
+    keys = symbol_codes * 100_000 + days
+    tf = history['timeframe'].to_numpy()
+    pos = history['pos'].to_numpy()
+    start_day, end_day = _days([start, end])
+
+    daily = np.flatnonzero((tf == '1D') & (days >= start_day - MAX_PERIOD_DAYS) & (days <= end_day))
+    in_range = days[daily] >= start_day
+    if not in_range.any():
+        return history.iloc[:0]
+
+    high = history['high'].to_numpy(dtype=np.float64)
+    low = history['low'].to_numpy(dtype=np.float64)
+    close = history['close'].to_numpy(dtype=np.float64)
+    days_frame = history.iloc[daily][['open', 'high', 'low', 'close', 'volume']].reset_index(drop=True)
+
+    frames = []
+    for name in timeframes:
+        bars = np.flatnonzero(tf == name)
+        if len(bars) == 0: continue
+
+        # Period holding each day: the first bar dated on or after it (bars are labelled by period end)
+        j = np.minimum(np.searchsorted(keys[bars], keys[daily], side='left'), len(bars) - 1)
+        bar = bars[j]
+        has_bar = (symbol_codes[bar] == symbol_codes[daily]) & (days[bar] >= days[daily])
+
+        # Running OHLCV of each period through each day (days without a period bar stay alone)
+        running = days_frame.groupby(np.where(has_bar, bar, -1 - daily), sort=False)
+        partial = pd.DataFrame({
+            'open': running['open'].transform('first'),
+            'high': running['high'].cummax(),
+            'low': running['low'].cummin(),
+            'close': days_frame['close'],
+            'volume': running['volume'].cumsum(),
+        })
+
+        keep = in_range & has_bar
+        bar, snapshot, partial = bar[keep], daily[keep], partial[keep]
+        prev = bar - 1
+        has_prev = pos[bar] >= 1
+
+        frame = partial.reset_index(drop=True)
+        frame['symbol'] = history['symbol'].to_numpy()[snapshot]
+        frame['timeframe'] = name
+        frame['date'] = history['date'].to_numpy()[bar]
+        frame['as_of'] = history['date'].to_numpy()[snapshot]
+        frame['snapshot'] = snapshot
+        frame['state'] = np.where(
+            has_prev,
+            classify_pairs(frame['high'], frame['low'], frame['open'], frame['close'], high[prev], low[prev]),
+            CANDLE_CODES['?'],
+        ).astype(np.int8)
+        frame['state_prev'] = history['state_prev'].to_numpy()[bar]
+        frame['state_prev2'] = history['state_prev2'].to_numpy()[bar]
+        frame['prev_close'] = np.where(has_prev, close[prev], np.nan)
+        frame['change_pct'] = ((frame['close'] - frame['open']) / frame['open']) * 100
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+def benchmark_performance(start, end):
+    """
+    SPY's '1D', '1W', '1M' and '3M' performance as of each trading day in
+    [start, end], as a DataFrame indexed by day (see engine.spy_performance).
+    """
+    history = history_bars(load_ohlcv([BENCHMARK]))
+    bars = as_of_bars(history, start, end)
+    if bars.empty:
+        return pd.DataFrame(columns=['1D', '1W', '1M', '3M'])
+    perf = bars.pivot(index='as_of', columns='timeframe', values='change_pct')
+    perf = perf.reindex(columns=['1D', '1W', '1M'])
+
+    daily = history[history['timeframe'] == '1D']
+    perf_3m = as_of_metrics(daily)['perf_3m'].set_axis(daily['date'].to_numpy())
+    perf['3M'] = perf_3m.reindex(perf.index).to_numpy()
+    return perf.fillna(0)
+
+def scan_history(history, start, end, spy_perf):
+    """
+    Alerts for every trading day in [start, end] from a history_bars frame.
+    Returns (AlertBatch, as_of dates aligned with the batch rows).
+    """
+    bars = as_of_bars(history, start, end)
+    if bars.empty:
+        return AlertBatch.empty(), np.array([], dtype=object)
+
+    daily = history[history['timeframe'] == '1D']
+    metrics = as_of_metrics(daily)
+    day_perf = spy_perf.reindex(bars['as_of'].to_numpy()).fillna(0)
+
+    alerts = scan_alerts(bars, metrics, {name: day_perf[name].to_numpy() for name in ['1D', '1W', '1M', '3M']}, key='snapshot')
+    if alerts.empty:
+        return AlertBatch.empty(), np.array([], dtype=object)
+
+    alerts = alerts.sort_values(['as_of', 'symbol', 'timeframe', 'check_order'], kind='stable')
+    as_of = pd.to_datetime(alerts['as_of']).dt.date.to_numpy()
+    return AlertBatch.from_frame(alerts), as_of
+
+def save_alert_history(alerts, as_of, start, end, tickers, chunk_size=5000):
+    """Replace the alerts of `tickers` dated in [start, end] with a historical batch."""
+    session = Session()
+    try:
+        session.query(Alert).filter(
+            Alert.date >= start, Alert.date <= end, Alert.ticker.in_(list(tickers))
+        ).delete(synchronize_session=False)
+        for rows in alerts.iter_rows(chunk_size, date=as_of, color=0, is_theme=0):
+            session.execute(insert(Alert), rows)
+        session.commit()
+        return len(alerts)
+    except Exception as e:
+        print(f"Error saving alert history: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
+def run_historical_scan(start, end, tickers=None, chunk_size=250):
+    """Scan every trading day in [start, end] for the given tickers (all symbols in OHLCV if None)."""
+    if tickers is None:
+        session = Session()
+        tickers = [s for (s,) in session.query(Ticker.symbol)]
+        session.close()
+    tickers = sorted(tickers)
+    spy_perf = benchmark_performance(start, end)
+
+    saved = 0
+    for i in range(0, len(tickers), chunk_size):
+        chunk = tickers[i:i + chunk_size]
+        df = load_ohlcv(chunk)
+        if df.empty: continue
+        alerts, as_of = scan_history(history_bars(df), start, end, spy_perf)
+        saved += save_alert_history(alerts, as_of, start, end, chunk)
+        print(f"[{min(i + chunk_size, len(tickers))}/{len(tickers)}] {len(alerts)} historical alerts")
+    return saved
+
+def main(start, end=None):
+    init_db()
+    started = time.time()
+    start = datetime.strptime(start, "%Y-%m-%d").date()
+    end = datetime.strptime(end, "%Y-%m-%d").date() if end else datetime.now().date() - timedelta(days=1)
+    saved = run_historical_scan(start, end)
+    print(f"Historical scan {start} to {end} complete in {time.time() - started:.1f}s. Saved {saved} alerts.")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(*sys.argv[1:3])
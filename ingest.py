@@ -1,9 +1,16 @@
-import yfinance as yf
+import os
+import sys
+import numpy as np
 import pandas as pd
 import csv
 from datetime import datetime
-from database import Session, OHLCV, Theme, ThemeTicker, init_db
-from sqlalchemy.dialects.sqlite import insert
+from database import Session, OHLCV, Ticker, TIMEFRAMES, TIMEFRAME_IDS, ohlcv_query, ticker_ids, Theme, ThemeTicker, SymbolWatermark, init_db, bulk_upsert
+from engine import update_candle_states
+from metrics import update_ticker_metrics
+from providers import get_provider, market_session, MARKET_TZ
+from timeframes import DERIVE_TIMEFRAMES
+from parquet_store import get_store
+from snapshot import refresh_snapshot
 
 UNIVERSE_FILE = '/Users/nigeljohnson/AntiGravity/StratIQ/Themes - Sheet1.csv'
 
@@ -49,49 +56,44 @@ def sync_themes(themes_dict):
     finally:
         session.close()
 
+# N-day candle aggregation (the Date column keeps the group's last trading day)
+N_DAY_RULES = {'Date': 'last', 'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+def trading_day_buckets(dates, days, symbols=None):
+    """
+    Integer N-day bucket of each bar for bars sorted by (symbol,) date: the
+    bar's position among its symbol's trading days of the year // days.
+    Buckets are numbered consecutively in row order.
+    """
+    year = pd.DatetimeIndex(dates).year.to_numpy()
+    n = len(year)
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = year[1:] != year[:-1]
+    if symbols is not None:
+        symbols = np.asarray(symbols)
+        new_run[1:] |= symbols[1:] != symbols[:-1]
+
+    idx = np.arange(n)
+    run_start = np.maximum.accumulate(np.where(new_run, idx, 0))
+    return np.cumsum((idx - run_start) % days == 0) - 1
+
 def aggregate_trading_days(df, days):
     """
     Aggregate trading days into N-day candles.
     Anchored to the first trading day of each year to match TradingView.
     """
-    # Ensure sorted by date
     df = df.sort_index()
-    
-    # Reset index to work with DataFrame
-    df_reset = df.reset_index()
-    df_reset['year'] = df_reset['Date'].dt.year
-    
-    # Group by year and calculate offset from first trading day of that year
-    def assign_groups(year_df):
-        year_df = year_df.sort_values('Date').copy()
-        year_df = year_df.reset_index(drop=True)
-        # Index within the year (0, 1, 2, ...)
-        # Group every 'days' rows
-        year_df['group_id'] = year_df.index // days
-        return year_df
-    
-    df_grouped = df_reset.groupby('year', group_keys=False).apply(assign_groups)
-    
-    # Create unique group identifier across years
-    df_grouped['unique_group'] = df_grouped['year'].astype(str) + '_' + df_grouped['group_id'].astype(str)
-    
-    # Aggregation rules
-    agg_dict = {
-        'Date': 'last',  # Use the last date in the group
-        'Open': 'first',
-        'High': 'max',
-        'Low': 'min',
-        'Close': 'last',
-        'Volume': 'sum'
-    }
-    
-    # Group and aggregate
-    df_agg = df_grouped.groupby('unique_group').agg(agg_dict)
-    
-    # Set index and return
-    df_agg.set_index('Date', inplace=True)
-    
-    return df_agg
+    frame = df.assign(Date=df.index)
+    df_agg = frame.groupby(trading_day_buckets(df.index, days), sort=False).agg(N_DAY_RULES)
+    return df_agg.set_index('Date')
+
+def aggregate_trading_days_long(df, days):
+    """
+    aggregate_trading_days for many symbols at once: df is a long frame with
+    'symbol' and 'Date' columns plus OHLCV, sorted by symbol and Date.
+    """
+    buckets = trading_day_buckets(df['Date'], days, df['symbol'].to_numpy())
+    return df.groupby(buckets, sort=False).agg({'symbol': 'first', **N_DAY_RULES}).reset_index(drop=True)
 
 def aggregate_data(df_daily):
     aggs = {}
@@ -131,85 +133,287 @@ def aggregate_data(df_daily):
     
     return aggs
 
-def save_ohlcv(symbol, aggs):
+# Calendar timeframes whose bars continue the stored grid of period ends
+WEEK_MULTIPLES = {'2W': 2, '3W': 3}
+N_DAY_TFS = {'2D': 2, '3D': 3, '5D': 5}
+
+def open_period_start(first_new):
+    """
+    Earliest day any period containing first_new can start: N-day, 1M, 1Q
+    and 1Y periods start within its year, week-based ones within 3 weeks.
+    """
+    return min(pd.Timestamp(first_new.year, 1, 1), first_new - pd.Timedelta(weeks=3))
+
+def stored_bar_dates(symbol):
+    """Latest stored bar date per timeframe for a symbol."""
+    from sqlalchemy import func
     session = Session()
     try:
-        for tf, df in aggs.items():
-            for date, row in df.iterrows():
-                stmt = insert(OHLCV).values(
-                    symbol=symbol,
-                    date=date.date(),
-                    open=row['Open'],
-                    high=row['High'],
-                    low=row['Low'],
-                    close=row['Close'],
-                    volume=row['Volume'],
-                    timeframe=tf
-                )
-                # Upsert
-                stmt = stmt.on_conflict_do_update(
-                    index_elements=['symbol', 'date', 'timeframe'],
-                    set_=dict(
-                        open=stmt.excluded.open,
-                        high=stmt.excluded.high,
-                        low=stmt.excluded.low,
-                        close=stmt.excluded.close,
-                        volume=stmt.excluded.volume
-                    )
-                )
-                session.execute(stmt)
+        rows = ohlcv_query(session, OHLCV.timeframe_id, func.max(OHLCV.date)).filter(
+            Ticker.symbol == symbol
+        ).group_by(OHLCV.timeframe_id).all()
+    finally:
+        session.close()
+    return {TIMEFRAMES[tf]: pd.Timestamp(d) for tf, d in rows}
+
+def load_daily_bars(symbol, start):
+    """Stored 1D bars from start on, as a yfinance-style frame."""
+    session = Session()
+    try:
+        query = ohlcv_query(session, OHLCV.date, OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume).filter(
+            Ticker.symbol == symbol, OHLCV.timeframe_id == TIMEFRAME_IDS['1D'], OHLCV.date >= start.date()
+        ).order_by(OHLCV.date)
+        df = pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('date')), name='Date')
+    df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    return df
+
+def aggregate_incremental(symbol, df_new):
+    """
+    Higher-timeframe bars for newly fetched daily bars without re-aggregating
+    history: only periods containing a new bar (the open candles) are
+    rebuilt, from their stored daily bars plus the new ones. Closed bars are
+    never recomputed. N-day groups stay anchored to the first trading day of
+    the year and 2W/3W bars continue the stored grid of period ends.
+
+    Returns (aggs, replace_from), or None if the symbol has no stored bars.
+    replace_from maps the N-day timeframes to the first day of their first
+    rebuilt group: an open N-day bar is labelled with its last day so far,
+    so its stored row has to be replaced rather than upserted.
+    """
+    last = stored_bar_dates(symbol)
+    if '1D' not in last: return None
+
+    df_new = df_new.sort_index()
+    first_new = df_new.index[0]
+    stored = load_daily_bars(symbol, open_period_start(first_new))
+    daily = pd.concat([stored[stored.index < first_new], df_new])
+
+    rules = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+    aggs = {'1D': df_new}
+    replace_from = {}
+
+    for tf, days in N_DAY_TFS.items():
+        bars = aggregate_trading_days(daily, days)
+        closed = bars.index[bars.index < first_new]
+        # First day after the last closed group (groups are labelled by their last day)
+        replace_from[tf] = daily.index[daily.index > closed[-1]][0] if len(closed) else daily.index[0]
+        aggs[tf] = bars[bars.index >= first_new]
+
+    for tf, rule in (('1W', 'W-FRI'), ('1M', 'ME'), ('1Q', 'QE'), ('1Y', 'YE')):
+        bars = daily.resample(rule).agg(rules).dropna()
+        aggs[tf] = bars[bars.index >= first_new]
+
+    for tf, weeks in WEEK_MULTIPLES.items():
+        if tf not in last: return None
+        # Friday ending each day's week, then the period end on the stored grid
+        friday = daily.index + pd.to_timedelta((4 - daily.index.weekday) % 7, unit='D')
+        step = pd.Timedelta(weeks=weeks)
+        periods = -((last[tf] - friday) // step)
+        labels = last[tf] + periods * step
+        bars = daily.groupby(labels).agg(rules).dropna()
+        bars.index.name = 'Date'
+        aggs[tf] = bars[bars.index >= first_new]
+
+    return aggs, replace_from
+
+def ohlcv_rows(ticker_id, aggs):
+    """Insert-ready OHLCV dicts for every bar of every timeframe in aggs."""
+    rows = []
+    for tf, df in aggs.items():
+        if df.empty: continue
+        frame = df[['Open', 'High', 'Low', 'Close', 'Volume']].astype(object)
+        frame = frame.where(frame.notna(), None)
+        frame.columns = ['open', 'high', 'low', 'close', 'volume']
+        frame.insert(0, 'date', [d.date() for d in df.index])
+        frame.insert(0, 'timeframe_id', TIMEFRAME_IDS[tf])
+        frame.insert(0, 'ticker_id', ticker_id)
+        rows.extend(frame.to_dict('records'))
+    return rows
+
+def save_ohlcv(symbol, aggs, replace_from=None):
+    ticker_id = ticker_ids([symbol])[symbol]
+    session = Session()
+    try:
+        # Stored bars superseded by rebuilt ones with a different date (see aggregate_incremental)
+        for tf, start in (replace_from or {}).items():
+            session.query(OHLCV).filter(
+                OHLCV.ticker_id == ticker_id, OHLCV.timeframe_id == TIMEFRAME_IDS[tf], OHLCV.date >= start.date()
+            ).delete(synchronize_session=False)
+        
+        # Upsert every timeframe in one bulk statement (see database.bulk_upsert)
+        bulk_upsert(
+            session, OHLCV, ohlcv_rows(ticker_id, aggs),
+            keys=['ticker_id', 'timeframe_id', 'date'],
+            columns=['open', 'high', 'low', 'close', 'volume'],
+        )
+        if '1D' in aggs and not aggs['1D'].empty:
+            # Freshness index read by fetch_plan, written with the bars
+            bulk_upsert(
+                session, SymbolWatermark,
+                [{"symbol": symbol, "last_date": aggs['1D'].index[-1].date(), "fetched_at": market_now().to_pydatetime()}],
+                keys=['symbol'], columns=['last_date', 'fetched_at'],
+            )
         session.commit()
-    except Exception as e:
-        print(f"Error saving {symbol}: {e}")
+    except Exception:
+        # Raised so store_bars doesn't write the Parquet store and metrics for unsaved bars
         session.rollback()
+        raise
     finally:
         session.close()
 
 from universe import update_universe
 
-def run_ingestion():
-    init_db()
-    
-    # 1. Update Universe from ETFs
+# History fetched for tickers with no stored bars
+INITIAL_PERIOD = "5y"
+
+def universe_tickers():
+    """Refresh the ETF universe and return its tickers."""
     print("Updating Universe from ETFs...")
     update_universe()
     
-    # 2. Fetch Data
     session = Session()
     tickers = [r.ticker for r in session.query(ThemeTicker).distinct(ThemeTicker.ticker).all()]
     session.close()
+    return tickers
+
+# Minutes after which an open session is fetched again (hourly runs refresh it)
+REFRESH_MINUTES = int(os.getenv("INGEST_REFRESH_MINUTES", "30"))
+
+def market_now():
+    """Current exchange local time, tz-naive."""
+    return pd.Timestamp.now(tz=MARKET_TZ).tz_localize(None)
+
+def load_symbol_watermarks():
+    """{symbol: (last 1D date, fetched_at)} from symbol_watermarks, in one query."""
+    session = Session()
+    try:
+        rows = session.query(SymbolWatermark.symbol, SymbolWatermark.last_date, SymbolWatermark.fetched_at).all()
+        if rows:
+            return {symbol: (last_date, fetched_at) for symbol, last_date, fetched_at in rows}
+        
+        # First run on an existing database: build the index with one GROUP BY.
+        # Higher-timeframe bars are labelled by period end, often after today.
+        from sqlalchemy import func
+        last_dates = ohlcv_query(session, Ticker.symbol, func.max(OHLCV.date)).filter(
+            OHLCV.timeframe_id == TIMEFRAME_IDS['1D']
+        ).group_by(Ticker.symbol).all()
+        if last_dates:
+            bulk_upsert(
+                session, SymbolWatermark,
+                [{"symbol": symbol, "last_date": last_date, "fetched_at": None} for symbol, last_date in last_dates],
+                keys=['symbol'], columns=['last_date'],
+            )
+            session.commit()
+        return {symbol: (last_date, None) for symbol, last_date in last_dates}
+    finally:
+        session.close()
+
+def is_fresh(fetched_at, now=None):
+    """
+    Whether a symbol fetched at `fetched_at` already has the current session:
+    fetched after the last session close, or during an open session less than
+    REFRESH_MINUTES ago.
+    """
+    if fetched_at is None: return False
+    now = now if now is not None else market_now()
+    last_close, in_session = market_session(now.tz_localize(MARKET_TZ))
+    fetched_at = pd.Timestamp(fetched_at)
+    if in_session:
+        return now - fetched_at < pd.Timedelta(minutes=REFRESH_MINUTES)
+    return fetched_at >= last_close.tz_localize(None)
+
+def fetch_plan(tickers, force=False):
+    """
+    Group tickers by their last stored daily bar date ({date or None: [tickers]})
+    so each group is fetched with one batched request. Tickers already fetched
+    for the current session are left out unless `force`.
+    """
+    marks = load_symbol_watermarks()
+    now = market_now()
+    
+    by_start = {}
+    fresh = 0
+    for ticker in tickers:
+        last_date, fetched_at = marks.get(ticker, (None, None))
+        if not force and is_fresh(fetched_at, now):
+            fresh += 1
+            continue
+        by_start.setdefault(last_date, []).append(ticker)
+    if fresh:
+        print(f"Skipping {fresh} tickers already up to date for the current session")
+    return by_start
+
+def fetch_group(provider, tickers, last_date):
+    if last_date:
+        # Fetch from last date (inclusive, upsert handles duplicates)
+        return provider.fetch(tickers, start=last_date)
+    # New tickers, fetch full history
+    return provider.fetch(tickers, period=INITIAL_PERIOD)
+
+def prepare_bars(ticker, df, last_date):
+    """(aggs, replace_from) to save for a ticker's freshly fetched daily bars."""
+    if DERIVE_TIMEFRAMES:
+        # Higher timeframes are derived at read time (see timeframes.py)
+        return {'1D': df}, None
+    # Existing tickers only rebuild their open higher-timeframe candles
+    incremental = aggregate_incremental(ticker, df) if last_date else None
+    return incremental or (aggregate_data(df), None)
+
+def store_bars(ticker, df, aggs, replace_from=None):
+    save_ohlcv(ticker, aggs, replace_from)
+    store = get_store()
+    if store:
+        # Buffered; run_ingestion flushes at the end
+        store.append(ticker, aggs, replace_from)
+    update_candle_states(ticker)
+    update_ticker_metrics(ticker, df)
+
+def run_ingestion(provider=None, tickers=None, force=False):
+    init_db()
+    provider = provider or get_provider()
     
+    if tickers is None:
+        # 1. Update Universe from ETFs
+        tickers = universe_tickers()
+    
+    # 2. Fetch Data
     print(f"Fetching data for {len(tickers)} tickers...")
     
-    from sqlalchemy import func
+    done = 0
+    written = []
+    # One batched request per distinct start date instead of one per ticker
+    for last_date, group in fetch_plan(tickers, force).items():
+        if last_date:
+            print(f"Updating {len(group)} tickers from {last_date}...")
+        else:
+            print(f"Initial fetch for {len(group)} tickers ({INITIAL_PERIOD})...")
+        data = fetch_group(provider, group, last_date)
+        
+        for ticker in group:
+            done += 1
+            try:
+                df = data.get(ticker)
+                if df is not None and len(df) > 0:
+                    store_bars(ticker, df, *prepare_bars(ticker, df, last_date))
+                    written.append(ticker)
+                else:
+                    print(f"[{done}/{len(tickers)}] No data for {ticker}")
+                    
+            except Exception as e:
+                print(f"Error processing {ticker}: {e}")
     
-    for i, ticker in enumerate(tickers):
-        try:
-            # Check for existing data to do incremental update
-            session = Session()
-            last_date = session.query(func.max(OHLCV.date)).filter_by(symbol=ticker).scalar()
-            session.close()
-            
-            t = yf.Ticker(ticker)
-            
-            if last_date:
-                # Fetch from last date (inclusive, upsert handles duplicates)
-                # yfinance expects string or datetime
-                print(f"[{i+1}/{len(tickers)}] Updating {ticker} from {last_date}...")
-                df = t.history(start=str(last_date), interval="1d")
-            else:
-                # New ticker, fetch full history
-                print(f"[{i+1}/{len(tickers)}] Initial fetch for {ticker} (5y)...")
-                df = t.history(period="5y", interval="1d")
-            
-            if len(df) > 0:
-                aggs = aggregate_data(df)
-                save_ohlcv(ticker, aggs)
-            else:
-                print(f"[{i+1}/{len(tickers)}] No data for {ticker}")
-                
-        except Exception as e:
-            print(f"Error processing {ticker}: {e}")
+    if get_store():
+        get_store().flush()
+    # After the flush: the snapshot may be read back from the Parquet store
+    refresh_snapshot(written)
 
 if __name__ == "__main__":
-    run_ingestion()
+    # python ingest.py [provider spec, e.g. local:/path/to/bars] [--force]
+    import time
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    start = time.time()
+    run_ingestion(get_provider(args[0]) if args else None, force='--force' in sys.argv)
+    print(f"Ingestion complete in {time.time() - start:.1f}s")
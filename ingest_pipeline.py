@@ -0,0 +1,217 @@
+"""
+Pipelined ingestion: download, aggregate and write run as concurrent stages
+connected by bounded asyncio queues, so downloads overlap with aggregation
+and database writes instead of alternating with them.
+
+- download: up to CONCURRENCY provider requests of BATCH_SIZE tickers in
+  flight, paced by a token bucket (RATE requests/second, BURST capacity)
+  and retried with exponential backoff. Requests only overlap for
+  thread-safe providers: YahooProvider serializes yf.download, so with
+  Yahoo the pipeline overlaps one download with aggregation and writes.
+- aggregate: AGGREGATE_WORKERS threads building the bars to save
+  (ingest.prepare_bars).
+- write: WRITE_WORKERS threads saving bars, candle states and ticker
+  metrics (ingest.store_bars). Keep this at 1 on SQLite (single writer).
+  The latest_bars snapshot of the written tickers is refreshed at the end.
+
+Blocking provider and database calls run in worker threads. The bounded
+queues give backpressure, so a slow writer throttles downloads instead of
+buffering the whole universe in memory. Per-stage counters are printed at
+the end: the stage with the highest busy share is the bottleneck.
+
+Usage: python ingest_pipeline.py [<provider spec> [<concurrency>]] [--force]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from database import init_db
+from providers import get_provider
+from parquet_store import get_store
+from snapshot import refresh_snapshot
+from ingest import universe_tickers, fetch_plan, fetch_group, prepare_bars, store_bars
+
+CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4")) # Provider requests in flight
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50")) # Tickers per provider request
+RATE = float(os.getenv("INGEST_RATE", "2")) # Provider requests per second
+BURST = int(os.getenv("INGEST_BURST", "4"))
+RETRIES = int(os.getenv("INGEST_RETRIES", "3"))
+BACKOFF = float(os.getenv("INGEST_BACKOFF", "1.0")) # First retry delay in seconds, doubled each retry
+AGGREGATE_WORKERS = int(os.getenv("INGEST_AGGREGATE_WORKERS", "2"))
+WRITE_WORKERS = int(os.getenv("INGEST_WRITE_WORKERS", "1"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "200")) # Tickers buffered between stages
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class StageStats:
+    __slots__ = ('name', 'workers', 'items', 'tickers', 'errors', 'retries', 'busy')
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.tickers = 0
+        self.errors = 0
+        self.retries = 0
+        self.busy = 0.0 # Seconds spent working, summed over workers
+
+    def report(self, elapsed):
+        utilization = self.busy / (elapsed * self.workers) if elapsed else 0
+        rate = self.tickers / self.busy if self.busy else 0
+        return (
+            f"{self.name:<10} {self.items:>6} items {self.tickers:>6} tickers "
+            f"{self.busy:8.1f}s busy {utilization:6.1%} of {self.workers} worker(s) "
+            f"{rate:8.1f} tickers/s/worker {self.errors:>4} errors {self.retries:>4} retries"
+        )
+
+async def _download(provider, jobs, out, bucket, stats):
+    while True:
+        job = await jobs.get()
+        if job is None: return
+        batch, last_date = job
+        data = None
+        for attempt in range(RETRIES + 1):
+            await bucket.acquire()
+            started = time.perf_counter()
+            try:
+                data = await asyncio.to_thread(fetch_group, provider, batch, last_date)
+            except Exception as e:
+                data = None
+                print(f"Fetch failed for {len(batch)} tickers ({batch[0]}...): {e}")
+            stats.busy += time.perf_counter() - started
+            # An empty result for a whole batch is usually throttling, retry it too
+            if data or attempt == RETRIES: break
+            stats.retries += 1
+            await asyncio.sleep(BACKOFF * 2 ** attempt * (1 + random.random() / 2))
+
+        stats.items += 1
+        if not data:
+            stats.errors += 1
+            continue
+        for ticker in batch:
+            df = data.get(ticker)
+            if df is None or df.empty:
+                print(f"No data for {ticker}")
+                continue
+            stats.tickers += 1
+            await out.put((ticker, df, last_date))
+
+async def _aggregate(items, out, stats):
+    while True:
+        item = await items.get()
+        if item is None: return
+        ticker, df, last_date = item
+        started = time.perf_counter()
+        try:
+            aggs, replace_from = await asyncio.to_thread(prepare_bars, ticker, df, last_date)
+        except Exception as e:
+            print(f"Error aggregating {ticker}: {e}")
+            stats.errors += 1
+            continue
+        finally:
+            stats.busy += time.perf_counter() - started
+            stats.items += 1
+        stats.tickers += 1
+        await out.put((ticker, df, aggs, replace_from))
+
+async def _write(items, stats, written):
+    while True:
+        item = await items.get()
+        if item is None: return
+        ticker = item[0]
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(store_bars, *item)
+            written.append(ticker)
+            stats.tickers += 1
+        except Exception as e:
+            print(f"Error writing {ticker}: {e}")
+            stats.errors += 1
+        stats.busy += time.perf_counter() - started
+        stats.items += 1
+
+async def run_pipeline(provider, tickers, concurrency=CONCURRENCY, force=False, written=None):
+    """
+    Ingest `tickers` through the staged pipeline; returns {stage: StageStats}.
+    Tickers saved by the writers are appended to `written`.
+    """
+    written = [] if written is None else written
+    jobs = asyncio.Queue()
+    for last_date, group in fetch_plan(tickers, force).items():
+        for i in range(0, len(group), BATCH_SIZE):
+            jobs.put_nowait((group[i:i + BATCH_SIZE], last_date))
+    for _ in range(concurrency):
+        jobs.put_nowait(None)
+
+    fetched = asyncio.Queue(maxsize=QUEUE_SIZE)
+    aggregated = asyncio.Queue(maxsize=QUEUE_SIZE)
+    stats = {
+        'download': StageStats('download', concurrency),
+        'aggregate': StageStats('aggregate', AGGREGATE_WORKERS),
+        'write': StageStats('write', WRITE_WORKERS),
+    }
+    bucket = TokenBucket(RATE, BURST)
+
+    downloaders = [asyncio.create_task(_download(provider, jobs, fetched, bucket, stats['download'])) for _ in range(concurrency)]
+    aggregators = [asyncio.create_task(_aggregate(fetched, aggregated, stats['aggregate'])) for _ in range(AGGREGATE_WORKERS)]
+    writers = [asyncio.create_task(_write(aggregated, stats['write'], written)) for _ in range(WRITE_WORKERS)]
+
+    # Each stage ends once its inputs are exhausted, then stops the next one
+    await asyncio.gather(*downloaders)
+    for _ in aggregators:
+        await fetched.put(None)
+    await asyncio.gather(*aggregators)
+    for _ in writers:
+        await aggregated.put(None)
+    await asyncio.gather(*writers)
+    return stats
+
+def run_ingestion_pipeline(provider=None, tickers=None, concurrency=CONCURRENCY, force=False):
+    init_db()
+    provider = provider or get_provider()
+    if tickers is None:
+        tickers = universe_tickers()
+
+    print(f"Ingesting {len(tickers)} tickers ({concurrency} concurrent requests of {BATCH_SIZE}, {RATE}/s)...")
+    start = time.perf_counter()
+    written = []
+    stats = asyncio.run(run_pipeline(provider, tickers, concurrency, force, written))
+    if get_store():
+        get_store().flush()
+    refresh_snapshot(written)
+    elapsed = time.perf_counter() - start
+
+    print(f"Pipeline finished in {elapsed:.1f}s")
+    for stage in stats.values():
+        print(stage.report(elapsed))
+    bottleneck = max(stats.values(), key=lambda s: s.busy / s.workers)
+    print(f"Bottleneck: {bottleneck.name}")
+    return stats
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    run_ingestion_pipeline(
+        get_provider(args[0]) if args else None,
+        concurrency=int(args[1]) if len(args) > 1 else CONCURRENCY,
+        force='--force' in sys.argv,
+    )
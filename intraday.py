@@ -0,0 +1,193 @@
+"""
+Intraday bars: 15m bars fetched from the provider, aggregated to 30m, 60m
+and 4H, stored in intraday_ohlcv keyed by bar start timestamp (exchange
+local time) and pruned to a rolling retention window.
+
+Aggregated bars are anchored at the session open (9:30), like the
+provider's own 30m/60m bars, and never span two sessions. An incremental
+run refetches from the start of each ticker's last stored session, so every
+open bar of every intraday timeframe is rebuilt from complete 15m data.
+Writes are batched across tickers and pruning is one indexed DELETE per run.
+
+Usage: python intraday.py [<provider spec>] [--scan]
+    Ingest intraday bars (hourly during market hours), optionally followed by
+    an intraday scan that replaces today's intraday alerts.
+"""
+import os
+import sys
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import func
+from database import Session, IntradayOHLCV, ThemeTicker, init_db, bulk_upsert
+from providers import get_provider, MARKET_TZ
+from alert_batch import AlertBatch
+
+BASE_TF = '15m'
+INTRADAY_MINUTES = {'15m': 15, '30m': 30, '60m': 60, '4H': 240}
+INTRADAY_TFS = list(INTRADAY_MINUTES)
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+RETENTION_DAYS = int(os.getenv("INTRADAY_RETENTION_DAYS", "30"))
+INITIAL_PERIOD = f"{min(RETENTION_DAYS, 59)}d" # Yahoo serves at most 60 days of 15m bars
+WRITE_BATCH = 50000 # Rows per bulk upsert
+
+def session_buckets(timestamps, minutes):
+    """Start of the session-anchored `minutes` bar holding each timestamp."""
+    day = timestamps.normalize()
+    size = pd.Timedelta(minutes=minutes)
+    return day + SESSION_OPEN + ((timestamps - day - SESSION_OPEN) // size) * size
+
+def aggregate_intraday(bars):
+    """
+    All intraday timeframes from a long frame of 15m bars (symbol, timestamp,
+    open, high, low, close, volume) sorted by symbol and timestamp.
+    Returns one long frame with a timeframe column, sorted within each
+    (symbol, timeframe).
+    """
+    timestamps = pd.DatetimeIndex(bars['timestamp'])
+    symbols = bars['symbol'].to_numpy()
+    rules = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    values = bars[list(rules)].reset_index(drop=True)
+
+    frames = [bars.assign(timeframe=BASE_TF)]
+    for tf, minutes in INTRADAY_MINUTES.items():
+        if tf == BASE_TF: continue
+        agg = values.groupby([symbols, session_buckets(timestamps, minutes)], sort=False).agg(rules)
+        agg.index.names = ['symbol', 'timestamp']
+        frames.append(agg.reset_index().assign(timeframe=tf))
+    return pd.concat(frames, ignore_index=True)
+
+def long_bars(data):
+    """{symbol: provider frame} -> long 15m frame."""
+    frames = [
+        pd.DataFrame({
+            'symbol': symbol, 'timestamp': df.index,
+            'open': df['Open'].to_numpy(), 'high': df['High'].to_numpy(), 'low': df['Low'].to_numpy(),
+            'close': df['Close'].to_numpy(), 'volume': df['Volume'].to_numpy(),
+        })
+        for symbol, df in data.items() if df is not None and not df.empty
+    ]
+    if not frames:
+        return pd.DataFrame(columns=['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    return pd.concat(frames, ignore_index=True)
+
+def save_intraday(bars):
+    """Upsert a long frame of intraday bars in WRITE_BATCH-row statements, one transaction."""
+    if bars.empty: return 0
+    columns = ['symbol', 'timeframe', 'timestamp', 'open', 'high', 'low', 'close', 'volume']
+    rows = bars[columns].to_dict('records')
+    session = Session()
+    try:
+        for i in range(0, len(rows), WRITE_BATCH):
+            bulk_upsert(
+                session, IntradayOHLCV, rows[i:i + WRITE_BATCH],
+                keys=['symbol', 'timeframe', 'timestamp'],
+                columns=['open', 'high', 'low', 'close', 'volume'],
+            )
+        session.commit()
+        return len(rows)
+    except Exception as e:
+        print(f"Error saving intraday bars: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
+def prune_intraday(days=RETENTION_DAYS, now=None):
+    """
+    Delete intraday bars older than the retention window (one DELETE on the
+    timestamp index). `now` is exchange-local like the stored timestamps.
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz=MARKET_TZ).tz_localize(None)
+    cutoff = now - pd.Timedelta(days=days)
+    session = Session()
+    try:
+        deleted = session.query(IntradayOHLCV).filter(
+            IntradayOHLCV.timestamp < cutoff
+        ).delete(synchronize_session=False)
+        session.commit()
+        return deleted
+    finally:
+        session.close()
+
+def last_sessions():
+    """Date of each symbol's last stored 15m bar (one GROUP BY)."""
+    session = Session()
+    try:
+        rows = session.query(IntradayOHLCV.symbol, func.max(IntradayOHLCV.timestamp)).filter(
+            IntradayOHLCV.timeframe == BASE_TF
+        ).group_by(IntradayOHLCV.symbol).all()
+    finally:
+        session.close()
+    return {symbol: pd.Timestamp(ts).date() for symbol, ts in rows}
+
+def run_intraday_ingestion(provider=None, tickers=None):
+    init_db()
+    provider = provider or get_provider()
+    if tickers is None:
+        session = Session()
+        tickers = [r.ticker for r in session.query(ThemeTicker).distinct(ThemeTicker.ticker).all()]
+        session.close()
+
+    # Refetch each ticker's last stored session in full, new tickers get the retention window
+    by_start = {}
+    last = last_sessions()
+    for ticker in tickers:
+        by_start.setdefault(last.get(ticker), []).append(ticker)
+
+    saved = 0
+    for start, group in by_start.items():
+        if start:
+            print(f"Updating intraday bars for {len(group)} tickers from {start}...")
+            data = provider.fetch(group, start=start, interval=BASE_TF)
+        else:
+            print(f"Initial intraday fetch for {len(group)} tickers ({INITIAL_PERIOD})...")
+            data = provider.fetch(group, period=INITIAL_PERIOD, interval=BASE_TF)
+        saved += save_intraday(aggregate_intraday(long_bars(data)))
+
+    pruned = prune_intraday()
+    print(f"Saved {saved} intraday bars, pruned {pruned} older than {RETENTION_DAYS} days")
+    return saved
+
+def load_intraday(tickers=None, timeframes=None):
+    """Intraday bars in engine.load_ohlcv format (bar start in 'date'), sorted by symbol, timeframe, date."""
+    session = Session()
+    try:
+        query = session.query(
+            IntradayOHLCV.symbol, IntradayOHLCV.timeframe, IntradayOHLCV.timestamp.label('date'),
+            IntradayOHLCV.open, IntradayOHLCV.high, IntradayOHLCV.low, IntradayOHLCV.close, IntradayOHLCV.volume
+        )
+        if tickers is not None:
+            query = query.filter(IntradayOHLCV.symbol.in_(list(tickers)))
+        if timeframes is not None:
+            query = query.filter(IntradayOHLCV.timeframe.in_(list(timeframes)))
+        query = query.order_by(IntradayOHLCV.symbol, IntradayOHLCV.timeframe, IntradayOHLCV.timestamp)
+        df = pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+    df['candle'] = float('nan') # Classified by the engine
+    return df
+
+def run_intraday_scan(tickers=None):
+    """Scan with intraday timeframes and replace today's intraday alerts."""
+    from engine import run_scan_universe
+    from populate_alerts import get_spy_data, clear_alerts, save_alerts
+    if tickers is None:
+        session = Session()
+        tickers = [r.ticker for r in session.query(ThemeTicker).distinct(ThemeTicker.ticker).all()]
+        session.close()
+
+    alerts = run_scan_universe(tickers, get_spy_data(), intraday=True)
+    frame = alerts.to_frame()
+    alerts = AlertBatch.from_frame(frame[frame['timeframe'].isin(INTRADAY_TFS).to_numpy()])
+
+    cleared = clear_alerts(datetime.now().date(), tickers, timeframes=INTRADAY_TFS)
+    saved = save_alerts(alerts) or 0
+    print(f"Intraday scan: cleared {cleared}, saved {saved} alerts")
+    return alerts
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    run_intraday_ingestion(get_provider(args[0]) if args else None)
+    if '--scan' in sys.argv:
+        run_intraday_scan()
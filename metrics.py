@@ -0,0 +1,193 @@
+"""
+Incrementally maintained per-ticker rolling metrics (ticker_metrics table):
+14-day ADR %, 20-day average dollar volume and 63-day (3-month) return.
+
+Ingestion folds each new daily bar into a RollingMetrics state in O(1):
+running sums for the ADR and dollar-volume windows plus a buffer of the
+last LOOKBACK bars, stored as JSON next to the metric values. Re-fetching
+the current (still open) daily bar replaces it instead of appending it.
+"""
+import json
+from collections import deque
+from datetime import date as date_type
+import pandas as pd
+from sqlalchemy import insert
+from database import Session, OHLCV, Ticker, TIMEFRAME_IDS, TickerMetric, init_db, ohlcv_query
+
+ADR_WINDOW = 14
+ADV_WINDOW = 20
+PERF_WINDOW = 63
+LOOKBACK = max(ADR_WINDOW, ADV_WINDOW, PERF_WINDOW)
+
+class RollingMetrics:
+    __slots__ = ('dates', 'ranges', 'dollar_vols', 'closes', 'range_sum', 'dollar_vol_sum')
+
+    def __init__(self):
+        self.dates = deque(maxlen=LOOKBACK)
+        self.ranges = deque(maxlen=LOOKBACK)
+        self.dollar_vols = deque(maxlen=LOOKBACK)
+        self.closes = deque(maxlen=LOOKBACK)
+        self.range_sum = 0.0
+        self.dollar_vol_sum = 0.0
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def push(self, date, high, low, close, volume):
+        """Fold one daily bar in. A bar with the last bar's date replaces it."""
+        if self.dates and date < self.dates[-1]:
+            raise ValueError(f"bar {date} is older than state {self.dates[-1]}")
+        if self.dates and date == self.dates[-1]:
+            self._pop()
+
+        n = len(self.ranges)
+        # Values leaving the ADR/ADV windows (the buffer itself is longer)
+        if n >= ADR_WINDOW:
+            self.range_sum -= self.ranges[-ADR_WINDOW]
+        if n >= ADV_WINDOW:
+            self.dollar_vol_sum -= self.dollar_vols[-ADV_WINDOW]
+
+        self.dates.append(date)
+        self.ranges.append(high - low)
+        self.dollar_vols.append(close * volume)
+        self.closes.append(close)
+        self.range_sum += high - low
+        self.dollar_vol_sum += close * volume
+
+    def _pop(self):
+        # Undo the last push, bringing back the values it pushed out of the windows
+        n = len(self.ranges)
+        self.range_sum -= self.ranges[-1]
+        self.dollar_vol_sum -= self.dollar_vols[-1]
+        if n > ADR_WINDOW:
+            self.range_sum += self.ranges[-ADR_WINDOW - 1]
+        if n > ADV_WINDOW:
+            self.dollar_vol_sum += self.dollar_vols[-ADV_WINDOW - 1]
+        self.dates.pop()
+        self.ranges.pop()
+        self.dollar_vols.pop()
+        self.closes.pop()
+
+    def values(self):
+        n = len(self.closes)
+        close = self.closes[-1] if n else None
+        adr = 0
+        if n >= ADR_WINDOW and close and close > 0:
+            adr = (self.range_sum / ADR_WINDOW / close) * 100
+        avg_dollar_volume = self.dollar_vol_sum / ADV_WINDOW if n >= ADV_WINDOW else 0
+        perf_3m = None
+        if n >= PERF_WINDOW and self.closes[-PERF_WINDOW]:
+            perf_3m = ((close / self.closes[-PERF_WINDOW]) - 1) * 100
+        return {"date": self.last_date, "close": close, "adr": adr,
+                "avg_dollar_volume": avg_dollar_volume, "perf_3m": perf_3m}
+
+    def to_json(self):
+        return json.dumps({
+            "dates": [d.isoformat() for d in self.dates],
+            "ranges": list(self.ranges),
+            "dollar_vols": list(self.dollar_vols),
+            "closes": list(self.closes),
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        state = cls()
+        state.dates.extend(date_type.fromisoformat(d) for d in data["dates"])
+        state.ranges.extend(data["ranges"])
+        state.dollar_vols.extend(data["dollar_vols"])
+        state.closes.extend(data["closes"])
+        state.range_sum = sum(list(state.ranges)[-ADR_WINDOW:])
+        state.dollar_vol_sum = sum(list(state.dollar_vols)[-ADV_WINDOW:])
+        return state
+
+    @classmethod
+    def from_bars(cls, df):
+        """Build from daily bars with date/high/low/close/volume columns, sorted by date."""
+        state = cls()
+        for row in df.tail(LOOKBACK).itertuples(index=False):
+            state.push(row.date, row.high, row.low, row.close, row.volume)
+        return state
+
+def _daily_bars(session, symbols=None, limit=LOOKBACK):
+    query = ohlcv_query(session, Ticker.symbol, OHLCV.date, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume).filter(
+        OHLCV.timeframe_id == TIMEFRAME_IDS['1D']
+    )
+    if symbols is not None:
+        query = query.filter(Ticker.symbol.in_(list(symbols)))
+    df = pd.read_sql(query.order_by(Ticker.symbol, OHLCV.date).statement, session.bind)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    return df.groupby('symbol', sort=False).tail(limit)
+
+def _write(session, symbol, state, row=None):
+    values = dict(state.values(), state=state.to_json())
+    if row is None:
+        session.execute(insert(TickerMetric), [dict(values, symbol=symbol)])
+    else:
+        for key, value in values.items():
+            setattr(row, key, value)
+
+def update_ticker_metrics(symbol, df_daily):
+    """
+    Fold newly fetched daily bars (yfinance frame: Date index, High/Low/Close/Volume)
+    into a ticker's metrics. Rebuilds from stored 1D bars when there is no state
+    or the fetch starts before the stored window ends (a correction).
+    """
+    session = Session()
+    try:
+        row = session.query(TickerMetric).filter_by(symbol=symbol).first()
+        state = RollingMetrics.from_json(row.state) if row is not None and row.state else None
+
+        bars = [(ts.date(), r['High'], r['Low'], r['Close'], r['Volume']) for ts, r in df_daily.sort_index().iterrows()]
+        if state is None or (bars and state.last_date and bars[0][0] < state.last_date):
+            state = RollingMetrics.from_bars(_daily_bars(session, [symbol]))
+        else:
+            for bar in bars:
+                state.push(*bar)
+
+        _write(session, symbol, state, row)
+        session.commit()
+    except Exception as e:
+        print(f"Error updating metrics for {symbol}: {e}")
+        session.rollback()
+    finally:
+        session.close()
+
+def load_ticker_metrics(symbols=None, session=None):
+    """ticker_metrics values as a DataFrame indexed by symbol (read through `session` if given)."""
+    own_session = session is None
+    session = session or Session()
+    try:
+        query = session.query(
+            TickerMetric.symbol, TickerMetric.date, TickerMetric.close,
+            TickerMetric.adr, TickerMetric.avg_dollar_volume, TickerMetric.perf_3m
+        )
+        if symbols is not None:
+            query = query.filter(TickerMetric.symbol.in_(list(symbols)))
+        df = pd.read_sql(query.statement, session.bind)
+    finally:
+        if own_session:
+            session.close()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    return df.set_index('symbol')
+
+def rebuild_ticker_metrics(symbols=None):
+    """Recompute ticker_metrics from stored 1D bars (backfill or repair)."""
+    init_db()
+    session = Session()
+    try:
+        daily = _daily_bars(session, symbols)
+        existing = {r.symbol: r for r in session.query(TickerMetric).all()}
+        for symbol, df in daily.groupby('symbol', sort=False):
+            _write(session, symbol, RollingMetrics.from_bars(df), existing.get(symbol))
+        session.commit()
+        print(f"Rebuilt metrics for {daily['symbol'].nunique()} tickers.")
+    except Exception as e:
+        print(f"Error rebuilding ticker metrics: {e}")
+        session.rollback()
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    rebuild_ticker_metrics()
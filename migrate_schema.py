@@ -0,0 +1,140 @@
+"""
+Migrate ohlcv from the symbol/timeframe string layout to integer keys:
+a tickers lookup table and a (ticker_id, timeframe_id, date) primary key,
+so each ticker's series is one contiguous, date-ordered range of the table
+(a WITHOUT ROWID table on SQLite, CLUSTERed on PostgreSQL). Also creates
+the alerts index used by the API's latest-alerts filter and, on PostgreSQL,
+partitions alerts by date for alert_archive.py. Safe to rerun: finished
+steps are skipped.
+
+Representative queries are timed before and after the migration.
+
+Usage: python migrate_schema.py [<benchmark ticker>]
+"""
+import sys
+import time
+from sqlalchemy import inspect, text
+from database import Base, TIMEFRAME_IDS, engine, init_db, legacy_ohlcv
+
+ROUNDS = 3 # Best of ROUNDS per timed query
+
+def legacy_candle(prefix=''):
+    """Candle column of the legacy ohlcv table, NULL on databases created before it existed."""
+    columns = {c['name'] for c in inspect(engine).get_columns('ohlcv')}
+    return f'{prefix}candle' if 'candle' in columns else 'NULL'
+
+def benchmark_queries(legacy, ticker):
+    """Representative read queries for the given ohlcv layout: {name: SQL}."""
+    daily = TIMEFRAME_IDS['1D']
+    if legacy:
+        ohlcv = {
+            'ticker 1D history': f"SELECT date, open, high, low, close, volume FROM ohlcv WHERE symbol = '{ticker}' AND timeframe = '1D' ORDER BY date",
+            'universe load': f"SELECT symbol, timeframe, date, open, high, low, close, volume, {legacy_candle()} FROM ohlcv ORDER BY symbol, timeframe, date",
+            'last 1D per ticker': "SELECT symbol, max(date) FROM ohlcv WHERE timeframe = '1D' GROUP BY symbol",
+        }
+    else:
+        ohlcv = {
+            'ticker 1D history': f"SELECT o.date, o.open, o.high, o.low, o.close, o.volume FROM ohlcv o JOIN tickers t ON t.id = o.ticker_id WHERE t.symbol = '{ticker}' AND o.timeframe_id = {daily} ORDER BY o.date",
+            'universe load': "SELECT t.symbol, o.timeframe_id, o.date, o.open, o.high, o.low, o.close, o.volume, o.candle FROM ohlcv o JOIN tickers t ON t.id = o.ticker_id ORDER BY t.symbol, o.timeframe_id, o.date",
+            'last 1D per ticker': f"SELECT t.symbol, max(o.date) FROM ohlcv o JOIN tickers t ON t.id = o.ticker_id WHERE o.timeframe_id = {daily} GROUP BY t.symbol",
+        }
+    if not inspect(engine).has_table('alerts'):
+        return ohlcv
+    ohlcv['api latest alerts'] = (
+        "SELECT * FROM alerts WHERE date = (SELECT max(date) FROM alerts) AND is_theme = 0 "
+        "AND timeframe IN ('1D', '1W', '1M') ORDER BY date DESC, id DESC"
+    )
+    return ohlcv
+
+def database_size():
+    """Database size in MB (file size on SQLite)."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            pages = conn.execute(text("PRAGMA page_count")).scalar()
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            return pages * page_size / 1e6
+        return conn.execute(text("SELECT pg_database_size(current_database())")).scalar() / 1e6
+
+def run_benchmark(legacy, ticker):
+    timings = {}
+    with engine.connect() as conn:
+        for name, sql in benchmark_queries(legacy, ticker).items():
+            best = None
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                rows = len(conn.execute(text(sql)).fetchall())
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = (best, rows)
+    return timings
+
+def report(before, after, size_before, size_after):
+    print(f"\n{'query':<20} {'before':>10} {'after':>10} {'rows':>10}")
+    for name, (secs, rows) in before.items():
+        new_secs, new_rows = after[name]
+        print(f"{name:<20} {secs * 1000:8.1f}ms {new_secs * 1000:8.1f}ms {new_rows:>10}")
+    print(f"{'database size':<20} {size_before:8.1f}MB {size_after:8.1f}MB")
+
+def migrate_ohlcv():
+    """Copy ohlcv into the integer-keyed layout in one transaction."""
+    dialect = engine.dialect.name
+    timeframe_case = " ".join(f"WHEN '{tf}' THEN {i}" for tf, i in TIMEFRAME_IDS.items())
+    candle = legacy_candle('o.')
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE ohlcv RENAME TO ohlcv_old"))
+        if dialect == 'postgresql':
+            # The new table's primary key constraint takes this name
+            conn.execute(text("ALTER INDEX IF EXISTS ohlcv_pkey RENAME TO ohlcv_old_pkey"))
+        Base.metadata.create_all(conn)
+
+        conn.execute(text(
+            "INSERT INTO tickers (symbol) SELECT DISTINCT symbol FROM ohlcv_old "
+            "WHERE symbol IS NOT NULL AND symbol NOT IN (SELECT symbol FROM tickers) ORDER BY symbol"
+        ))
+        # Inserted in key order, so the new table is written sequentially
+        moved = conn.execute(text(
+            "INSERT INTO ohlcv (ticker_id, timeframe_id, date, open, high, low, close, volume, candle) "
+            f"SELECT t.id, CASE o.timeframe {timeframe_case} END, o.date, o.open, o.high, o.low, o.close, o.volume, {candle} "
+            "FROM ohlcv_old o JOIN tickers t ON t.symbol = o.symbol "
+            f"WHERE o.date IS NOT NULL AND o.timeframe IN ({', '.join(repr(tf) for tf in TIMEFRAME_IDS)}) "
+            "ORDER BY t.id, 2, o.date"
+        )).rowcount
+        conn.execute(text("DROP TABLE ohlcv_old"))
+    print(f"Moved {moved} bars to the integer-keyed ohlcv table")
+
+def compact():
+    """Reclaim the old table's space and refresh planner statistics."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == 'sqlite':
+            conn.execute(text("VACUUM"))
+        else:
+            conn.execute(text("CLUSTER ohlcv USING ohlcv_pkey"))
+        conn.execute(text("ANALYZE"))
+
+def partition_alerts():
+    """PostgreSQL: convert alerts to the date-partitioned table alert_archive.py maintains."""
+    from alert_archive import ensure_partitioned
+    ensure_partitioned()
+
+def main(ticker='SPY'):
+    engine.echo = False
+    if not legacy_ohlcv():
+        print("ohlcv already uses the integer-keyed layout")
+        init_db()
+        partition_alerts()
+        return
+
+    size_before = database_size()
+    before = run_benchmark(True, ticker)
+
+    start = time.perf_counter()
+    migrate_ohlcv()
+    init_db() # Missing indexes on existing tables (alerts)
+    compact()
+    print(f"Migrated in {time.perf_counter() - start:.1f}s")
+
+    report(before, run_benchmark(False, ticker), size_before, database_size())
+    partition_alerts()
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
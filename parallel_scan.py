@@ -0,0 +1,54 @@
+"""
+Parallel universe scan: splits the ticker list into chunks and runs
+run_scan_universe on each chunk in a process pool.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import database
+from alert_batch import AlertBatch
+from engine import run_scan_universe
+from populate_alerts import get_spy_data
+
+# SPY frames for RS, loaded once per worker process by _init_worker
+_spy_data = None
+
+def _init_worker():
+    global _spy_data
+    # Pooled connections inherited from the parent must not be reused here
+    database.engine.dispose(close=False)
+    _spy_data = get_spy_data()
+
+def _scan_chunk(tickers):
+    return run_scan_universe(tickers, _spy_data)
+
+def chunk_tickers(tickers, chunk_size):
+    return [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+def run_scan_parallel(tickers, workers=None, chunk_size=250, progress=None, failed=None):
+    """
+    Scan tickers across a process pool and return one AlertBatch for a batched write.
+    progress(done, total) is called as each chunk finishes. Tickers of chunks
+    that raised are appended to `failed`.
+    """
+    tickers = list(tickers)
+    if not tickers: return AlertBatch.empty()
+
+    workers = workers or os.cpu_count() or 1
+    chunks = chunk_tickers(tickers, chunk_size)
+
+    batches = []
+    done = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker) as pool:
+        futures = {pool.submit(_scan_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                batches.append(future.result())
+            except Exception as e:
+                print(f"Error scanning chunk {chunk[0]}..{chunk[-1]}: {e}")
+                if failed is not None:
+                    failed.extend(chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, len(tickers))
+    return AlertBatch.concat(batches)
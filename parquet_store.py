@@ -0,0 +1,180 @@
+"""
+Columnar OHLCV store: Parquet files partitioned by timeframe and symbol
+bucket, <root>/<timeframe>/bucket=<nn>.parquet, each sorted by symbol and
+date.
+
+With PARQUET_STORE=<dir> set, ingestion writes bars here as well as to the
+ohlcv table, and engine.load_ohlcv (scans, backtests, historical scans)
+reads whole columns from memory-mapped files instead of decoding rows
+through SQL. The ohlcv table stays the system of record for everything
+else. Candle codes are not stored; the engine classifies bars without one.
+
+Writes are buffered per ticker and merged into the partitions they touch on
+flush(), so one ingestion rewrites each partition file once.
+
+Usage: python parquet_store.py export <dir>   # build the store from ohlcv
+       python parquet_store.py bench <dir>    # time SQL vs Parquet universe loads
+"""
+import os
+import sys
+import threading
+import time
+import zlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PARQUET_STORE = os.getenv("PARQUET_STORE")
+BUCKETS = int(os.getenv("PARQUET_BUCKETS", "16"))
+FLUSH_ROWS = 500000 # Buffered rows that trigger a flush during ingestion
+
+COLUMNS = ['symbol', 'date', 'open', 'high', 'low', 'close', 'volume']
+SCHEMA = pa.schema([
+    ('symbol', pa.string()),
+    ('date', pa.date32()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+])
+
+def symbol_bucket(symbol):
+    # crc32 rather than hash(): stable across processes
+    return zlib.crc32(symbol.encode()) % BUCKETS
+
+class ParquetStore:
+    def __init__(self, root):
+        self.root = root
+        self.pending = [] # (symbol, {tf: frame}, {tf: replace-from timestamp})
+        self.pending_rows = 0
+        self.lock = threading.Lock()
+
+    def _path(self, timeframe, bucket):
+        return os.path.join(self.root, timeframe, f"bucket={bucket:02d}.parquet")
+
+    def timeframes(self):
+        if not os.path.isdir(self.root): return []
+        return sorted(os.listdir(self.root))
+
+    def append(self, symbol, aggs, replace_from=None):
+        """Queue a ticker's bars (ingest.aggregate_data format), flushing once enough are buffered."""
+        with self.lock:
+            self.pending.append((symbol, aggs, replace_from or {}))
+            self.pending_rows += sum(len(df) for df in aggs.values())
+            if self.pending_rows < FLUSH_ROWS: return
+        self.flush()
+
+    def flush(self):
+        """Merge buffered bars into their partitions, rewriting each touched file once."""
+        with self.lock:
+            pending, self.pending, self.pending_rows = self.pending, [], 0
+            if not pending: return 0
+
+            parts = {} # (tf, bucket) -> [new rows frames], [(symbol, first replaced date)]
+            for symbol, aggs, replace_from in pending:
+                bucket = symbol_bucket(symbol)
+                for tf, df in aggs.items():
+                    if df is None or df.empty: continue
+                    frame = df[['Open', 'High', 'Low', 'Close', 'Volume']].dropna(subset=['Open', 'High', 'Low', 'Close'])
+                    frame = pd.DataFrame({
+                        'symbol': symbol, 'date': frame.index.date,
+                        'open': frame['Open'].to_numpy(), 'high': frame['High'].to_numpy(), 'low': frame['Low'].to_numpy(),
+                        'close': frame['Close'].to_numpy(), 'volume': frame['Volume'].fillna(0).to_numpy(),
+                    })
+                    new, replaced = parts.setdefault((tf, bucket), ([], []))
+                    new.append(frame)
+                    if tf in replace_from:
+                        replaced.append((symbol, replace_from[tf].date()))
+
+            for (tf, bucket), (new, replaced) in parts.items():
+                self._merge(tf, bucket, pd.concat(new, ignore_index=True), replaced)
+            return len(pending)
+
+    def _merge(self, tf, bucket, new, replaced):
+        path = self._path(tf, bucket)
+        if os.path.exists(path):
+            old = pq.read_table(path, memory_map=True).to_pandas()
+            # Bars superseded by rebuilt ones with a different date (see ingest.aggregate_incremental)
+            for symbol, start in replaced:
+                old = old[~((old['symbol'] == symbol) & (old['date'] >= start))]
+            merged = pd.concat([old, new], ignore_index=True)
+        else:
+            merged = new
+        # New bars win over stored ones with the same (symbol, date)
+        merged = merged.drop_duplicates(['symbol', 'date'], keep='last').sort_values(['symbol', 'date'], ignore_index=True)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(merged[COLUMNS], schema=SCHEMA, preserve_index=False), tmp)
+        os.replace(tmp, path)
+
+    def load(self, tickers=None, timeframes=None):
+        """engine.load_ohlcv from the store: sorted by symbol, timeframe, date, candle left NULL."""
+        buckets = range(BUCKETS) if tickers is None else sorted({symbol_bucket(s) for s in tickers})
+        filters = None if tickers is None else [('symbol', 'in', list(tickers))]
+        tables = []
+        for tf in timeframes or self.timeframes():
+            for bucket in buckets:
+                path = self._path(tf, bucket)
+                if not os.path.exists(path): continue
+                table = pq.read_table(path, memory_map=True, filters=filters)
+                tables.append(table.append_column('timeframe', pa.array([tf] * table.num_rows, pa.string())))
+        if not tables:
+            return pd.DataFrame(columns=['symbol', 'timeframe', 'date', 'open', 'high', 'low', 'close', 'volume', 'candle'])
+
+        df = pa.concat_tables(tables).to_pandas()
+        df['candle'] = float('nan')
+        df = df[['symbol', 'timeframe', 'date', 'open', 'high', 'low', 'close', 'volume', 'candle']]
+        return df.sort_values(['symbol', 'timeframe', 'date'], ignore_index=True)
+
+_store = None
+
+def get_store():
+    """The PARQUET_STORE store, or None when the store is disabled."""
+    global _store
+    if PARQUET_STORE and _store is None:
+        _store = ParquetStore(PARQUET_STORE)
+    return _store
+
+def export_store(root):
+    """Build the store from every bar in the ohlcv table."""
+    from database import Session, OHLCV, Ticker, OHLCV_TIMEFRAME, ohlcv_query
+    session = Session()
+    try:
+        query = ohlcv_query(
+            session, Ticker.symbol, OHLCV_TIMEFRAME.label('timeframe'), OHLCV.date,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume
+        ).order_by(OHLCV.timeframe_id, Ticker.symbol, OHLCV.date)
+        df = pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+    store = ParquetStore(root)
+    df['bucket'] = [symbol_bucket(s) for s in df['symbol']]
+    for (tf, bucket), part in df.groupby(['timeframe', 'bucket'], sort=False):
+        path = store._path(tf, bucket)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = part[COLUMNS].sort_values(['symbol', 'date'], ignore_index=True)
+        pq.write_table(pa.Table.from_pandas(part, schema=SCHEMA, preserve_index=False), path)
+    print(f"Exported {len(df)} bars ({df['symbol'].nunique()} symbols) to {root}")
+
+def bench(root):
+    from engine import load_ohlcv
+    global PARQUET_STORE, _store
+    PARQUET_STORE, _store = None, None # load_ohlcv from SQL
+    start = time.perf_counter()
+    sql = load_ohlcv()
+    sql_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columnar = ParquetStore(root).load()
+    parquet_secs = time.perf_counter() - start
+    print(f"SQL:     {len(sql)} bars in {sql_secs:.2f}s")
+    print(f"Parquet: {len(columnar)} bars in {parquet_secs:.2f}s")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "bench"):
+        print(__doc__)
+        sys.exit(1)
+    {"export": export_store, "bench": bench}[sys.argv[1]](sys.argv[2])
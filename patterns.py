@@ -0,0 +1,163 @@
+"""
+Strat pattern registry.
+
+Each pattern is declared as a sequence of candle-state groups (oldest bar
+first, ending at the current bar) plus optional shape checks on the current
+bar. compile_patterns() turns every state group into a boolean lookup table
+over candle codes, so a pattern is evaluated for every ticker and timeframe
+at once by indexing the code columns of a latest_bars frame.
+
+To add a pattern, add an entry to PATTERNS. Nothing else changes at scan time.
+"""
+import numpy as np
+import pandas as pd
+from engine import CANDLE_STATES
+
+# Structural candle groups (ignoring color)
+UP = ('2u', '2uR')
+DOWN = ('2d', '2dG')
+OUTSIDE = ('3u', '3d')
+INSIDE = ('1',)
+
+# latest_bars columns holding the last three candle codes, oldest first
+STATE_COLUMNS = ['state_prev2', 'state_prev', 'state']
+
+def hammer(open_, high, low, close):
+    # Lower wick >= 2 * body, upper wick <= body (see engine.is_hammer)
+    body = np.abs(close - open_)
+    lower_wick = np.minimum(close, open_) - low
+    upper_wick = high - np.maximum(close, open_)
+    return (high - low != 0) & (lower_wick >= 2 * body) & (upper_wick <= body)
+
+def shooter(open_, high, low, close):
+    # Upper wick >= 2 * body, lower wick <= body (see engine.is_shooter)
+    body = np.abs(close - open_)
+    lower_wick = np.minimum(close, open_) - low
+    upper_wick = high - np.maximum(close, open_)
+    return (high - low != 0) & (upper_wick >= 2 * body) & (lower_wick <= body)
+
+SHAPES = {
+    'hammer': hammer,
+    'shooter': shooter,
+}
+
+# type:    Alert.type ("{tf}" is replaced by the timeframe)
+# states:  candle-state groups, oldest first, last one is the current bar
+# shape:   optional SHAPES key checked on the current bar
+# pattern: Alert.pattern - 'pair' (prev-curr), 'triple' (prev2-prev-curr),
+#          'state' (curr) or a literal string
+# status:  "In Force" (signal) or "Setup" (actionable next)
+# bias:    expected direction (1 bullish, -1 bearish, 0 neutral), used by backtests
+PATTERNS = [
+    # --- In Force ---
+    # Failed 2s: the bar broke one side of the prior bar but closed against it
+    {"type": "2d Green {tf}", "states": [('2dG',)], "pattern": "pair", "status": "In Force", "bias": 1},
+    {"type": "2u Red {tf}", "states": [('2uR',)], "pattern": "pair", "status": "In Force", "bias": -1},
+
+    # 2-2 Reversals
+    {"type": "Rev Strat (2d-2u)", "states": [DOWN, UP], "pattern": "pair", "status": "In Force", "bias": 1},
+    {"type": "Rev Strat (2u-2d)", "states": [UP, DOWN], "pattern": "pair", "status": "In Force", "bias": -1},
+
+    # 2-2 Continuations (a failed 2 on the current bar is not a continuation, see above)
+    {"type": "2-2 Bullish Continuation", "states": [UP, ('2u',)], "pattern": "pair", "status": "In Force", "bias": 1},
+    {"type": "2-2 Bearish Continuation", "states": [DOWN, ('2d',)], "pattern": "pair", "status": "In Force", "bias": -1},
+
+    # 2-1-2 Reversals
+    {"type": "2-1-2 Bullish", "states": [DOWN, INSIDE, UP], "pattern": "triple", "status": "In Force", "bias": 1},
+    {"type": "2-1-2 Bearish", "states": [UP, INSIDE, DOWN], "pattern": "triple", "status": "In Force", "bias": -1},
+
+    # 3-1-2 Reversals
+    {"type": "3-1-2 Bullish", "states": [OUTSIDE, INSIDE, UP], "pattern": "triple", "status": "In Force", "bias": 1},
+    {"type": "3-1-2 Bearish", "states": [OUTSIDE, INSIDE, DOWN], "pattern": "triple", "status": "In Force", "bias": -1},
+
+    # --- Setup ---
+    {"type": "Inside Bar", "states": [INSIDE], "pattern": "state", "status": "Setup", "bias": 0},
+    {"type": "Hammer", "states": [], "shape": "hammer", "pattern": "Hammer", "status": "Setup", "bias": 1},
+    {"type": "Shooter", "states": [], "shape": "shooter", "pattern": "Shooter", "status": "Setup", "bias": -1},
+]
+
+def compile_patterns(patterns):
+    """Attach a candle-code lookup table to every state group of each pattern."""
+    compiled = []
+    for spec in patterns:
+        states = spec.get("states", [])
+        if len(states) > len(STATE_COLUMNS):
+            raise ValueError(f"{spec['type']}: at most {len(STATE_COLUMNS)} candle states are supported")
+        for group in states:
+            unknown = set(group) - set(CANDLE_STATES)
+            if unknown:
+                raise ValueError(f"{spec['type']}: unknown candle states {sorted(unknown)}")
+        if spec.get("shape") and spec["shape"] not in SHAPES:
+            raise ValueError(f"{spec['type']}: unknown shape {spec['shape']}")
+
+        tables = [np.isin(CANDLE_STATES, group) for group in states]
+        columns = STATE_COLUMNS[len(STATE_COLUMNS) - len(states):]
+        compiled.append(dict(spec, tables=list(zip(columns, tables))))
+    return compiled
+
+COMPILED_PATTERNS = compile_patterns(PATTERNS)
+
+def pattern_masks(frame, compiled=None):
+    """
+    Yield (order, spec, mask) for every compiled pattern over a frame with
+    STATE_COLUMNS and open/high/low/close columns. Works on latest_bars
+    frames as well as full-history frames (engine.history_bars).
+    """
+    compiled = COMPILED_PATTERNS if compiled is None else compiled
+    codes = {c: frame[c].to_numpy() for c in STATE_COLUMNS}
+    prices = [frame[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low', 'close')]
+    shapes = {}
+
+    for order, spec in enumerate(compiled):
+        mask = np.ones(len(frame), dtype=bool)
+        for column, table in spec["tables"]:
+            mask &= table[codes[column]]
+        if spec.get("shape"):
+            if spec["shape"] not in shapes:
+                shapes[spec["shape"]] = SHAPES[spec["shape"]](*prices)
+            mask &= shapes[spec["shape"]]
+        yield order, spec, mask
+
+def pattern_name(spec):
+    """Registry name without the timeframe placeholder, e.g. '2d Green'."""
+    return spec["type"].replace("{tf}", "").strip()
+
+def match_patterns(latest, compiled=None):
+    """
+    Evaluate compiled patterns over a latest_bars frame.
+    Returns the matching rows with 'type', 'pattern', 'status' and
+    'check_order' (position in the registry) columns added.
+    """
+    empty = latest.iloc[:0].assign(type=[], pattern=[], status=[], check_order=[])
+    if latest.empty: return empty
+
+    labels = np.asarray(CANDLE_STATES, dtype=object)
+    strat = labels[latest['state'].to_numpy()]
+    strat_prev = labels[latest['state_prev'].to_numpy()]
+    strat_prev2 = labels[latest['state_prev2'].to_numpy()]
+    pattern_labels = {
+        'pair': strat_prev + '-' + strat,
+        'triple': strat_prev2 + '-' + strat_prev + '-' + strat,
+        'state': strat,
+    }
+    tf = latest['timeframe'].to_numpy(dtype=object)
+
+    hits = []
+    for order, spec, mask in pattern_masks(latest, compiled):
+        if not mask.any(): continue
+
+        hit = latest[mask].copy()
+        type_ = spec["type"]
+        if "{tf}" in type_:
+            before, after = type_.split("{tf}", 1)
+            hit['type'] = before + tf[mask] + after
+        else:
+            hit['type'] = type_
+        label = pattern_labels.get(spec["pattern"])
+        hit['pattern'] = label[mask] if label is not None else spec["pattern"]
+        hit['status'] = spec["status"]
+        hit['check_order'] = order
+        hits.append(hit)
+
+    if not hits: return empty
+    return pd.concat(hits, ignore_index=True)
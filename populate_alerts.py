@@ -1,88 +1,151 @@
 from database import Session, ThemeTicker, Alert, init_db
-from engine import run_scan
+from engine import run_scan_universe, TFS_ORDER
+from alert_batch import AlertBatch, ALERT_FIELDS
+from sqlalchemy import insert
 from datetime import datetime
+import pandas as pd
+import os
 import sys
 
-def save_alerts(alerts):
+def save_alerts(alerts, chunk_size=5000):
+    """
+    Bulk insert an AlertBatch (or list of alert dicts) under today's date,
+    skipping existing keys. Returns the number saved, None if the save failed.
+    """
+    if not isinstance(alerts, AlertBatch):
+        alerts = AlertBatch.from_frame(pd.DataFrame(list(alerts), columns=list(ALERT_FIELDS)))
     session = Session()
     today = datetime.now().date()
     try:
-        count = 0
-        for a in alerts:
-            # Overwrite or add
-            exists = session.query(Alert).filter_by(
-                date=today, ticker=a['ticker'], type=a['type'], timeframe=a['timeframe']
-            ).first()
-            if not exists:
-                alert = Alert(
-                    date=today, ticker=a['ticker'], type=a['type'], timeframe=a['timeframe'],
-                    price=a['price'], desc=a['desc'], color=0, is_theme=0,
-                    pattern=a['pattern'], change_pct=a['change_pct'], volume=a['volume'],
-                    status=a['status'], candle_state=a['candle_state'], ftfc=a['ftfc'], tto=a.get('tto', 0),
-                    industry=a.get('industry', ''), adr=a.get('adr', 0), gap=a.get('gap', 0),
-                    change_from_open=a.get('change_from_open', 0),
-                    wtd=a.get('wtd', 0), mtd=a.get('mtd', 0), qtd=a.get('qtd', 0), ytd=a.get('ytd', 0),
-                    perf_3m=a.get('perf_3m', 0), avg_dollar_volume=a.get('avg_dollar_volume', 0),
-                    rs_1d=a.get('rs_1d', 0), rs_1w=a.get('rs_1w', 0), rs_1m=a.get('rs_1m', 0), rs_3m=a.get('rs_3m', 0),
-                    prev_cond_1=a.get('prev_cond_1', ''), prev_cond_2=a.get('prev_cond_2', ''), curr_cond=a.get('curr_cond', '')
-                )
-                session.add(alert)
-                count += 1
+        # Skip (ticker, type, timeframe) keys already saved today, and duplicates in the batch
+        keys = ['ticker', 'type', 'timeframe']
+        frame = alerts.to_frame()[keys].astype(str)
+        new = ~frame.duplicated(keys).to_numpy()
+        existing = pd.DataFrame(
+            session.query(Alert.ticker, Alert.type, Alert.timeframe).filter(Alert.date == today).all(),
+            columns=keys
+        )
+        if not existing.empty:
+            seen = frame.merge(existing.drop_duplicates(), on=keys, how='left', indicator=True)['_merge'] == 'both'
+            new &= ~seen.to_numpy()
+        if not new.any(): return 0
+        
+        batch = AlertBatch({name: col[new] for name, col in alerts.columns.items()})
+        for rows in batch.iter_rows(chunk_size, date=today, color=0, is_theme=0):
+            session.execute(insert(Alert), rows)
         session.commit()
-        return count
+        return len(batch)
     except Exception as e:
         print(f"Error saving alerts: {e}")
-        return 0
+        session.rollback()
+        return None
     finally:
         session.close()
 
 def get_spy_data():
-    session = Session()
-    try:
-        from database import OHLCV
-        import pandas as pd
+    from engine import load_ohlcv
+    
+    print("Fetching SPY data for RS calculation...")
+    # load_ohlcv also covers derived higher timeframes (DERIVE_TIMEFRAMES)
+    df_spy_all = load_ohlcv(['SPY'])
+    
+    if df_spy_all.empty:
+        print("WARNING: No SPY data found! RS metrics will be 0.")
+        return {}
         
-        print("Fetching SPY data for RS calculation...")
-        query = session.query(OHLCV).filter_by(symbol='SPY').order_by(OHLCV.date)
-        df_spy_all = pd.read_sql(query.statement, session.bind)
+    spy_data = {}
+    for tf in df_spy_all['timeframe'].unique():
+        spy_data[tf] = df_spy_all[df_spy_all['timeframe'] == tf].copy()
         
-        if df_spy_all.empty:
-            print("WARNING: No SPY data found! RS metrics will be 0.")
-            return {}
-            
-        spy_data = {}
-        for tf in df_spy_all['timeframe'].unique():
-            spy_data[tf] = df_spy_all[df_spy_all['timeframe'] == tf].copy()
-            
-        return spy_data
+    return spy_data
+
+def clear_alerts(date, tickers=None, timeframes=None):
+    """Delete alerts dated `date` (only for `tickers` / `timeframes` if given)."""
+    session = Session()
+    try:
+        query = session.query(Alert).filter(Alert.date == date)
+        if tickers is not None:
+            query = query.filter(Alert.ticker.in_(list(tickers)))
+        if timeframes is not None:
+            query = query.filter(Alert.timeframe.in_(list(timeframes)))
+        deleted = query.delete(synchronize_session=False)
+        session.commit()
+        return deleted
+    except Exception as e:
+        print(f"Error clearing alerts: {e}")
+        session.rollback()
+        return 0
     finally:
         session.close()
 
-def main():
+def scan_tickers(tickers, workers=None, chunk_size=250, progress=None, failed=None):
+    """
+    Scan tickers across SCAN_WORKERS processes (default: one per CPU), or in
+    one process for SCAN_WORKERS=1 or a single chunk. progress(done, total)
+    is called as chunks finish; tickers of failed chunks are appended to
+    `failed`.
+    """
+    workers = workers or int(os.getenv("SCAN_WORKERS", os.cpu_count() or 1))
+    if not tickers:
+        return AlertBatch.empty()
+    if workers > 1 and len(tickers) > chunk_size:
+        from parallel_scan import run_scan_parallel
+        print(f"Scanning in parallel with {workers} workers...")
+        return run_scan_parallel(tickers, workers=workers, chunk_size=chunk_size, progress=progress, failed=failed)
+    # One bulk read and one vectorized pass over the whole universe
+    alerts = run_scan_universe(tickers, get_spy_data())
+    if progress:
+        progress(1, 1)
+    return alerts
+
+def main(workers=None, chunk_size=250, incremental=False):
     print("Initializing DB...")
     init_db()
     
-    # Fetch SPY Data once
-    spy_data = get_spy_data()
-    
     session = Session()
     tickers = [r.ticker for r in session.query(ThemeTicker).distinct(ThemeTicker.ticker).all()]
     session.close()
     
     print(f"Found {len(tickers)} tickers to scan.")
     
+    today = datetime.now().date()
+    unchanged = []
+    if incremental:
+        # Only rescan tickers whose bars changed since the last scan
+        from watermarks import current_watermarks, stored_watermarks, changed_tickers
+        current = current_watermarks()
+        changed = changed_tickers(tickers, current, stored_watermarks())
+        changed_set = set(changed)
+        unchanged = [t for t in tickers if t not in changed_set]
+        print(f"{len(changed)} tickers changed since the last scan, {len(unchanged)} unchanged.")
+        # Intraday alerts are replaced by run_intraday_scan, not by the daily scan
+        deleted = clear_alerts(today, changed, timeframes=TFS_ORDER)
+        print(f"Cleared {deleted} alerts for changed tickers.")
+        tickers = changed
+    
     total_alerts = 0
-    for i, ticker in enumerate(tickers):
-        try:
-            alerts = run_scan(ticker, spy_data)
-            saved = save_alerts(alerts)
-            total_alerts += saved
-            if (i+1) % 10 == 0:
-                print(f"[{i+1}/{len(tickers)}] Scanned {ticker}. Saved {saved} alerts. Total: {total_alerts}")
-        except Exception as e:
-            print(f"Error scanning {ticker}: {e}")
+    try:
+        failed = []
+        alerts = scan_tickers(tickers, workers, chunk_size, failed=failed)
+        print(f"Scanned {len(tickers)} tickers. Found {len(alerts)} alerts.")
+        total_alerts = save_alerts(alerts)
+        
+        if total_alerts is None:
+            # Unsaved tickers keep their old watermarks, so the next run rescans them
+            total_alerts = 0
+        elif incremental:
+            from watermarks import save_watermarks, carry_forward_alerts
+            carried = carry_forward_alerts(unchanged, today)
+            print(f"Carried forward {carried} alerts for unchanged tickers.")
+            # Tickers of failed chunks keep their old watermarks and are rescanned next run
+            failed_set = set(failed)
+            save_watermarks(current, [t for t in tickers if t not in failed_set], today, benchmark=not failed)
+    except Exception as e:
+        print(f"Error scanning universe: {e}")
             
     print(f"Scan complete. Total alerts saved: {total_alerts}")
 
 if __name__ == "__main__":
-    main()
+    # Optional: python populate_alerts.py [<workers>] [--incremental]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    main(workers=int(args[0]) if args else None, incremental='--incremental' in sys.argv)
@@ -0,0 +1,329 @@
+"""
+Market data providers.
+
+A provider fetches bars for many symbols per call and returns them as
+normalized yfinance-style frames: a tz-naive 'Date' index and float
+Open/High/Low/Close/Volume columns, sorted by date, one frame per symbol.
+Symbols without data are left out of the result.
+
+- YahooProvider: batched yf.download requests (grouped tickers, threads).
+  yf.download keeps its results in module globals, so calls are serialized
+  process-wide; concurrent callers (ingest_pipeline) queue on the lock.
+- LocalProvider: one CSV or Parquet file of daily bars per symbol, for
+  offline runs and benchmarks.
+- CachedProvider: on-disk response cache in front of another provider.
+
+get_provider() picks one from a spec string ("yahoo", "local:<dir>"),
+defaulting to the DATA_PROVIDER environment variable. With
+PROVIDER_CACHE_DIR set, Yahoo responses go through a CachedProvider.
+
+Usage: python providers.py export <dir> [parquet|csv]
+    Write the stored 1D bars of every symbol to <dir> for LocalProvider.
+"""
+import os
+import re
+import sys
+import threading
+import pandas as pd
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def normalize_bars(df):
+    """yfinance-style frame (tz-naive Date index, OHLCV floats, sorted, no empty rows) or None."""
+    if df is None or df.empty: return None
+    df = df.rename(columns={c: c.capitalize() for c in df.columns if isinstance(c, str)})
+    if not set(COLUMNS) <= set(df.columns): return None
+    df = df[COLUMNS].astype(float).dropna(subset=['Open', 'High', 'Low', 'Close'])
+    if df.empty: return None
+
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df.index = index.rename('Date')
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    df['Volume'] = df['Volume'].fillna(0)
+    return df
+
+class DataProvider:
+    """Base provider: fetch(symbols, start=None, period=None, interval='1d') -> {symbol: frame}."""
+    def fetch(self, symbols, start=None, period=None, interval="1d"):
+        raise NotImplementedError
+
+    def fetch_one(self, symbol, start=None, period=None, interval="1d"):
+        return self.fetch([symbol], start, period, interval).get(symbol)
+
+class YahooProvider(DataProvider):
+    # yf.download resets and fills module-global result dicts on every call
+    _download_lock = threading.Lock()
+
+    def __init__(self, batch_size=100, threads=True):
+        self.batch_size = batch_size
+        self.threads = threads
+
+    def fetch(self, symbols, start=None, period=None, interval="1d"):
+        import yfinance as yf
+        symbols = list(symbols)
+        bars = {}
+        for i in range(0, len(symbols), self.batch_size):
+            batch = symbols[i:i + self.batch_size]
+            with self._download_lock:
+                data = yf.download(
+                    batch, start=str(start) if start else None, period=None if start else (period or "max"),
+                    interval=interval, group_by='ticker', auto_adjust=True, actions=False,
+                    threads=self.threads, progress=False,
+                )
+            if data is None or data.empty: continue
+
+            for symbol in batch:
+                if isinstance(data.columns, pd.MultiIndex):
+                    if symbol not in data.columns.get_level_values(0): continue
+                    frame = data[symbol]
+                else:
+                    frame = data
+                frame = normalize_bars(frame)
+                if frame is not None:
+                    bars[symbol] = frame
+        return bars
+
+# Local intervals resampled from daily files, labelled the way Yahoo labels them
+RESAMPLE = {
+    '1wk': dict(rule='W-MON', label='left', closed='left'),
+    '1mo': dict(rule='MS'),
+}
+
+def _period_start(last, period):
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period or '')
+    if not match: return None # "max" or unknown: everything
+    n, unit = int(match.group(1)), match.group(2)
+    offset = {'d': pd.DateOffset(days=n), 'wk': pd.DateOffset(weeks=n), 'mo': pd.DateOffset(months=n), 'y': pd.DateOffset(years=n)}[unit]
+    return last - offset
+
+class LocalProvider(DataProvider):
+    """
+    Daily bars from <root>/<SYMBOL>.parquet or <root>/<SYMBOL>.csv (a Date
+    column or index plus OHLCV columns, any case), intraday bars from
+    <root>/<interval>/<SYMBOL>.parquet or .csv. Periods count back from
+    each file's last bar, so old snapshots behave like a live fetch.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _read(self, symbol, interval="1d"):
+        folder = self.root if interval == "1d" else os.path.join(self.root, interval)
+        for ext, reader in (('.parquet', pd.read_parquet), ('.csv', pd.read_csv)):
+            path = os.path.join(folder, symbol + ext)
+            if os.path.exists(path):
+                df = reader(path)
+                date_column = next((c for c in df.columns if str(c).lower() == 'date'), None)
+                if date_column is not None:
+                    df = df.set_index(pd.to_datetime(df.pop(date_column)))
+                return normalize_bars(df)
+        return None
+
+    def fetch(self, symbols, start=None, period=None, interval="1d"):
+        native = interval not in RESAMPLE and os.path.isdir(os.path.join(self.root, interval))
+        if interval != "1d" and interval not in RESAMPLE and not native:
+            raise ValueError(f"LocalProvider does not support interval {interval}")
+        bars = {}
+        for symbol in symbols:
+            df = self._read(symbol, interval if native else "1d")
+            if df is None: continue
+            if start:
+                df = df[df.index >= pd.Timestamp(start)]
+            elif period:
+                first = _period_start(df.index[-1], period)
+                if first is not None:
+                    df = df[df.index > first]
+            if interval in RESAMPLE:
+                spec = dict(RESAMPLE[interval])
+                df = df.resample(spec.pop('rule'), **spec).agg(
+                    {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+                ).dropna()
+            if not df.empty:
+                bars[symbol] = df
+        return bars
+
+PROVIDER_CACHE_DIR = os.getenv("PROVIDER_CACHE_DIR")
+PROVIDER_CACHE_MB = int(os.getenv("PROVIDER_CACHE_MB", "512"))
+PROVIDER_CACHE_TTL = int(os.getenv("PROVIDER_CACHE_TTL", "900")) # Seconds a current-session bar stays fresh
+MARKET_TZ = "America/New_York"
+MARKET_OPEN = pd.Timedelta(hours=9, minutes=30)
+MARKET_CLOSE = pd.Timedelta(hours=16)
+
+def market_session(now):
+    """(close time of the last completed session, whether a session is in progress), holidays ignored."""
+    day = now.normalize()
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    if day == now.normalize() and now < day + MARKET_CLOSE:
+        in_session = now >= day + MARKET_OPEN
+        day -= pd.Timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= pd.Timedelta(days=1)
+        return day + MARKET_CLOSE, in_session
+    return day + MARKET_CLOSE, False
+
+class CachedProvider(DataProvider):
+    """
+    On-disk cache of another provider's responses: one Parquet file per
+    (interval, symbol) holding the bars fetched so far, the start of the date
+    window they cover and when they were fetched.
+
+    Bars of closed sessions never change, so a cached response covering the
+    requested window is reused as is until the next session close. After
+    that, or while a session is open and the cached current-session bar is
+    older than `ttl` seconds, only the tail is fetched again (from the last
+    cached bar) and merged in. Least recently used files are evicted once the
+    cache grows past `max_mb`.
+    """
+    def __init__(self, provider, root, max_mb=PROVIDER_CACHE_MB, ttl=PROVIDER_CACHE_TTL):
+        self.provider = provider
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = pd.Timedelta(seconds=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.root, interval, f"{symbol}.parquet")
+
+    def _read(self, symbol, interval):
+        import pyarrow.parquet as pq
+        path = self._path(symbol, interval)
+        if not os.path.exists(path): return None
+        table = pq.read_table(path)
+        meta = table.schema.metadata or {}
+        window = meta.get(b'window_start', b'').decode() or None
+        fetched_at = pd.Timestamp(meta[b'fetched_at'].decode())
+        os.utime(path) # LRU order for eviction
+        return table.to_pandas(), (pd.Timestamp(window) if window else None), fetched_at
+
+    def _write(self, symbol, interval, df, window, fetched_at):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = self._path(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'window_start': (str(window.date()) if window is not None else '').encode(),
+            b'fetched_at': str(fetched_at).encode(),
+        })
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+
+    def _evict(self):
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes: return
+        for _, size, path in sorted(files):
+            os.remove(path)
+            total -= size
+            if total <= self.max_bytes * 0.9: break
+
+    def fetch(self, symbols, start=None, period=None, interval="1d"):
+        now = pd.Timestamp.now(tz=MARKET_TZ)
+        last_close, in_session = market_session(now)
+        # Requested window start (None: full history), tz-naive like the bars
+        if start:
+            window = pd.Timestamp(start)
+        elif period and period != "max":
+            window = _period_start(now.tz_localize(None).normalize(), period)
+        else:
+            window = None
+
+        bars, windows, missing, tails = {}, {}, [], {}
+        for symbol in symbols:
+            entry = self._read(symbol, interval)
+            if entry is None or (entry[1] is not None and (window is None or entry[1] > window)):
+                missing.append(symbol)
+                continue
+            df, windows[symbol], fetched_at = entry
+            if fetched_at >= last_close and not (in_session and now - fetched_at > self.ttl):
+                self.hits += 1
+                bars[symbol] = df
+            else:
+                # Closed sessions are kept, only the tail from the last cached bar is refreshed
+                tails.setdefault(df.index[-1], []).append(symbol)
+                bars[symbol] = df
+
+        if missing:
+            self.misses += len(missing)
+            fetched = self.provider.fetch(missing, start, period, interval)
+            for symbol, df in fetched.items():
+                self._write(symbol, interval, df, window, now)
+                bars[symbol] = df
+
+        for tail_start, group in tails.items():
+            self.misses += len(group)
+            # Providers fetch whole days: the refetched tail starts at midnight, not at the last bar
+            fetch_start = tail_start.normalize()
+            fetched = self.provider.fetch(group, start=fetch_start.date(), interval=interval)
+            for symbol in group:
+                df = bars[symbol]
+                if symbol in fetched:
+                    df = pd.concat([df[df.index < fetch_start], fetched[symbol]])
+                    df = df[~df.index.duplicated(keep='last')]
+                self._write(symbol, interval, df, windows[symbol], now)
+                bars[symbol] = df
+
+        if missing or tails:
+            self._evict()
+
+        result = {}
+        for symbol in symbols:
+            df = bars.get(symbol)
+            if df is None: continue
+            if window is not None:
+                df = df[df.index >= window] if start else df[df.index > window]
+            if not df.empty:
+                result[symbol] = df
+        return result
+
+def get_provider(spec=None):
+    """Provider from a spec string: 'yahoo' (default) or 'local:<dir>'."""
+    spec = spec or os.getenv("DATA_PROVIDER", "yahoo")
+    if spec == "yahoo":
+        if PROVIDER_CACHE_DIR:
+            return CachedProvider(YahooProvider(), PROVIDER_CACHE_DIR)
+        return YahooProvider()
+    if spec.startswith("local:"):
+        return LocalProvider(spec.split(":", 1)[1])
+    raise ValueError(f"Unknown data provider: {spec}")
+
+def export_local(root, fmt="parquet", tickers=None):
+    """Write stored 1D bars to one file per symbol under root, for LocalProvider."""
+    from database import Session, OHLCV, Ticker, TIMEFRAME_IDS, ohlcv_query
+    session = Session()
+    try:
+        query = ohlcv_query(session, Ticker.symbol, OHLCV.date, OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume).filter(
+            OHLCV.timeframe_id == TIMEFRAME_IDS['1D']
+        )
+        if tickers is not None:
+            query = query.filter(Ticker.symbol.in_(list(tickers)))
+        df = pd.read_sql(query.order_by(Ticker.symbol, OHLCV.date).statement, session.bind)
+    finally:
+        session.close()
+
+    os.makedirs(root, exist_ok=True)
+    df['date'] = pd.to_datetime(df['date'])
+    for symbol, bars in df.groupby('symbol', sort=False):
+        bars = bars.drop(columns='symbol').rename(columns=str.capitalize)
+        path = os.path.join(root, f"{symbol}.{fmt}")
+        if fmt == "parquet":
+            bars.to_parquet(path, index=False)
+        else:
+            bars.to_csv(path, index=False)
+    print(f"Exported {df['symbol'].nunique()} symbols to {root}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "export":
+        print(__doc__)
+        sys.exit(1)
+    export_local(sys.argv[2], *sys.argv[3:4])
@@ -1,8 +1,8 @@
-import yfinance as yf
 import pandas as pd
-from database import Session, Alert, OHLCV
+from database import Session, Alert
 from engine import get_strat_candle, calculate_ftfc, calculate_tto
 from datetime import datetime
+from providers import get_provider
 
 def refresh_ticker(ticker):
     session = Session()
@@ -19,15 +19,12 @@ def refresh_ticker(ticker):
     # We need to fetch daily data and resample
     
     print("Fetching data...")
-    data = yf.download(ticker, period="2y", interval="1d", progress=False)
+    provider = get_provider()
+    data = provider.fetch_one(ticker, period="2y", interval="1d")
     
-    if data.empty:
+    if data is None:
         print("No data found.")
         return
-
-    # Flatten columns if multi-index
-    if isinstance(data.columns, pd.MultiIndex):
-        data.columns = data.columns.get_level_values(0)
     
     # Rename columns to lowercase
     data.columns = [c.lower() for c in data.columns]
@@ -38,9 +35,10 @@ def refresh_ticker(ticker):
     # We need to handle the resampling carefully
     
     # Actually, let's just use yfinance to fetch 1M directly for accuracy check
-    df_1m = yf.download(ticker, period="2y", interval="1mo", progress=False)
-    if isinstance(df_1m.columns, pd.MultiIndex):
-        df_1m.columns = df_1m.columns.get_level_values(0)
+    df_1m = provider.fetch_one(ticker, period="2y", interval="1mo")
+    if df_1m is None:
+        print("No 1M data")
+        return
     df_1m.columns = [c.lower() for c in df_1m.columns]
     
     # Calculate Strat Candle for last few months
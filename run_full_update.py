@@ -1,9 +1,10 @@
 from ingest import run_ingestion
-from populate_alerts import main as run_alerts
-from database import Session, Alert, init_db
+from populate_alerts import main as run_alerts, clear_alerts
+from alert_archive import maintain_alerts
 from datetime import datetime
+import sys
 
-def full_update():
+def full_update(full_rescan=False):
     print("Starting Full System Update...")
     start_time = datetime.now()
     
@@ -11,27 +12,24 @@ def full_update():
     print("\n=== STEP 1: Data Ingestion ===")
     run_ingestion()
     
-    # 2. Clear Alerts for Today (to ensure clean slate)
-    print("\n=== STEP 2: Clearing Old Alerts ===")
-    session = Session()
-    try:
-        today = datetime.now().date()
-        deleted = session.query(Alert).filter(Alert.date == today).delete()
-        session.commit()
+    # 2. Clear Alerts for Today (only on a full rescan; incremental runs
+    #    clear just the tickers whose bars changed)
+    if full_rescan:
+        print("\n=== STEP 2: Clearing Old Alerts ===")
+        deleted = clear_alerts(datetime.now().date())
         print(f"Cleared {deleted} alerts for today.")
-    except Exception as e:
-        print(f"Error clearing alerts: {e}")
-        session.rollback()
-    finally:
-        session.close()
         
     # 3. Generate Alerts
     print("\n=== STEP 3: Alert Generation ===")
-    run_alerts()
+    run_alerts(incremental=not full_rescan)
+    
+    # 4. Archive alerts older than the retention window
+    print("\n=== STEP 4: Alert Retention ===")
+    maintain_alerts()
     
     end_time = datetime.now()
     duration = end_time - start_time
     print(f"\nFull Update Complete in {duration}!")
 
 if __name__ == "__main__":
-    full_update()
+    full_update(full_rescan='--full' in sys.argv)
@@ -1,12 +1,12 @@
 import csv
 import requests
-import yfinance as yf
 import time
 import pandas as pd
 import numpy as np
 from ta.volatility import BollingerBands, KeltnerChannel
 from ta.trend import MACD, EMAIndicator
 from ta.momentum import RSIIndicator
+from providers import get_provider
 
 # Configuration
 UNIVERSE_FILE = '/Users/nigeljohnson/AntiGravity/StratIQ/Themes - Sheet1.csv'
@@ -64,15 +64,16 @@ def calculate_alma(series, window=9, sigma=6, offset=0.85):
     w = w / w.sum()
     return series.rolling(window).apply(lambda x: (x * w).sum(), raw=True)
 
-def check_alerts(ticker):
+def check_alerts(ticker, df_d=None):
     try:
         # Fetch data for multiple timeframes
         # We need Daily, Weekly, Monthly
         # Fetching 1 year of daily data to calculate indicators
-        t = yf.Ticker(ticker)
-        df_d = t.history(period="1y", interval="1d")
+        if df_d is None:
+            df_d = get_provider().fetch_one(ticker, period="1y", interval="1d")
         
-        if len(df_d) < 50: return [] # Not enough data
+        if df_d is None or len(df_d) < 50: return [] # Not enough data
+        df_d = df_d.copy()
 
         # Resample for Weekly and Monthly
         df_w = df_d.resample('W').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last'})
@@ -215,8 +216,11 @@ def main():
     tickers = get_universe()
     print(f"Scanning {len(tickers)} tickers...")
 
+    # One batched download for the whole universe
+    data = get_provider().fetch(tickers, period="1y", interval="1d")
+
     for ticker in tickers:
-        alerts = check_alerts(ticker)
+        alerts = check_alerts(ticker, data.get(ticker))
         for alert in alerts:
             print(f"MATCH: {ticker} - {alert['title']}")
             send_discord_alert(webhook_url, ticker, alert)
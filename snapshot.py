@@ -0,0 +1,117 @@
+"""
+Latest-bars snapshot: the last few bars of every (symbol, timeframe) in the
+latest_bars table, so scans read kilobytes per ticker instead of its whole
+history.
+
+A live scan only looks at the last three candle states and the previous
+close of each timeframe (SNAPSHOT_BARS bars, one more to classify the
+oldest), plus enough daily bars for the ADR / dollar volume / 3-month
+metrics (metrics.LOOKBACK). Candle codes are stored as of the full history.
+
+Ingestion refreshes the snapshot of every ticker it wrote, after the bars
+and candle states are saved. Tickers with no snapshot rows (e.g. a database
+ingested before the table existed) are read in full by load_snapshot.
+
+Usage: python snapshot.py   # rebuild the snapshot of every ticker
+"""
+import os
+import pandas as pd
+from sqlalchemy import func, case, insert
+from database import Session, OHLCV, Ticker, LatestBar, TIMEFRAMES, TIMEFRAME_IDS, ohlcv_query, init_db
+from metrics import LOOKBACK
+
+SCAN_SNAPSHOT = os.getenv("SCAN_SNAPSHOT", "1") == "1" # Scans read latest_bars instead of ohlcv
+SNAPSHOT_BARS = 4 # Bars kept per (symbol, timeframe)
+SNAPSHOT_DAILY_BARS = max(SNAPSHOT_BARS, LOOKBACK) # 1D bars kept, for the daily metrics
+CHUNK = 500 # Symbols refreshed per statement
+
+COLUMNS = ['symbol', 'timeframe', 'date', 'open', 'high', 'low', 'close', 'volume', 'candle']
+
+def _window_bars(session, symbols):
+    """Snapshot rows straight from ohlcv: ROW_NUMBER() over each series, newest first."""
+    rn = func.row_number().over(
+        partition_by=(OHLCV.ticker_id, OHLCV.timeframe_id), order_by=OHLCV.date.desc()
+    ).label('rn')
+    ranked = ohlcv_query(
+        session, Ticker.symbol, OHLCV.timeframe_id, OHLCV.date,
+        OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume, OHLCV.candle, rn
+    ).filter(Ticker.symbol.in_(list(symbols))).subquery()
+    depth = case((ranked.c.timeframe_id == TIMEFRAME_IDS['1D'], SNAPSHOT_DAILY_BARS), else_=SNAPSHOT_BARS)
+    query = session.query(*[c for c in ranked.c if c.name != 'rn']).filter(ranked.c.rn <= depth)
+    df = pd.read_sql(query.statement, session.bind)
+    df['timeframe_id'] = [TIMEFRAMES[i] for i in df['timeframe_id']]
+    return df.rename(columns={'timeframe_id': 'timeframe'})[COLUMNS]
+
+def _tail_bars(symbols):
+    """Snapshot rows from engine.load_ohlcv (Parquet store or derived timeframes), classified in full."""
+    from engine import load_ohlcv, universe_candle_codes
+    df = load_ohlcv(symbols)
+    if df.empty: return df
+    df['candle'] = universe_candle_codes(df)
+    by_series = df.groupby(['symbol', 'timeframe'], sort=False)
+    keep = by_series.cumcount(ascending=False) < df['timeframe'].map(
+        lambda tf: SNAPSHOT_DAILY_BARS if tf == '1D' else SNAPSHOT_BARS
+    )
+    return df[keep.to_numpy()][COLUMNS]
+
+def refresh_snapshot(symbols):
+    """Rebuild the latest_bars rows of the given symbols."""
+    from timeframes import DERIVE_TIMEFRAMES
+    from parquet_store import get_store
+    symbols = sorted(set(symbols))
+    session = Session()
+    try:
+        for i in range(0, len(symbols), CHUNK):
+            chunk = symbols[i:i + CHUNK]
+            if DERIVE_TIMEFRAMES or get_store():
+                bars = _tail_bars(chunk)
+            else:
+                bars = _window_bars(session, chunk)
+            session.query(LatestBar).filter(LatestBar.symbol.in_(chunk)).delete(synchronize_session=False)
+            if not bars.empty:
+                bars = bars.astype(object).where(bars.notna(), None)
+                session.execute(insert(LatestBar), bars.to_dict('records'))
+        session.commit()
+        return len(symbols)
+    except Exception as e:
+        print(f"Error refreshing snapshot: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
+def load_snapshot(tickers=None):
+    """
+    engine.load_ohlcv from latest_bars, sorted by symbol, timeframe, date.
+    Tickers without snapshot rows are read in full with load_ohlcv.
+    """
+    from engine import load_ohlcv
+    session = Session()
+    try:
+        query = session.query(
+            LatestBar.symbol, LatestBar.timeframe, LatestBar.date,
+            LatestBar.open, LatestBar.high, LatestBar.low, LatestBar.close, LatestBar.volume, LatestBar.candle
+        )
+        if tickers is not None:
+            query = query.filter(LatestBar.symbol.in_(list(tickers)))
+        query = query.order_by(LatestBar.symbol, LatestBar.timeframe, LatestBar.date)
+        df = pd.read_sql(query.statement, session.bind)
+        if tickers is None:
+            tickers = [s for (s,) in session.query(Ticker.symbol)]
+    finally:
+        session.close()
+
+    missing = sorted(set(tickers).difference(df['symbol']))
+    if not missing: return df
+    full = load_ohlcv(missing)
+    if df.empty: return full
+    if full.empty: return df
+    df = pd.concat([df, full], ignore_index=True)
+    return df.sort_values(['symbol', 'timeframe'], kind='stable', ignore_index=True)
+
+if __name__ == "__main__":
+    init_db()
+    session = Session()
+    symbols = [s for (s,) in session.query(Ticker.symbol)]
+    session.close()
+    print(f"Refreshed the snapshot of {refresh_snapshot(symbols)} tickers")
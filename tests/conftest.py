@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+
+# database.py picks its engine at import time: point it at a scratch file first
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db():
+    """Empty tables in the current schema."""
+    import database
+    database.Base.metadata.drop_all(database.engine)
+    database.init_db()
+    database._ticker_ids.clear()
+    return database
+
+def make_daily(start="2022-01-03", days=600, seed=0):
+    """Random-walk yfinance-style daily bars on business days."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, periods=days, name='Date')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    open_ = close * np.exp(rng.normal(0, 0.01, days))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, days))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, days))
+    # Some exact ties with the prior bar, to exercise the inside/outside edges
+    high[5::37] = high[4::37][:len(high[5::37])]
+    low[7::41] = low[6::41][:len(low[7::41])]
+    volume = rng.integers(1e5, 1e7, days).astype(float)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+@pytest.fixture
+def daily():
+    return make_daily()
@@ -0,0 +1,51 @@
+from database import Session, OHLCV, Ticker, bulk_upsert
+
+KEYS = ['ticker_id', 'timeframe_id', 'date']
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def rows(daily, ticker_id=1, scale=1.0):
+    return [
+        {"ticker_id": ticker_id, "timeframe_id": 0, "date": ts.date(),
+         "open": r.Open * scale, "high": r.High * scale, "low": r.Low * scale, "close": r.Close * scale, "volume": r.Volume}
+        for ts, r in zip(daily.index, daily.itertuples())
+    ]
+
+def stored(session):
+    return sorted(
+        (r.ticker_id, r.timeframe_id, r.date, r.open, r.high, r.low, r.close, r.volume)
+        for r in session.query(OHLCV)
+    )
+
+def test_bulk_upsert_is_idempotent(db, daily):
+    session = Session()
+    try:
+        session.add(Ticker(id=1, symbol='AAA'))
+        bulk_upsert(session, OHLCV, rows(daily), KEYS, COLUMNS)
+        session.commit()
+        first = stored(session)
+
+        bulk_upsert(session, OHLCV, rows(daily), KEYS, COLUMNS)
+        session.commit()
+        assert stored(session) == first
+        assert len(first) == len(daily)
+    finally:
+        session.close()
+
+def test_bulk_upsert_overwrites_columns_and_keeps_last_duplicate(db, daily):
+    session = Session()
+    try:
+        session.add(Ticker(id=1, symbol='AAA'))
+        bulk_upsert(session, OHLCV, rows(daily), KEYS, COLUMNS)
+        # Overlapping refetch holding the same key twice: the last row wins
+        tail = daily.tail(5)
+        bulk_upsert(session, OHLCV, rows(tail, scale=2.0) + rows(tail, scale=3.0), KEYS, COLUMNS)
+        session.commit()
+
+        result = {r.date: r.close for r in session.query(OHLCV)}
+        assert len(result) == len(daily)
+        for ts, close in tail['Close'].items():
+            assert result[ts.date()] == close * 3.0
+        head = daily.index[0]
+        assert result[head.date()] == daily['Close'].iloc[0]
+    finally:
+        session.close()
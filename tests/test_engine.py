@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from engine import (
+    CANDLE_CODES, FTFC_TFS, TFS_ORDER, classify_candles, classify_pairs, decode_candles,
+    ftfc_from_colors, get_strat_candle, tto_from_colors,
+)
+
+def test_classify_candles_matches_per_row_classifier(daily):
+    df = daily.rename(columns=str.lower)
+    codes = classify_candles(df['high'], df['low'], df['open'], df['close'])
+
+    rows = df.to_dict('records')
+    expected = ['?'] + [get_strat_candle(curr, prev) for prev, curr in zip(rows, rows[1:])]
+    assert list(decode_candles(codes)) == expected
+    assert set(expected) >= {'1', '2u', '2uR', '2d', '2dG', '3u', '3d'}
+
+def test_classify_pairs_edges():
+    # Equal highs/lows do not break the prior bar; NaN bars are unclassified
+    high = [10, 11, 10, 11, 10, np.nan]
+    low = [5, 5, 4, 4, 5, 5]
+    open_ = [6, 6, 9, 9, 9, 6]
+    close = [9, 9, 6, 6, 6, 9]
+    states = decode_candles(classify_pairs(high, low, open_, close, [10] * 6, [5] * 6))
+    assert list(states) == ['1', '2u', '2d', '3d', '1', '?']
+
+def old_ftfc(colors):
+    # calculate_ftfc before the color matrix: missing is neither bull nor bear
+    directions = ['Bull' if c == 1 else '?' if c is None else 'Bear' for c in colors]
+    if all(d == 'Bull' for d in directions): return "Bullish"
+    if all(d == 'Bear' for d in directions): return "Bearish"
+    return "Mixed"
+
+def old_tto(colors):
+    # calculate_tto before the color matrix: blocks of 4, 3 of the same color
+    colors = [0 if c is None else c for c in colors]
+    for i in range(len(colors) - 3):
+        block = colors[i:i + 4]
+        if 0 in block or block[0] != block[-1]: continue
+        if block.count(block[0]) >= 3: return 1
+    return 0
+
+def random_rows(n_tfs, n=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    return [[None if v == 2 else int(v) for v in row] for row in rng.choice([-1, 0, 1, 2], size=(n, n_tfs), p=[0.4, 0.1, 0.4, 0.1])]
+
+def matrix(rows):
+    colors = np.array([[0 if c is None else c for c in row] for row in rows], dtype=np.int8)
+    present = np.array([[c is not None for c in row] for row in rows])
+    return colors, present
+
+def test_ftfc_from_colors_matches_per_ticker_loop():
+    rows = random_rows(len(FTFC_TFS)) + [[1, 1, 1], [-1, 0, -1], [1, 1, None], [-1, -1, None]]
+    colors, present = matrix(rows)
+    assert list(ftfc_from_colors(colors, present)) == [old_ftfc(r) for r in rows]
+
+def test_tto_from_colors_matches_per_ticker_loop():
+    rows = random_rows(len(TFS_ORDER))
+    colors, _ = matrix(rows)
+    tto = tto_from_colors(colors)
+    assert list(tto) == [old_tto(r) for r in rows]
+    assert 0 < tto.sum() < len(rows)
+
+@pytest.mark.parametrize("block, min_same", [(3, 2), (5, 4), (10, 7)])
+def test_tto_block_sizes(block, min_same):
+    rows = random_rows(len(TFS_ORDER), n=500)
+    colors, _ = matrix(rows)
+    expected = []
+    for row in colors.tolist():
+        met = 0
+        for i in range(len(row) - block + 1):
+            window = row[i:i + block]
+            if 0 not in window and window[0] == window[-1] and window.count(window[0]) >= min_same:
+                met = 1
+        expected.append(met)
+    assert list(tto_from_colors(colors, block, min_same)) == expected
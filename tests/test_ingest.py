@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from database import Session, OHLCV, Ticker, OHLCV_TIMEFRAME, ohlcv_query
+from ingest import aggregate_data, aggregate_incremental, save_ohlcv
+
+def stored_bars(symbol):
+    session = Session()
+    try:
+        query = ohlcv_query(
+            session, OHLCV_TIMEFRAME.label('timeframe'), OHLCV.date,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume
+        ).filter(Ticker.symbol == symbol).order_by(OHLCV.timeframe_id, OHLCV.date)
+        return pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+def bars_frame(aggs):
+    frames = []
+    for tf, df in aggs.items():
+        frame = df.rename(columns=str.lower).reset_index(names='date').assign(timeframe=tf)
+        frames.append(frame[['timeframe', 'date', 'open', 'high', 'low', 'close', 'volume']])
+    df = pd.concat(frames, ignore_index=True)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    return df
+
+def assert_same_bars(actual, expected):
+    key = ['timeframe', 'date']
+    actual = actual.assign(date=pd.to_datetime(actual['date']).dt.date).sort_values(key, ignore_index=True)
+    expected = expected.sort_values(key, ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-9)
+
+# Cut points: mid-week, a Friday, a month end, a quarter end, a year end
+@pytest.mark.parametrize("cut", ["2022-06-15", "2022-07-08", "2022-08-31", "2022-09-30", "2022-12-30", "2023-01-02"])
+def test_incremental_matches_full_aggregation(db, daily, cut):
+    cut = pd.Timestamp(cut)
+    save_ohlcv('AAA', aggregate_data(daily[daily.index < cut]))
+
+    # A few days at a time, like hourly/daily runs, restarting from the last stored bar
+    last = daily.index[daily.index < cut][-1]
+    for end in pd.bdate_range(cut, periods=12, freq='3B'):
+        new = daily[(daily.index >= last) & (daily.index <= end)]
+        aggs, replace_from = aggregate_incremental('AAA', new)
+        save_ohlcv('AAA', aggs, replace_from)
+        last = end
+
+    full = aggregate_data(daily[daily.index <= last])
+    assert_same_bars(stored_bars('AAA'), bars_frame(full))
+
+def test_incremental_without_stored_bars(db, daily):
+    assert aggregate_incremental('NEW', daily) is None
@@ -0,0 +1,42 @@
+from datetime import date
+from sqlalchemy import text
+import migrate_schema
+from database import Base, Session, OHLCV, Ticker, OHLCV_TIMEFRAME, engine, ohlcv_query
+
+# ohlcv as created by the original schema: no candle column
+BASELINE_OHLCV = """
+CREATE TABLE ohlcv (
+    id INTEGER PRIMARY KEY,
+    symbol VARCHAR,
+    date DATE,
+    open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume FLOAT,
+    timeframe VARCHAR,
+    CONSTRAINT uix_symbol_date_tf UNIQUE (symbol, date, timeframe)
+)
+"""
+
+def test_migrates_baseline_database():
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS ohlcv"))
+        conn.execute(text(BASELINE_OHLCV))
+        conn.execute(text(
+            "INSERT INTO ohlcv (symbol, date, open, high, low, close, volume, timeframe) VALUES "
+            "('AAA', '2024-01-02', 1, 2, 0.5, 1.5, 100, '1D'), "
+            "('AAA', '2024-01-03', 1.5, 2.5, 1, 2, 200, '1D'), "
+            "('BBB', '2024-01-01', 10, 11, 9, 10.5, 300, '1W')"
+        ))
+
+    migrate_schema.main('AAA')
+
+    session = Session()
+    try:
+        rows = ohlcv_query(session, Ticker.symbol, OHLCV_TIMEFRAME, OHLCV.date, OHLCV.volume, OHLCV.candle) \
+            .order_by(Ticker.symbol, OHLCV.date).all()
+    finally:
+        session.close()
+    assert [tuple(r) for r in rows] == [
+        ('AAA', '1D', date(2024, 1, 2), 100, None),
+        ('AAA', '1D', date(2024, 1, 3), 200, None),
+        ('BBB', '1W', date(2024, 1, 1), 300, None),
+    ]
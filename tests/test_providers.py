@@ -0,0 +1,23 @@
+import pandas as pd
+from providers import CachedProvider, DataProvider
+
+class FrameProvider(DataProvider):
+    """Serves slices of fixed frames, from `start` on."""
+    def __init__(self, frames):
+        self.frames = frames
+
+    def fetch(self, symbols, start=None, period=None, interval="1d"):
+        return {s: self.frames[s][self.frames[s].index >= pd.Timestamp(start)] if start else self.frames[s] for s in symbols}
+
+def test_tail_refresh_keeps_intraday_bars_unique(tmp_path):
+    index = pd.date_range("2024-01-02 09:30", periods=7, freq="h").append(pd.date_range("2024-01-03 09:30", periods=7, freq="h"))
+    bars = pd.DataFrame({"Open": 1.0, "High": 2.0, "Low": 0.5, "Close": 1.5, "Volume": 100.0}, index=index)
+    cache = CachedProvider(FrameProvider({"AAA": bars}), str(tmp_path))
+    # Cached before the last session closed, so the tail from the last cached bar is refetched
+    cache._write("AAA", "60m", bars, None, pd.Timestamp("2024-01-03 12:00", tz="America/New_York"))
+
+    df = cache.fetch(["AAA"], interval="60m")["AAA"]
+
+    assert not df.index.duplicated().any()
+    assert df.index.equals(bars.index)
+    assert df["Volume"].sum() == bars["Volume"].sum()
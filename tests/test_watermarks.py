@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+import pandas as pd
+from database import Session, Alert, ScanWatermark
+from watermarks import changed_tickers, carry_forward_alerts
+
+TODAY = date(2024, 3, 8)
+YESTERDAY = TODAY - timedelta(days=1)
+
+def marks(*rows):
+    return pd.DataFrame(rows, columns=['symbol', 'timeframe', 'last_date', 'input_hash'])
+
+STORED = marks(
+    ('SPY', '1D', YESTERDAY, 's'), ('AAA', '1D', YESTERDAY, 'a'), ('AAA', '1W', YESTERDAY, 'aw'),
+    ('BBB', '1D', YESTERDAY, 'b'),
+)
+
+def test_changed_tickers():
+    current = marks(
+        ('SPY', '1D', YESTERDAY, 's'), ('AAA', '1D', YESTERDAY, 'a'), ('AAA', '1W', YESTERDAY, 'aw2'),
+        ('BBB', '1D', YESTERDAY, 'b'), ('CCC', '1D', YESTERDAY, 'c'),
+    )
+    # AAA: a changed pair, CCC: never scanned, BBB unchanged
+    assert changed_tickers(['AAA', 'BBB', 'CCC'], current, STORED) == ['AAA', 'CCC']
+
+def test_changed_tickers_dropped_pair():
+    current = marks(('SPY', '1D', YESTERDAY, 's'), ('AAA', '1D', YESTERDAY, 'a'), ('BBB', '1D', YESTERDAY, 'b'))
+    assert changed_tickers(['AAA', 'BBB'], current, STORED) == ['AAA']
+
+def test_benchmark_change_rescans_everything():
+    current = STORED.assign(input_hash=STORED['input_hash'].where(STORED['symbol'] != 'SPY', 's2'))
+    assert changed_tickers(['AAA', 'BBB'], current, STORED) == ['AAA', 'BBB']
+
+def add_alerts(session, day, ticker, timeframes):
+    for tf in timeframes:
+        session.add(Alert(date=day, ticker=ticker, type="Inside Bar", timeframe=tf, is_theme=0))
+
+def add_watermark(session, symbol, scanned_at):
+    session.add(ScanWatermark(symbol=symbol, timeframe='1D', last_date=YESTERDAY, input_hash='x', scanned_at=scanned_at))
+
+def test_carry_forward_alerts(db):
+    session = Session()
+    try:
+        for ticker in ('AAA', 'BBB', 'CCC', 'DDD'):
+            add_alerts(session, YESTERDAY, ticker, ['1D', '1W', '60m'])
+        add_watermark(session, 'AAA', YESTERDAY)
+        add_watermark(session, 'BBB', TODAY) # Rescanned today with no alerts
+        add_watermark(session, 'CCC', YESTERDAY)
+        add_watermark(session, 'DDD', YESTERDAY)
+        add_alerts(session, TODAY, 'CCC', ['1D']) # Already has daily alerts today
+        add_alerts(session, TODAY, 'DDD', ['15m']) # Only an intraday scan ran today
+        session.commit()
+    finally:
+        session.close()
+
+    assert carry_forward_alerts(['AAA', 'BBB', 'CCC', 'DDD'], TODAY) == 4
+
+    session = Session()
+    try:
+        today = sorted((a.ticker, a.timeframe) for a in session.query(Alert).filter(Alert.date == TODAY))
+    finally:
+        session.close()
+    assert today == [
+        ('AAA', '1D'), ('AAA', '1W'),
+        ('CCC', '1D'),
+        ('DDD', '15m'), ('DDD', '1D'), ('DDD', '1W'),
+    ]
+    # Nothing left to carry on a second run
+    assert carry_forward_alerts(['AAA', 'BBB', 'CCC', 'DDD'], TODAY) == 0
@@ -0,0 +1,192 @@
+"""
+Higher timeframes derived on demand from stored daily bars.
+
+With DERIVE_TIMEFRAMES=1, ingestion stores only 1D bars in ohlcv and
+engine.load_ohlcv builds 2D through 1Y here, with the same bars
+ingest.aggregate_data would have stored. Derived bars are cached per
+(symbol, timeframe, daily digest) in an LRU cache, the digest being the last
+daily date plus a hash of all the symbol's daily bars, so a symbol is
+re-aggregated after a new daily bar, a rewritten same-day bar or a
+historical correction. With TIMEFRAME_CACHE_DIR set,
+the cache is also persisted as one Parquet file per symbol and shared
+between processes.
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from database import Session, OHLCV, Ticker, OHLCV_TIMEFRAME, TIMEFRAME_IDS, ohlcv_query
+
+DERIVE_TIMEFRAMES = os.getenv("DERIVE_TIMEFRAMES", "0") == "1"
+CACHE_SIZE = int(os.getenv("TIMEFRAME_CACHE_SIZE", "50000")) # (symbol, timeframe) entries
+CACHE_DIR = os.getenv("TIMEFRAME_CACHE_DIR")
+
+HIGHER_TFS = ['2D', '3D', '5D', '1W', '2W', '3W', '1M', '1Q', '1Y']
+N_DAY_TFS = {'2D': 2, '3D': 3, '5D': 5}
+PERIOD_TFS = {'1M': 'M', '1Q': 'Q', '1Y': 'Y'}
+WEEK_TFS = {'1W': 1, '2W': 2, '3W': 3}
+COLUMNS = ['symbol', 'timeframe', 'date', 'open', 'high', 'low', 'close', 'volume']
+
+class LRUCache:
+    __slots__ = ('maxsize', 'entries', 'hits', 'misses')
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+CACHE = LRUCache()
+
+def week_labels(dates, symbols, weeks):
+    """
+    Period-end Friday of each date for (symbol, date)-sorted bars, matching
+    resample('{weeks}W-FRI') over each symbol's full history: periods of
+    `weeks` weeks counted from the first Friday on or after its first bar.
+    """
+    friday = dates + pd.to_timedelta((4 - dates.weekday) % 7, unit='D')
+    if weeks == 1:
+        return friday
+    first = pd.Series(friday).groupby(symbols, sort=False).transform('first').to_numpy()
+    step = np.timedelta64(7 * weeks, 'D')
+    periods = -((first - friday.to_numpy()) // step)
+    return pd.DatetimeIndex(first + periods * step)
+
+def derive_timeframes(daily):
+    """
+    Higher-timeframe bars (load_ohlcv columns but candle, which the engine
+    classifies) from 1D rows of many symbols, sorted by symbol and date.
+    """
+    from ingest import aggregate_trading_days_long
+    dates = pd.DatetimeIndex(pd.to_datetime(daily['date']))
+    symbols = daily['symbol'].to_numpy()
+    rules = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    frames = []
+
+    long = pd.DataFrame({
+        'symbol': symbols, 'Date': dates,
+        'Open': daily['open'].to_numpy(), 'High': daily['high'].to_numpy(), 'Low': daily['low'].to_numpy(),
+        'Close': daily['close'].to_numpy(), 'Volume': daily['volume'].to_numpy(),
+    })
+    for tf, days in N_DAY_TFS.items():
+        bars = aggregate_trading_days_long(long, days)
+        bars.columns = ['symbol', 'date', 'open', 'high', 'low', 'close', 'volume']
+        frames.append(bars.assign(timeframe=tf))
+
+    labels = {tf: week_labels(dates, symbols, weeks) for tf, weeks in WEEK_TFS.items()}
+    labels.update({tf: pd.PeriodIndex(dates, freq=freq).end_time.normalize() for tf, freq in PERIOD_TFS.items()})
+    values = daily[list(rules)].reset_index(drop=True)
+    for tf, label in labels.items():
+        bars = values.groupby([symbols, label], sort=False).agg(rules)
+        bars.index.names = ['symbol', 'date']
+        frames.append(bars.reset_index().assign(timeframe=tf))
+
+    derived = pd.concat(frames, ignore_index=True)
+    derived['date'] = pd.to_datetime(derived['date']).dt.date
+    return derived[COLUMNS]
+
+def daily_digests(daily):
+    """Cache key part per symbol: last daily date and a hash of every daily bar."""
+    values = daily[['date', 'open', 'high', 'low', 'close', 'volume']]
+    rows = pd.util.hash_pandas_object(values, index=False)
+    # Wrapping uint64 sum: order-independent, and dates are part of each row hash
+    hashes = rows.groupby(daily['symbol'].to_numpy(), sort=False).sum()
+    last_dates = daily.groupby('symbol', sort=False)['date'].last()
+    return pd.Series({symbol: f"{last_dates[symbol]}-{int(h):016x}" for symbol, h in hashes.items()})
+
+def _cache_path(symbol, digest):
+    return os.path.join(CACHE_DIR, f"{symbol}@{digest}.parquet")
+
+def _read_persisted(symbol, digest):
+    path = _cache_path(symbol, digest)
+    if not os.path.exists(path): return None
+    bars = pd.read_parquet(path)
+    bars['date'] = pd.to_datetime(bars['date']).dt.date
+    return bars
+
+def _persist(symbol, digest, bars):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    prefix = f"{symbol}@"
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(prefix):
+            os.remove(os.path.join(CACHE_DIR, name))
+    bars.to_parquet(_cache_path(symbol, digest), index=False)
+
+def cached_timeframes(daily):
+    """
+    Higher-timeframe bars for 1D rows of many symbols (sorted by symbol and
+    date), served from the cache where a symbol's daily bars are unchanged.
+    """
+    digests = daily_digests(daily)
+    parts, missing = [], []
+    for symbol, digest in digests.items():
+        cached = [CACHE.get((symbol, tf, digest)) for tf in HIGHER_TFS]
+        if any(bars is None for bars in cached):
+            persisted = _read_persisted(symbol, digest) if CACHE_DIR else None
+            if persisted is None:
+                missing.append(symbol)
+                continue
+            cached = []
+            for tf, bars in persisted.groupby('timeframe', sort=False):
+                CACHE.put((symbol, tf, digest), bars)
+                cached.append(bars)
+        parts.extend(cached)
+
+    if missing:
+        derived = derive_timeframes(daily[daily['symbol'].isin(missing)])
+        for symbol, bars in derived.groupby('symbol', sort=False):
+            digest = digests[symbol]
+            for tf, tf_bars in bars.groupby('timeframe', sort=False):
+                CACHE.put((symbol, tf, digest), tf_bars)
+            if CACHE_DIR:
+                _persist(symbol, digest, bars)
+        parts.append(derived)
+
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+def _load_daily(tickers=None):
+    session = Session()
+    try:
+        query = ohlcv_query(
+            session, Ticker.symbol, OHLCV_TIMEFRAME.label('timeframe'), OHLCV.date,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume, OHLCV.candle
+        ).filter(OHLCV.timeframe_id == TIMEFRAME_IDS['1D'])
+        if tickers is not None:
+            query = query.filter(Ticker.symbol.in_(list(tickers)))
+        query = query.order_by(Ticker.symbol, OHLCV.date)
+        return pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+def load_ohlcv_derived(tickers=None):
+    """engine.load_ohlcv for 1D-only storage: stored daily bars plus derived higher timeframes."""
+    from parquet_store import get_store
+    store = get_store()
+    if store:
+        daily = store.load(tickers, ['1D'])
+    else:
+        daily = _load_daily(tickers)
+    if daily.empty: return daily
+
+    df = pd.concat([daily, cached_timeframes(daily)], ignore_index=True)
+    return df.sort_values(['symbol', 'timeframe', 'date'], kind='stable', ignore_index=True)
@@ -2,9 +2,11 @@
 """
 Update RS (Relative Strength vs SPY) values for existing alerts
 """
-from database import Session, Alert, OHLCV
+from database import Session, Alert
 from datetime import datetime, timedelta
 import pandas as pd
+from metrics import load_ticker_metrics
+from engine import load_ohlcv
 
 def calculate_rs_metrics(ticker_data, spy_data):
     """Calculate relative strength metrics vs SPY as RAW VALUES for percentile ranking"""
@@ -46,8 +48,7 @@ def main():
     try:
         # Get SPY data
         print("Fetching SPY data...")
-        spy_query = session.query(OHLCV).filter_by(symbol='SPY').order_by(OHLCV.date)
-        df_spy_all = pd.read_sql(spy_query.statement, session.bind)
+        df_spy_all = load_ohlcv(['SPY'])
         
         if df_spy_all.empty:
             print("ERROR: No SPY data found!")
@@ -59,18 +60,19 @@ def main():
         alerts = session.query(Alert).filter_by(date=today).all()
         print(f"Found {len(alerts)} alerts to update")
         
+        # perf_3m / avg_dollar_volume come from the incrementally maintained ticker_metrics
+        metrics = load_ticker_metrics({a.ticker for a in alerts})
+        
+        # Bars of every alerted ticker in one read (covers derived higher timeframes)
+        bars = dict(tuple(load_ohlcv({a.ticker for a in alerts}).groupby(['symbol', 'timeframe'], sort=False)))
+        
         updated_count = 0
         
         for alert in alerts:
             # Get ticker data
-            ticker_query = session.query(OHLCV).filter_by(
-                symbol=alert.ticker,
-                timeframe=alert.timeframe
-            ).order_by(OHLCV.date)
+            df_ticker = bars.get((alert.ticker, alert.timeframe))
             
-            df_ticker = pd.read_sql(ticker_query.statement, session.bind)
-            
-            if df_ticker.empty:
+            if df_ticker is None or df_ticker.empty:
                 continue
             
             # Filter SPY  data for same timeframe
@@ -88,15 +90,12 @@ def main():
             alert.rs_1m = rs_metrics.get('rs_1m', 0)
             alert.rs_3m = rs_metrics.get('rs_3m', 0)
             
-            # Also calculate perf_3m and avg_dollar_volume
-            if len(df_ticker) >= 63:
-                perf_3m = ((df_ticker.iloc[-1]['close'] / df_ticker.iloc[-63]['close']) - 1) * 100
-                alert.perf_3m = round(perf_3m, 2)
-            
-            if len(df_ticker) >= 20:
-                recent_volume = df_ticker.tail(20).copy()
-                recent_volume['dollar_vol'] = recent_volume['close'] * recent_volume['volume']
-                alert.avg_dollar_volume = recent_volume['dollar_vol'].mean()
+            if alert.ticker in metrics.index:
+                m = metrics.loc[alert.ticker]
+                if pd.notna(m['perf_3m']):
+                    alert.perf_3m = round(m['perf_3m'], 2)
+                if m['avg_dollar_volume']:
+                    alert.avg_dollar_volume = m['avg_dollar_volume']
             
             updated_count += 1
             
@@ -0,0 +1,140 @@
+"""
+Per-(symbol, timeframe) scan watermarks for incremental rescans.
+
+After a scan, the latest bar date and an input hash of every (symbol,
+timeframe) pair are stored in scan_watermarks. The next run compares them
+with the current OHLCV table and only rescans tickers with a changed pair;
+alerts for the other tickers are carried forward to today.
+
+FTFC, TTO and RS mix timeframes (and SPY) on every alert of a ticker, so the
+rescan unit is the ticker, and a change in SPY's bars rescans everything.
+Closed bars are treated as immutable: the hash covers the latest bar and the
+bar count, not the whole history.
+"""
+import pandas as pd
+from sqlalchemy import func, insert, select, and_, literal, Date
+from database import Session, OHLCV, Ticker, OHLCV_TIMEFRAME, Alert, ScanWatermark, ohlcv_query
+from engine import TFS_ORDER
+
+BENCHMARK = 'SPY'
+
+def current_watermarks(tickers=None):
+    """Latest bar and input hash of every (symbol, timeframe) pair, in one query."""
+    session = Session()
+    try:
+        latest = ohlcv_query(
+            session,
+            OHLCV.ticker_id.label('ticker_id'),
+            OHLCV.timeframe_id.label('timeframe_id'),
+            func.max(OHLCV.date).label('last_date'),
+            func.count().label('bars'),
+        ).group_by(OHLCV.ticker_id, OHLCV.timeframe_id)
+        if tickers is not None:
+            latest = latest.filter(Ticker.symbol.in_(list(tickers)))
+        latest = latest.subquery()
+
+        query = ohlcv_query(
+            session, Ticker.symbol, OHLCV_TIMEFRAME.label('timeframe'), latest.c.last_date, latest.c.bars,
+            OHLCV.open, OHLCV.high, OHLCV.low, OHLCV.close, OHLCV.volume
+        ).join(latest, and_(
+            OHLCV.ticker_id == latest.c.ticker_id,
+            OHLCV.timeframe_id == latest.c.timeframe_id,
+            OHLCV.date == latest.c.last_date,
+        ))
+        df = pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+    if df.empty:
+        return pd.DataFrame(columns=['symbol', 'timeframe', 'last_date', 'input_hash'])
+
+    df['last_date'] = pd.to_datetime(df['last_date']).dt.date
+    hashed = df[['last_date', 'bars', 'open', 'high', 'low', 'close', 'volume']].astype(str)
+    df['input_hash'] = pd.util.hash_pandas_object(hashed, index=False).astype(str)
+    return df[['symbol', 'timeframe', 'last_date', 'input_hash']]
+
+def stored_watermarks():
+    session = Session()
+    try:
+        query = session.query(
+            ScanWatermark.symbol, ScanWatermark.timeframe, ScanWatermark.last_date, ScanWatermark.input_hash
+        )
+        return pd.read_sql(query.statement, session.bind)
+    finally:
+        session.close()
+
+def changed_tickers(tickers, current, stored):
+    """Tickers whose pairs differ from the stored watermarks (all of them if SPY changed)."""
+    merged = current.merge(stored, on=['symbol', 'timeframe'], how='outer', suffixes=('', '_stored'), indicator=True)
+    differs = (merged['_merge'] != 'both') | (merged['input_hash'] != merged['input_hash_stored'])
+    changed = set(merged.loc[differs, 'symbol'])
+
+    if BENCHMARK in changed:
+        return list(tickers)
+    # Tickers never scanned before have no watermark at all
+    never_scanned = set(tickers) - set(stored['symbol'])
+    return [t for t in tickers if t in changed or t in never_scanned]
+
+def save_watermarks(current, tickers, scanned_at, benchmark=True):
+    """
+    Replace the watermarks of the scanned tickers and the benchmark. With
+    benchmark=False (some tickers failed) the benchmark keeps its old
+    watermark, so a benchmark change still rescans everything next run.
+    """
+    symbols = set(tickers) | {BENCHMARK} if benchmark else set(tickers) - {BENCHMARK}
+    rows = current[current['symbol'].isin(symbols)]
+    session = Session()
+    try:
+        session.query(ScanWatermark).filter(ScanWatermark.symbol.in_(list(symbols))).delete(synchronize_session=False)
+        if not rows.empty:
+            session.execute(insert(ScanWatermark), [
+                {"symbol": r.symbol, "timeframe": r.timeframe, "last_date": r.last_date,
+                 "input_hash": r.input_hash, "scanned_at": scanned_at}
+                for r in rows.itertuples(index=False)
+            ])
+        session.commit()
+    except Exception as e:
+        print(f"Error saving scan watermarks: {e}")
+        session.rollback()
+    finally:
+        session.close()
+
+def carry_forward_alerts(tickers, today, timeframes=TFS_ORDER):
+    """
+    Copy the most recent daily-scan alerts (`timeframes`) of unchanged
+    tickers to today, for tickers last scanned before today that have no
+    such alerts dated today yet (a ticker rescanned today with no alerts
+    stays without). Intraday alerts are never carried. Returns the number
+    of rows copied.
+    """
+    if not tickers: return 0
+    timeframes = list(timeframes)
+    session = Session()
+    try:
+        prev_date = session.query(func.max(Alert.date)).filter(
+            Alert.date < today, Alert.timeframe.in_(timeframes)
+        ).scalar()
+        if prev_date is None: return 0
+
+        scanned_today = {t for (t,) in session.query(ScanWatermark.symbol).filter(ScanWatermark.scanned_at >= today).distinct()}
+        already = {t for (t,) in session.query(Alert.ticker).filter(
+            Alert.date == today, Alert.timeframe.in_(timeframes)
+        ).distinct()}
+        to_copy = [t for t in tickers if t not in already and t not in scanned_today]
+        if not to_copy: return 0
+
+        columns = [c for c in Alert.__table__.columns if c.name not in ('id', 'date')]
+        source = select(literal(today, type_=Date).label('date'), *columns).where(
+            Alert.date == prev_date, Alert.ticker.in_(to_copy), Alert.timeframe.in_(timeframes)
+        )
+        result = session.execute(
+            insert(Alert).from_select(['date'] + [c.name for c in columns], source)
+        )
+        session.commit()
+        return result.rowcount
+    except Exception as e:
+        print(f"Error carrying alerts forward: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()